@@ -3,6 +3,9 @@ import os
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session, current_app
 from databases.manager import db_manager
 from databases.models import ScheduledTask, TaskTypeDefinition
+from utils.job_scheduler import validate_task_schedule
+from utils.adaptive_polling import OUTAGES_SOURCE
+from utils.delivery_priority import DELIVERY_IMMEDIATE, DELIVERY_MODES
 from decorators import login_required
 from security import security_manager, csrf_protect
 import json
@@ -21,18 +24,6 @@ logger = logging.getLogger(__name__)
 # Создаем Blueprint для админки
 admin_bp = Blueprint('admin', __name__)
 
-# Файл-флаг для обновления задач планировщика
-REFRESH_FLAG_FILE = "scheduler_refresh.flag"
-
-def create_refresh_flag():
-    """Создает файл-флаг для обновления задач планировщика"""
-    try:
-        with open(REFRESH_FLAG_FILE, 'w') as f:
-            f.write("refresh")
-        logger.info("Файл-флаг обновления задач планировщика создан")
-    except Exception as e:
-        logger.error(f"Ошибка при создании файла-флага: {e}")
-
 # Маршрут для входа в систему
 @admin_bp.route('/login', methods=['GET', 'POST'])
 def login():
@@ -101,6 +92,13 @@ def duplicate_prevention():
     """Страница информации о системе предотвращения дубликатов"""
     return render_template('duplicate_prevention.html')
 
+# Маршрут для страницы запусков задач
+@admin_bp.route('/task_runs')
+@login_required
+def task_runs():
+    """Страница длительности запусков задач"""
+    return render_template('task_runs.html')
+
 # Маршрут для страницы уведомлений
 @admin_bp.route('/notifications')
 @login_required
@@ -220,6 +218,7 @@ def api_get_groups():
                 'name': group.name,
                 'addresses': addresses,
                 'is_active': group.is_active,
+                'delivery_mode': group.delivery_mode or DELIVERY_IMMEDIATE,
                 'created_at': group.created_at.isoformat() if group.created_at else None
             })
         logger.info(f"Успешно получено {len(groups_data)} групп")
@@ -238,16 +237,16 @@ def api_add_group():
         group_id = data.get('group_id')
         name = data.get('name')
         addresses = data.get('addresses', [])
+        delivery_mode = data.get('delivery_mode')
         
         if not group_id or not name:
             logger.warning("Попытка добавить группу без обязательных полей")
             return jsonify({'error': 'group_id and name are required'}), 400
+        if delivery_mode is not None and delivery_mode not in DELIVERY_MODES:
+            return jsonify({'error': f"delivery_mode must be one of: {', '.join(DELIVERY_MODES)}"}), 400
         
         logger.info(f"Добавление новой группы: {name} ({group_id})")
-        group = db_manager.add_group(group_id, name, addresses)
-        
-        # Создаем файл-флаг для обновления задач в планировщике
-        create_refresh_flag()
+        group = db_manager.add_group(group_id, name, addresses, delivery_mode)
         
         result = {
             'id': group.id,
@@ -255,6 +254,7 @@ def api_add_group():
             'name': group.name,
             'addresses': addresses,
             'is_active': group.is_active,
+            'delivery_mode': group.delivery_mode or DELIVERY_IMMEDIATE,
             'created_at': group.created_at.isoformat() if group.created_at else None
         }
         logger.info(f"Группа успешно добавлена: {name}")
@@ -275,17 +275,18 @@ def api_update_group(group_id):
         data = request.get_json()
         name = data.get('name')
         addresses = data.get('addresses', [])
+        delivery_mode = data.get('delivery_mode')
         
         if not name:
             logger.warning("Попытка обновить группу без обязательных полей")
             return jsonify({'error': 'name is required'}), 400
+        if delivery_mode is not None and delivery_mode not in DELIVERY_MODES:
+            return jsonify({'error': f"delivery_mode must be one of: {', '.join(DELIVERY_MODES)}"}), 400
         
         logger.info(f"Обновление группы с ID: {group_id}")
         # Используем контекстный менеджер для работы с сессией
-        result = db_manager.update_group(group_id, name, addresses)
+        result = db_manager.update_group(group_id, name, addresses, delivery_mode)
         if result:
-            # Создаем файл-флаг для обновления задач в планировщике
-            create_refresh_flag()
             logger.info(f"Группа с ID {group_id} успешно обновлена")
             return jsonify(result)
         else:
@@ -305,8 +306,6 @@ def api_delete_group(group_id):
         # Используем контекстный менеджер для работы с сессией
         result = db_manager.deactivate_group(group_id)
         if result:
-            # Создаем файл-флаг для обновления задач в планировщике
-            create_refresh_flag()
             logger.info(f"Группа с ID {group_id} помечена как неактивная")
             return jsonify({'message': 'Group deactivated successfully'})
         else:
@@ -329,12 +328,18 @@ def api_get_scheduled_tasks():
     """API для получения списка запланированных задач"""
     try:
         tasks_data = db_manager.get_active_scheduled_tasks()
+        # Текущий интервал адаптивного опроса и причина его выбора
+        poll_state = db_manager.get_source_state(OUTAGES_SOURCE)
         result = []
         for task_data in tasks_data:
             # Форматируем даты для JSON
             formatted_task = task_data.copy()
             formatted_task['last_run'] = task_data['last_run'].isoformat() if task_data['last_run'] else None
             formatted_task['created_at'] = task_data['created_at'].isoformat() if task_data['created_at'] else None
+            if task_data['interval_type'] == 'adaptive' and poll_state:
+                formatted_task['poll_interval_seconds'] = poll_state['interval_seconds']
+                formatted_task['poll_interval_reason'] = poll_state['interval_reason']
+                formatted_task['poll_change_rate'] = poll_state['change_rate']
             result.append(formatted_task)
         return jsonify(result)
     except Exception as e:
@@ -353,12 +358,30 @@ def api_add_scheduled_task():
         interval_type = data.get('interval_type')
         interval_value = data.get('interval_value')
         time_of_day = data.get('time_of_day')
+        cron_expression = data.get('cron_expression') or None
+        overlap_policy = data.get('overlap_policy') or None
+        timeout_seconds = data.get('timeout_seconds')
+        if timeout_seconds == '':
+            timeout_seconds = None
         group_ids = data.get('group_ids', [])
         
+        # Для cron-расписания значение интервала не используется
+        if interval_type == 'cron' and not interval_value:
+            interval_value = 1
+        
         if not name or not task_type_names or not interval_type or not interval_value:
             logger.warning("Попытка добавить задачу без обязательных полей")
             return jsonify({'error': 'name, task_types, interval_type and interval_value are required'}), 400
         
+        try:
+            validate_task_schedule(interval_type, interval_value, time_of_day, cron_expression,
+                                   overlap_policy, timeout_seconds)
+            if timeout_seconds is not None:
+                timeout_seconds = int(timeout_seconds)
+        except ValueError as e:
+            logger.warning(f"Некорректное расписание задачи {name}: {e}")
+            return jsonify({'error': str(e)}), 400
+        
         logger.info(f"Добавление новой задачи: {name}")
         task_data = db_manager.add_scheduled_task(
             name=name,
@@ -366,12 +389,12 @@ def api_add_scheduled_task():
             interval_type=interval_type,
             interval_value=interval_value,
             time_of_day=time_of_day,
-            group_ids=group_ids
+            group_ids=group_ids,
+            cron_expression=cron_expression,
+            overlap_policy=overlap_policy,
+            timeout_seconds=timeout_seconds
         )
         
-        # Создаем файл-флаг для обновления задач в планировщике
-        create_refresh_flag()
-        
         # Форматируем даты для JSON
         result = task_data.copy()
         result['last_run'] = task_data['last_run'].isoformat() if task_data['last_run'] else None
@@ -393,8 +416,6 @@ def api_delete_scheduled_task(task_id):
         # Используем контекстный менеджер для работы с сессией
         result = db_manager.deactivate_scheduled_task(task_id)
         if result:
-            # Создаем файл-флаг для обновления задач в планировщике
-            create_refresh_flag()
             logger.info(f"Задача с ID {task_id} помечена как неактивная")
             return jsonify({'message': 'Task deactivated successfully'})
         else:
@@ -441,11 +462,29 @@ def api_update_scheduled_task(task_id):
         interval_type = data.get('interval_type')
         interval_value = data.get('interval_value')
         time_of_day = data.get('time_of_day')
+        cron_expression = data.get('cron_expression') or None
+        overlap_policy = data.get('overlap_policy') or None
+        timeout_seconds = data.get('timeout_seconds')
+        if timeout_seconds == '':
+            timeout_seconds = None
+        
+        # Для cron-расписания значение интервала не используется
+        if interval_type == 'cron' and not interval_value:
+            interval_value = 1
         
         if not name or not task_type_names or not interval_type or not interval_value:
             logger.warning("Попытка обновить задачу без обязательных полей")
             return jsonify({'error': 'name, task_types, interval_type and interval_value are required'}), 400
         
+        try:
+            validate_task_schedule(interval_type, interval_value, time_of_day, cron_expression,
+                                   overlap_policy, timeout_seconds)
+            if timeout_seconds is not None:
+                timeout_seconds = int(timeout_seconds)
+        except ValueError as e:
+            logger.warning(f"Некорректное расписание задачи {name}: {e}")
+            return jsonify({'error': str(e)}), 400
+        
         logger.info(f"Обновление задачи с ID: {task_id}")
         # Используем контекстный менеджер для работы с сессией
         result = db_manager.update_scheduled_task(
@@ -454,11 +493,12 @@ def api_update_scheduled_task(task_id):
             task_type_names=task_type_names,
             interval_type=interval_type,
             interval_value=interval_value,
-            time_of_day=time_of_day
+            time_of_day=time_of_day,
+            cron_expression=cron_expression,
+            overlap_policy=overlap_policy,
+            timeout_seconds=timeout_seconds
         )
         if result:
-            # Создаем файл-флаг для обновления задач в планировщике
-            create_refresh_flag()
             logger.info(f"Задача с ID {task_id} успешно обновлена")
             return jsonify(result)
         else:
@@ -535,7 +575,8 @@ def api_get_notification(notification_id):
                 'group_id': notification.group_id,
                 'message': notification.message,
                 'sent_at': notification.sent_at.isoformat() if notification.sent_at else None,
-                'is_duplicate': notification.is_duplicate
+                'is_duplicate': notification.is_duplicate,
+                'match_details': json.loads(notification.match_details) if notification.match_details else []
             }
             logger.info(f"Уведомление с ID {notification_id} успешно получено")
             return jsonify(result)
@@ -563,9 +604,6 @@ def api_add_group_from_telegram():
         logger.info(f"Добавление новой группы через Telegram: {name} ({group_id})")
         group = db_manager.add_group(group_id, name, addresses)
         
-        # Создаем файл-флаг для обновления задач в планировщике
-        create_refresh_flag()
-        
         result = {
             'id': group.id,
             'group_id': group.group_id,
@@ -719,6 +757,35 @@ def api_get_duplicate_stats():
         logger.error(f"Ошибка при получении статистики по дубликатам: {e}")
         return jsonify({'error': str(e)}), 500
 
+@admin_bp.route('/api/task_runs/stats')
+@login_required
+def api_get_task_run_stats():
+    """API для получения перцентилей длительности запусков задач и их этапов"""
+    try:
+        stats = db_manager.get_task_run_stats()
+        for task_stats in stats:
+            task_stats['last_run_at'] = task_stats['last_run_at'].isoformat() if task_stats['last_run_at'] else None
+        return jsonify(stats)
+    except Exception as e:
+        logger.error(f"Ошибка при получении статистики запусков задач: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/api/task_runs/slowest')
+@login_required
+def api_get_slowest_task_runs():
+    """API для получения самых долгих запусков задач"""
+    try:
+        limit = request.args.get('limit', 20, type=int)
+        task_id = request.args.get('task_id', type=int)
+        runs = db_manager.get_slowest_task_runs(limit, task_id)
+        for run in runs:
+            run['started_at'] = run['started_at'].isoformat() if run['started_at'] else None
+            run['finished_at'] = run['finished_at'].isoformat() if run['finished_at'] else None
+        return jsonify(runs)
+    except Exception as e:
+        logger.error(f"Ошибка при получении самых долгих запусков задач: {e}")
+        return jsonify({'error': str(e)}), 500
+
 # Контекстный процессор для передачи CSRF токена в шаблоны
 @admin_bp.context_processor
 def inject_csrf_token():
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк сопоставления адресов групп и отключений на синтетических данных.
+
+Замеряет полный путь подготовки сообщений без Telegram, сети и базы
+данных (настройки бота, TELEGRAM_TOKEN и DATABASE_URL, не нужны):
+- legacy: _filter_outages_by_group_addresses + _format_outages_message
+  (внутри вызывает _find_matched_address) для каждой группы;
+- index: AddressMatcher.match_outages + _format_outages_message
+  с уже найденными адресами.
+
+Для каждого набора (группы x отключения) выводит время, число совпадений
+в секунду и пиковую память (tracemalloc, отдельным прогоном). Результаты
+можно сохранить как базовую линию и сравнивать с ней последующие
+изменения сопоставления. Базовая линия benchmarks/baseline.json снята
+командой из примера с --save на Linux x86_64 с одним ядром (Python
+3.11); в файле записаны машина, команда, размеры наборов и параметры
+данных. Время сравнимо только с прогоном на похожей машине.
+
+Примеры:
+    python benchmarks/bench_matching.py
+    python benchmarks/bench_matching.py --groups 100 1000 50000 --outages 10 500 5000
+    python benchmarks/bench_matching.py --groups 100 1000 --outages 10 100 --save benchmarks/baseline.json
+    python benchmarks/bench_matching.py --compare benchmarks/baseline.json
+"""
+import sys
+import os
+import gc
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+import tracemalloc
+from types import SimpleNamespace
+
+# Добавляем путь к проекту
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.outage_formatter import OutageFormatter
+from utils.address_matcher import AddressMatcher
+
+# Наборы по умолчанию: (число групп, число отключений)
+DEFAULT_GROUPS = [100, 1000, 10000, 50000]
+DEFAULT_OUTAGES = [10, 100, 1000, 5000]
+
+# Старый путь перебирает все пары адресов, поэтому большие наборы пропускаются
+DEFAULT_MAX_LEGACY_PAIRS = 2 * 10 ** 6
+
+STREET_NAMES = [
+    'Ленина', 'Мира', 'Советская', 'Гагарина', 'Пушкина', 'Лермонтова', 'Кирова', 'Чкалова',
+    'Садовая', 'Лесная', 'Школьная', 'Молодёжная', 'Набережная', 'Заводская', 'Полевая',
+    'Строителей', 'Победы', 'Октябрьская', 'Первомайская', 'Комсомольская', 'Чехова',
+    'Толстого', 'Горького', 'Маяковского', 'Суворова', 'Кутузова', 'Жукова', 'Калинина',
+    'Фрунзе', 'Дзержинского', 'Свердлова', 'Энгельса', 'Рабочая', 'Зелёная', 'Солнечная',
+]
+STREET_TYPES = ['ул.', 'улица', 'пр-т', 'проспект', 'пер.', 'бульвар']
+DISTRICTS = ['Центральный', 'Ленинский', 'Кировский', 'Октябрьский', 'Советский']
+RESOURCES = ['Электроснабжение', 'Холодное водоснабжение', 'Горячее водоснабжение', 'Отопление']
+
+
+def _street_pool(size, rng):
+    """Список названий улиц: базовые названия с номерами для большого числа улиц"""
+    pool = []
+    for i in range(size):
+        name = STREET_NAMES[i % len(STREET_NAMES)]
+        suffix = i // len(STREET_NAMES)
+        pool.append(f"{name} {suffix}-я" if suffix else name)
+    rng.shuffle(pool)
+    return pool
+
+
+def _house_token(rng):
+    """Запись о домах в формате источника: номер, литера, диапазон или сторона улицы"""
+    kind = rng.random()
+    start = rng.randint(1, 120)
+    if kind < 0.5:
+        return str(start)
+    if kind < 0.65:
+        return f"{start}{rng.choice('абв')}"
+    if kind < 0.9:
+        return f"{start}-{start + rng.randint(2, 40)}"
+    return rng.choice(['чётная сторона', 'нечётная сторона', f"{start}-{start + 30} нечет"])
+
+
+def make_outages(count, streets, streets_per_outage, rng):
+    """Синтетические отключения с несколькими улицами и домами"""
+    outages = []
+    for outage_id in range(1, count + 1):
+        addresses = []
+        for street in rng.sample(streets, min(len(streets), rng.randint(1, streets_per_outage))):
+            houses = [_house_token(rng) for _ in range(rng.randint(0, 8))]
+            addresses.append({'street': street, 'houses': houses})
+        outages.append(SimpleNamespace(
+            id=outage_id,
+            district=rng.choice(DISTRICTS),
+            resource=rng.choice(RESOURCES),
+            organization='ООО "Энергосбыт"',
+            phone='8 (800) 000-00-00',
+            addresses=json.dumps(addresses, ensure_ascii=False),
+            reason='Плановые работы',
+            start_time='01.01.2024 09:00',
+            end_time='01.01.2024 17:00',
+        ))
+    return outages
+
+
+def make_groups(count, streets, max_addresses, rng):
+    """Синтетические группы с 1..max_addresses адресами в разных написаниях"""
+    groups = []
+    for group_id in range(1, count + 1):
+        addresses = []
+        for _ in range(rng.randint(1, max_addresses)):
+            street = rng.choice(streets)
+            form = rng.random()
+            if form < 0.4:
+                address = f"{rng.choice(STREET_TYPES)} {street} {rng.randint(1, 120)}"
+            elif form < 0.7:
+                address = f"{street} {rng.randint(1, 120)}"
+            elif form < 0.9:
+                address = street
+            else:
+                address = f"{street} {rng.randint(1, 120)}{rng.choice('абв')}"
+            addresses.append(address.lower())
+        groups.append(SimpleNamespace(
+            id=group_id,
+            name=f"Группа {group_id}",
+            group_id=str(-100000000000 - group_id),
+            addresses=json.dumps(addresses, ensure_ascii=False),
+            street_ids=None,
+        ))
+    return groups
+
+
+def _make_formatter():
+    """Форматирование сообщений планировщика без бота и базы данных"""
+    return OutageFormatter()
+
+
+def run_legacy(formatter, groups, outages):
+    """Старый путь: попарная фильтрация и поиск совпавшего адреса для каждой группы"""
+    matches = 0
+    for group in groups:
+        group_outages = formatter._filter_outages_by_group_addresses(outages, group)
+        if group_outages:
+            matches += len(group_outages)
+            formatter._format_outages_message(group_outages, group)
+    return matches
+
+
+def run_index(formatter, groups, outages):
+    """Путь через индекс адресов групп"""
+    matches = 0
+    matcher = AddressMatcher(groups)
+    for group_index, group_matches in matcher.match_outages(outages).items():
+        group = matcher.groups[group_index]
+        group_outages = [match.outage for match in group_matches]
+        matched_addresses = {
+            match.outage.id: match.address
+            for match in group_matches
+            if match.address is not None
+        }
+        matches += len(group_outages)
+        formatter._format_outages_message(group_outages, group, matched_addresses)
+    return matches
+
+
+def measure(engine, formatter, groups, outages, with_memory=True):
+    """Замер времени и пиковой памяти (память - отдельным прогоном, tracemalloc замедляет код)"""
+    gc.collect()
+    started = time.perf_counter()
+    matches = engine(formatter, groups, outages)
+    elapsed = time.perf_counter() - started
+
+    peak = 0
+    if with_memory:
+        gc.collect()
+        tracemalloc.start()
+        engine(formatter, groups, outages)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {
+        'seconds': round(elapsed, 4),
+        'matches': matches,
+        'matches_per_sec': round(matches / elapsed, 1) if elapsed > 0 else 0.0,
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+
+def run_benchmark(args):
+    """Прогон всех наборов и сбор результатов"""
+    rng = random.Random(args.seed)
+    streets = _street_pool(args.streets, rng)
+    formatter = _make_formatter()
+    engines = {'legacy': run_legacy, 'index': run_index}
+
+    results = []
+    for outages_count in args.outages:
+        outages = make_outages(outages_count, streets, args.streets_per_outage, rng)
+        for groups_count in args.groups:
+            groups = make_groups(groups_count, streets, args.max_addresses, rng)
+            for engine_name in args.engines:
+                # Оценка числа сравнений адресов для старого пути
+                pairs = groups_count * outages_count * args.max_addresses * args.streets_per_outage // 4
+                if engine_name == 'legacy' and pairs > args.max_legacy_pairs:
+                    print(f"{engine_name:>6} groups={groups_count:<6} outages={outages_count:<5} пропущено (~{pairs} сравнений)")
+                    continue
+                result = measure(engines[engine_name], formatter, groups, outages, not args.skip_memory)
+                result.update({'engine': engine_name, 'groups': groups_count, 'outages': outages_count})
+                results.append(result)
+                print(
+                    f"{engine_name:>6} groups={groups_count:<6} outages={outages_count:<5} "
+                    f"time={result['seconds']:>9.4f}s matches={result['matches']:<8} "
+                    f"matches/s={result['matches_per_sec']:>12.1f} peak={result['peak_memory_kb']:>10.1f}KB"
+                )
+    return results
+
+
+def _result_key(result):
+    return result['engine'], result['groups'], result['outages']
+
+
+def compare_with_baseline(results, path):
+    """Сравнение результатов с сохранённой базовой линией"""
+    with open(path, encoding='utf-8') as f:
+        baseline = {_result_key(result): result for result in json.load(f)['results']}
+
+    print(f"\nСравнение с базовой линией {path}:")
+    for result in results:
+        base = baseline.get(_result_key(result))
+        if not base or not result['seconds']:
+            continue
+        speedup = base['seconds'] / result['seconds']
+        memory = result['peak_memory_kb'] - base['peak_memory_kb']
+        print(
+            f"{result['engine']:>6} groups={result['groups']:<6} outages={result['outages']:<5} "
+            f"ускорение x{speedup:.2f} память {memory:+.1f}KB"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк сопоставления адресов групп и отключений')
+    parser.add_argument('--groups', type=int, nargs='+', default=DEFAULT_GROUPS, help='Число групп')
+    parser.add_argument('--outages', type=int, nargs='+', default=DEFAULT_OUTAGES, help='Число отключений')
+    parser.add_argument('--max-addresses', type=int, default=20, help='Максимум адресов у группы')
+    parser.add_argument('--streets', type=int, default=2000, help='Число различных улиц')
+    parser.add_argument('--streets-per-outage', type=int, default=15, help='Максимум улиц в отключении')
+    parser.add_argument('--engines', nargs='+', choices=['legacy', 'index'], default=['legacy', 'index'])
+    parser.add_argument('--max-legacy-pairs', type=int, default=DEFAULT_MAX_LEGACY_PAIRS,
+                        help='Пропускать старый путь для наборов с большим числом сравнений')
+    parser.add_argument('--skip-memory', action='store_true', help='Не замерять память (вдвое быстрее)')
+    parser.add_argument('--seed', type=int, default=42, help='Зерно генератора данных')
+    parser.add_argument('--save', help='Сохранить результаты в JSON как базовую линию')
+    parser.add_argument('--compare', help='Сравнить с базовой линией из JSON')
+    args = parser.parse_args()
+
+    # Логи планировщика по каждой группе исказили бы замеры
+    logging.disable(logging.INFO)
+
+    results = run_benchmark(args)
+
+    if args.compare:
+        compare_with_baseline(results, args.compare)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({
+                'created_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'python': sys.version.split()[0],
+                # Машина, на которой снята базовая линия: время сравнимо только на похожей
+                'machine': {
+                    'platform': platform.platform(),
+                    'processor': platform.processor() or platform.machine(),
+                    'cpu_count': os.cpu_count(),
+                },
+                'command': ' '.join(['python', 'benchmarks/bench_matching.py'] + sys.argv[1:]),
+                'params': {
+                    'groups': args.groups,
+                    'outages': args.outages,
+                    'max_addresses': args.max_addresses,
+                    'streets': args.streets,
+                    'streets_per_outage': args.streets_per_outage,
+                    'seed': args.seed,
+                },
+                'results': results,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"\nРезультаты сохранены в {args.save}")
+
+
+if __name__ == '__main__':
+    main()
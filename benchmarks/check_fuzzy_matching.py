@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Проверка нечёткого сопоставления улиц на известных примерах.
+
+Опечатки в названии улицы должны совпадать с правильным написанием, а
+разные улицы с общим корнем (другой тип улицы или род окончания) - нет.
+Выводит похожесть каждой пары и завершается с кодом 1, если хотя бы
+один пример сопоставлен не так, как ожидается.
+
+Пример:
+    python benchmarks/check_fuzzy_matching.py
+"""
+import sys
+import os
+
+# Добавляем путь к проекту
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data.config import FUZZY_MATCH_THRESHOLD
+from utils.address_matcher import explain_address_match
+from utils.street_index import street_fuzzy_key, similarity
+
+# (адрес группы, улица отключения, дом отключения, должны ли совпасть)
+CASES = [
+    # Опечатки - одна и та же улица
+    ('ул. Ленина 10', 'ул. Ленена', '10', True),
+    ('ул. Гагарина 5', 'ул. Гагрина', '5', True),
+    ('ул. Советская 3', 'ул. Совецкая', '3', True),
+    ('ул. Маршала Жукова 7', 'ул. Жукова Маршала', '7', True),
+    # Разные улицы с общим корнем
+    ('ул. Пушкина 10', 'ул. Пушкинская', '10', False),
+    ('ул. Садовая 4', 'пер. Садовый', '4', False),
+    ('ул. Лесная 10', 'ул. Лесной', '10', False),
+]
+
+
+def main():
+    failed = 0
+    for group_address, outage_street, house, expected in CASES:
+        score = similarity(street_fuzzy_key(group_address), street_fuzzy_key(outage_street))
+        explanation = explain_address_match(group_address, {'street': outage_street, 'houses': [house]})
+        matched = explanation is not None
+        status = "ok" if matched == expected else "ОШИБКА"
+        if matched != expected:
+            failed += 1
+        print(f"{status:6} {group_address!r:24} ~ {outage_street!r:22} похожесть={score:.3f} "
+              f"совпадение={'да' if matched else 'нет'} (ожидалось {'да' if expected else 'нет'})")
+    print(f"\nПорог {FUZZY_MATCH_THRESHOLD}: {len(CASES) - failed} из {len(CASES)} примеров верно")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
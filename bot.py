@@ -1,15 +1,20 @@
 import asyncio
 import logging
-import threading
-import os
 from aiogram import Bot, Dispatcher, types
 from aiogram.utils import executor
 from aiogram.utils.exceptions import Unauthorized, NetworkError, RetryAfter, TelegramAPIError
-from data.config import TELEGRAM_TOKEN
+from data.config import (
+    TELEGRAM_TOKEN, OUTBOX_DRAIN_INTERVAL_SECONDS, LEADER_HEARTBEAT_SECONDS, REMINDER_CHECK_INTERVAL_SECONDS,
+    DIGEST_CHECK_INTERVAL_SECONDS
+)
 from handlers import register_handlers
 from utils.scheduler import scheduler
-import schedule
-import time
+from utils.job_scheduler import HeapScheduler, first_run_time, next_run_time
+from utils.task_runner import TaskRunner
+from utils.leader_election import LeaderElector
+from utils.outage_snapshot import outage_snapshot, SNAPSHOT_VERSION_CHECK_SECONDS
+from databases.lease_manager import SCHEDULER_LEASE
+from datetime import datetime
 
 # Настройка логирования
 logging.basicConfig(
@@ -26,34 +31,216 @@ logger = logging.getLogger(__name__)
 bot = Bot(token=TELEGRAM_TOKEN)
 dp = Dispatcher(bot)
 
-# Флаг для контроля работы шедулера
-scheduler_running = True
+# Планировщик заданий на куче времён запуска
+job_scheduler = HeapScheduler()
 
-# Файл-флаг для обновления задач
-REFRESH_FLAG_FILE = "scheduler_refresh.flag"
+# Фоновая задача цикла планировщика и запуск заданий с защитой от наложения запусков
+scheduler_loop_task = None
+task_runner = TaskRunner()
 
-def check_refresh_flag():
-    """Проверяет наличие файла-флага и удаляет его"""
-    if os.path.exists(REFRESH_FLAG_FILE):
-        try:
-            os.remove(REFRESH_FLAG_FILE)
-            logger.info("Файл-флаг обновления задач обнаружен и удален")
-            return True
-        except Exception as e:
-            logger.error(f"Ошибка при удалении файла-флага: {e}")
-    return False
+# Сколько секунд ждать завершения выполняющихся заданий при остановке бота
+SHUTDOWN_TIMEOUT = 30
+
+# Общая сессия бота для обработчиков и планировщика
+scheduler.set_bot(bot)
+
+# Выбор лидера: задачи и очередь отправки выполняет только один из запущенных процессов бота
+leader = LeaderElector(SCHEDULER_LEASE)
+scheduler.set_leader(leader)
+
+# Интервал проверки изменений задач в базе данных (в секундах)
+TASK_CHANGES_CHECK_INTERVAL_SECONDS = 1
+
+# Поля задачи, изменение которых меняет её расписание
+SCHEDULE_FIELDS = ('interval_type', 'interval_value', 'time_of_day', 'cron_expression')
+
+# Запланированные задачи (по ID) и последняя применённая запись журнала изменений задач
+scheduled_tasks = {}
+last_task_change_id = 0
 
 def clear_schedule():
     """Очищает все запланированные задачи"""
-    schedule.clear()
+    job_scheduler.clear()
+    scheduled_tasks.clear()
     logger.info("Все запланированные задачи очищены")
 
-def load_scheduled_tasks():
-    """Загружает задачи из базы данных"""
+def stop_leader_jobs():
+    """Снимает с расписания задания лидера (задачи, очередь отправки, напоминания, сводки, проверку изменений задач)"""
+    for key in ['outbox', 'reminders', 'digests', 'task-changes'] + [f"task-{task_id}" for task_id in scheduled_tasks]:
+        job_scheduler.remove_job(key)
+    scheduled_tasks.clear()
+    scheduler.reset_reminders()
+    logger.info("Задания лидера сняты с расписания")
+
+async def leader_heartbeat():
+    """
+    Продлевает или захватывает аренду лидера.
+    
+    Запрос к базе выполняется в отдельном потоке, чтобы долгий этап задачи
+    в потоке планировщика не задержал продление. Ставший лидером процесс
+    загружает задачи, переставший - снимает их с расписания; уже
+    выполняющиеся запуски бывшего лидера отсекаются токеном ограждения.
+    """
+    previous_token = leader.token
+    await asyncio.get_running_loop().run_in_executor(None, leader.heartbeat)
+    if leader.token == previous_token:
+        return
+    if previous_token is not None:
+        stop_leader_jobs()
+    if leader.token is not None:
+        await load_scheduled_tasks()
+
+def schedule_outbox_drain():
+    """Планирует периодическую отправку сообщений из очереди (повторы и сообщения после перезапуска)"""
+    # Отправка очереди не прерывается по времени: прерванная отправка повторила бы уже доставленные сообщения
+    job_scheduler.add_interval_job('outbox', lambda: task_runner.start('outbox', scheduler.drain_outbox, 'skip', 0), OUTBOX_DRAIN_INTERVAL_SECONDS)
+    logger.info(f"Запланирована отправка очереди сообщений каждые {OUTBOX_DRAIN_INTERVAL_SECONDS} секунд")
+
+def schedule_reminders():
+    """Планирует периодическую проверку напоминаний о скорых отключениях"""
+    job_scheduler.add_interval_job('reminders', lambda: task_runner.start('reminders', scheduler.fire_reminders, 'skip', 0), REMINDER_CHECK_INTERVAL_SECONDS)
+    logger.info(f"Запланирована проверка напоминаний каждые {REMINDER_CHECK_INTERVAL_SECONDS} секунд")
+
+def schedule_digests():
+    """Планирует периодическую проверку сводок плановых отключений"""
+    job_scheduler.add_interval_job('digests', lambda: task_runner.start('digests', scheduler.send_digests, 'skip', 0), DIGEST_CHECK_INTERVAL_SECONDS)
+    logger.info(f"Запланирована проверка сводок каждые {DIGEST_CHECK_INTERVAL_SECONDS} секунд")
+
+def schedule_snapshot_refresh():
+    """Планирует периодическую сверку снимка отключений для команды /outages (в каждом процессе бота)"""
+    job_scheduler.add_interval_job('outages-snapshot', lambda: task_runner.start('outages-snapshot', outage_snapshot.refresh, 'skip', 0), SNAPSHOT_VERSION_CHECK_SECONDS)
+    logger.info(f"Запланирована сверка снимка отключений каждые {SNAPSHOT_VERSION_CHECK_SECONDS} секунд")
+
+def schedule_task(task, run_at=None):
+    """Планирует задачу (заменяя её прежнее задание); без run_at расписание продолжается от последнего запуска"""
+    job_name = f"task-{task['id']}"
+    if task['interval_type'] == 'adaptive':
+        task['poll_interval_seconds'] = scheduler.get_poll_interval()
+    # Создаем функцию для выполнения задачи
+    job_func = lambda t=task: task_runner.start(
+        job_name,
+        lambda: execute_scheduled_task(t),
+        policy=t.get('overlap_policy'),
+        timeout=t.get('timeout_seconds'),
+        on_event=lambda event: record_task_run_event(t['id'], event)
+    )
+    job_scheduler.add_job(
+        job_name,
+        job_func,
+        lambda after, t=task: next_run_time(t, after),
+        run_at=run_at or first_run_time(task, datetime.now())
+    )
+    scheduled_tasks[task['id']] = task
+    
+    if task['interval_type'] == 'cron':
+        logger.info(f"Запланирована задача: {task['name']} с типами {task['task_types']} по расписанию {task['cron_expression']}")
+    elif task['interval_type'] == 'adaptive':
+        logger.info(f"Запланирована задача: {task['name']} с типами {task['task_types']} с адаптивным интервалом")
+    else:
+        logger.info(f"Запланирована задача: {task['name']} с типами {task['task_types']} каждые {task['interval_value']} {task['interval_type']}")
+
+async def execute_scheduled_task(task):
+    """
+    Выполняет задачу; задача с адаптивным интервалом после выполнения
+    переносит следующий запуск на новый интервал опроса источника, чтобы
+    аварийные отключения ускоряли уже ближайшую проверку.
+    """
+    started_at = datetime.now()
+    await scheduler.execute_task(task)
+    if task['interval_type'] != 'adaptive' or scheduled_tasks.get(task['id']) is not task:
+        return
+    task['poll_interval_seconds'] = scheduler.get_poll_interval()
+    job_scheduler.reschedule(f"task-{task['id']}", max(datetime.now(), next_run_time(task, started_at)))
+
+def record_task_run_event(task_id, event):
+    """Учитывает пропущенный, объединённый или прерванный запуск задачи (запись в базу - в пуле потоков)"""
+    asyncio.get_running_loop().run_in_executor(None, _write_task_run_event, task_id, event)
+
+def _write_task_run_event(task_id, event):
+    """Запись события запуска задачи (ошибка записи не влияет на запуски)"""
+    from databases.manager import db_manager
+    try:
+        db_manager.record_task_run_event(task_id, event)
+    except Exception as e:
+        logger.error(f"Ошибка при учёте события {event} задачи с ID {task_id}: {e}")
+
+def unschedule_task(task_id):
+    """Снимает задачу с расписания"""
+    if scheduled_tasks.pop(task_id, None) is not None:
+        job_scheduler.remove_job(f"task-{task_id}")
+        logger.info(f"Задача с ID {task_id} снята с расписания")
+
+def _read_task_changes(after_change_id):
+    """
+    Чтение изменений задач из базы (выполняется в пуле потоков).
+    
+    Возвращает None, если других коммитов не было, иначе (ID последнего
+    изменения, [(ID задачи, задача или None), ...]).
+    """
+    from databases.manager import db_manager
+    if not db_manager.has_database_changes():
+        return None
+    changes = db_manager.get_task_changes_since(after_change_id)
+    if not changes:
+        return None
+    tasks = [(task_id, db_manager.get_scheduled_task(task_id)) for task_id in dict.fromkeys(task_id for _, task_id in changes)]
+    _load_poll_interval(task for _, task in tasks)
+    return changes[-1][0], tasks
+
+def _read_scheduled_tasks():
+    """Чтение активных задач и ID последнего изменения задач (выполняется в пуле потоков)"""
+    from databases.manager import db_manager
+    # Изменения, записанные во время загрузки, будут применены повторно, что безопасно
+    last_change_id = db_manager.get_last_task_change_id()
+    tasks = db_manager.get_active_scheduled_tasks()
+    _load_poll_interval(tasks)
+    return last_change_id, tasks
+
+def _load_poll_interval(tasks):
+    """Загрузка интервала опроса в память, чтобы планирование адаптивных задач не обращалось к базе"""
+    if any(task and task['interval_type'] == 'adaptive' for task in tasks):
+        scheduler.get_poll_interval()
+
+async def apply_task_changes():
+    """
+    Применяет изменения задач из журнала изменений.
+    
+    Журнал читается только после коммитов других соединений (PRAGMA
+    data_version для SQLite). Чтение выполняется в пуле потоков, а
+    расписание меняется в цикле событий. Перепланируются только
+    изменённые задачи; задача, расписание которой не изменилось,
+    сохраняет время следующего запуска.
+    """
+    global last_task_change_id
+    result = await asyncio.get_running_loop().run_in_executor(None, _read_task_changes, last_task_change_id)
+    # Пока шло чтение, процесс мог перестать быть лидером и снять задачи с расписания
+    if result is None or leader.token is None:
+        return
+    last_task_change_id, tasks = result
+    
+    for task_id, task in tasks:
+        try:
+            if not task or not task['is_active']:
+                unschedule_task(task_id)
+                continue
+            current = scheduled_tasks.get(task_id)
+            run_at = None
+            if current and all(current.get(field) == task.get(field) for field in SCHEDULE_FIELDS):
+                run_at = job_scheduler.get_run_at(f"task-{task_id}")
+            schedule_task(task, run_at)
+        except Exception as e:
+            logger.error(f"Ошибка при применении изменений задачи с ID {task_id}: {e}", exc_info=True)
+
+async def load_scheduled_tasks():
+    """Загружает задачи из базы данных (чтение выполняется в пуле потоков)"""
+    global last_task_change_id
     try:
         logger.info("Загрузка задач из базы данных")
-        from databases.manager import db_manager
-        tasks = db_manager.get_active_scheduled_tasks()
+        schedule_outbox_drain()
+        schedule_reminders()
+        schedule_digests()
+        job_scheduler.add_interval_job('task-changes', lambda: task_runner.start('task-changes', apply_task_changes, 'skip', 0), TASK_CHANGES_CHECK_INTERVAL_SECONDS)
+        last_task_change_id, tasks = await asyncio.get_running_loop().run_in_executor(None, _read_scheduled_tasks)
         
         if not tasks:
             logger.info("Нет активных задач в базе данных")
@@ -62,27 +249,7 @@ def load_scheduled_tasks():
             # Загружаем задачи из базы данных
             for task in tasks:
                 try:
-                    # Создаем функцию для выполнения задачи
-                    job_func = lambda t=task: asyncio.run(scheduler.execute_task(t))
-                    
-                    # Планируем задачу в зависимости от типа интервала
-                    if task['interval_type'] == "minute":
-                        scheduled_job = schedule.every(task['interval_value']).minutes.do(job_func)
-                    elif task['interval_type'] == "hour":
-                        scheduled_job = schedule.every(task['interval_value']).hours.do(job_func)
-                    elif task['interval_type'] == "day":
-                        scheduled_job = schedule.every(task['interval_value']).days.do(job_func)
-                    elif task['interval_type'] == "week":
-                        scheduled_job = schedule.every(task['interval_value']).weeks.do(job_func)
-                    elif task['interval_type'] == "month":
-                        # Для месяцев используем приблизительное значение (30 дней)
-                        scheduled_job = schedule.every(task['interval_value'] * 30).days.do(job_func)
-                    else:
-                        logger.warning(f"Неизвестный тип интервала: {task['interval_type']}")
-                        continue
-                    
-                    logger.info(f"Запланирована задача: {task['name']} с типами {task['task_types']} каждые {task['interval_value']} {task['interval_type']}")
-                    
+                    schedule_task(task)
                 except Exception as e:
                     logger.error(f"Ошибка при планировании задачи {task['name']}: {e}")
         
@@ -90,42 +257,39 @@ def load_scheduled_tasks():
     except Exception as e:
         logger.error(f"Ошибка при загрузке задач из базы данных: {e}", exc_info=True)
 
-def run_scheduler():
-    """Функция для запуска шедулера в отдельном потоке"""
+async def on_startup(dispatcher: Dispatcher):
+    """Запуск планировщика задач вместе с ботом"""
+    global scheduler_loop_task
     logger.info("Запуск планировщика задач")
-    
     try:
         # Инициализируем типы задач
         from databases.manager import db_manager
         db_manager.initialize_task_types()
         
-        # Загружаем задачи при запуске
-        load_scheduled_tasks()
+        # Задачи загружаются, когда процесс становится лидером
+        scheduler_loop_task = asyncio.ensure_future(job_scheduler.run())
+        job_scheduler.add_interval_job('leader', lambda: task_runner.start('leader', leader_heartbeat, 'skip', 0), LEADER_HEARTBEAT_SECONDS)
+        # Снимок отключений нужен каждому процессу: команды обрабатывают и резервные процессы
+        schedule_snapshot_refresh()
+        await leader_heartbeat()
+        if leader.token is None:
+            logger.info("Процесс работает в резерве: задачи выполняет другой процесс бота")
         logger.info("Планировщик задач успешно инициализирован")
-        
-        # Запускаем цикл планировщика
-        logger.info("Запуск цикла планировщика")
-        iteration_count = 0
-        while scheduler_running:
-            try:
-                iteration_count += 1
-                if iteration_count % 10 == 0:  # Log every 10 iterations
-                    logger.info(f"Планировщик работает, итерация {iteration_count}")
-                
-                # Проверяем наличие файла-флага для обновления задач
-                if check_refresh_flag():
-                    logger.info("Обнаружен файл-флаг обновления задач, перезагружаем задачи")
-                    clear_schedule()
-                    load_scheduled_tasks()
-                
-                schedule.run_pending()
-                time.sleep(1)
-            except Exception as e:
-                logger.error(f"Ошибка в цикле планировщика: {e}", exc_info=True)
-                time.sleep(10)  # Ждем 10 секунд перед следующей попыткой
     except Exception as e:
         logger.error(f"Критическая ошибка при запуске планировщика: {e}", exc_info=True)
 
+async def on_shutdown(dispatcher: Dispatcher):
+    """Остановка планировщика: ожидание выполняющихся заданий и закрытие сессии бота"""
+    if scheduler_loop_task is not None:
+        scheduler_loop_task.cancel()
+        await asyncio.gather(scheduler_loop_task, return_exceptions=True)
+    
+    await task_runner.shutdown(SHUTDOWN_TIMEOUT)
+    clear_schedule()
+    # Резервный процесс становится лидером, не дожидаясь истечения аренды
+    leader.release()
+    await scheduler.close()
+
 # Обработчик ошибок
 @dp.errors_handler()
 async def errors_handler(update: types.Update, exception: Exception):
@@ -161,17 +325,12 @@ register_handlers(dp)
 if __name__ == "__main__":
     logger.info("Запуск Telegram бота")
     try:
-        # Запускаем шедулер в отдельном потоке
-        scheduler_thread = threading.Thread(target=run_scheduler, daemon=True)
-        scheduler_thread.start()
-        logger.info("Планировщик задач запущен в отдельном потоке")
-        
         # Проверяем токен и подключение к Telegram
         bot_info = asyncio.get_event_loop().run_until_complete(bot.get_me())
         logger.info(f"Бот запущен: @{bot_info.username} (ID: {bot_info.id})")
         
-        # Запуск бота
-        executor.start_polling(dp, skip_updates=True)
+        # Запуск бота; планировщик работает в том же цикле событий
+        executor.start_polling(dp, skip_updates=True, on_startup=on_startup, on_shutdown=on_shutdown)
     except Unauthorized:
         logger.error("Неверный токен бота. Проверьте TELEGRAM_TOKEN в конфигурации.")
     except NetworkError:
@@ -179,8 +338,4 @@ if __name__ == "__main__":
     except Exception as e:
         logger.error(f"Критическая ошибка при запуске бота: {e}", exc_info=True)
     finally:
-        # Останавливаем шедулер при завершении работы
-        scheduler_running = False
-        if 'scheduler_thread' in locals():
-            scheduler_thread.join(timeout=5)
         logger.info("Бот остановлен")
\ No newline at end of file
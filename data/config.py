@@ -31,6 +31,64 @@ HOLIDAYS_CHECK_INTERVAL_DAYS = int(os.getenv('HOLIDAYS_CHECK_INTERVAL_DAYS', '1'
 # Интервал проверки погоды (в минутах)
 WEATHER_CHECK_INTERVAL_MINUTES = int(os.getenv('WEATHER_CHECK_INTERVAL_MINUTES', '60'))
 
+# Порог похожести улиц по триграммам для нечёткого сопоставления адресов (0..1). Порог
+# низкий, чтобы опечатки ("Ленена", "Совецкая") совпадали; разные улицы с общим корнем
+# ("Пушкина" и "Пушкинская") отсекаются проверкой типа улицы и рода окончания
+FUZZY_MATCH_THRESHOLD = float(os.getenv('FUZZY_MATCH_THRESHOLD', '0.4'))
+
+# Файл справочника улиц с каноническими названиями и псевдонимами (JSON)
+STREET_GAZETTEER_FILE = os.getenv(
+    'STREET_GAZETTEER_FILE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'streets.json')
+)
+
+# Ограничения отправки сообщений в Telegram: общий лимит (сообщений в секунду),
+# лимит для одного группового чата (сообщений в минуту) и число одновременных отправок
+TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', '30'))
+TELEGRAM_CHAT_RATE_PER_MINUTE = float(os.getenv('TELEGRAM_CHAT_RATE_PER_MINUTE', '20'))
+TELEGRAM_SEND_CONCURRENCY = int(os.getenv('TELEGRAM_SEND_CONCURRENCY', '8'))
+
+# Число повторов отправки при сетевых ошибках
+TELEGRAM_SEND_RETRIES = int(os.getenv('TELEGRAM_SEND_RETRIES', '3'))
+
+# Очередь отправки (outbox): интервал проверки (в секундах) и число попыток отправки сообщения
+OUTBOX_DRAIN_INTERVAL_SECONDS = int(os.getenv('OUTBOX_DRAIN_INTERVAL_SECONDS', '30'))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '5'))
+
+# Запуск задачи во время выполнения предыдущего (skip, coalesce, queue) и предельное время
+# выполнения задачи (в секундах, 0 - без ограничения); задача может переопределить оба значения.
+# По истечении времени запуск отменяется, но этап, уже выполняющийся в потоке планировщика, доработает до конца
+TASK_OVERLAP_POLICY = os.getenv('TASK_OVERLAP_POLICY', 'skip')
+TASK_RUN_TIMEOUT_SECONDS = int(os.getenv('TASK_RUN_TIMEOUT_SECONDS', '900'))
+
+# Пулы обработчиков типов задач: число потоков, число процессов (разбор страниц) и
+# ограничение памяти процесса пула (в мегабайтах, 0 - без ограничения)
+TASK_THREAD_WORKERS = int(os.getenv('TASK_THREAD_WORKERS', '4'))
+TASK_PROCESS_WORKERS = int(os.getenv('TASK_PROCESS_WORKERS', '2'))
+TASK_PROCESS_MEMORY_MB = int(os.getenv('TASK_PROCESS_MEMORY_MB', '0'))
+
+# Границы интервала адаптивного опроса страницы отключений (в секундах)
+ADAPTIVE_POLL_MIN_SECONDS = int(os.getenv('ADAPTIVE_POLL_MIN_SECONDS', '120'))
+ADAPTIVE_POLL_MAX_SECONDS = int(os.getenv('ADAPTIVE_POLL_MAX_SECONDS', '3600'))
+
+# Выбор ведущего процесса бота: срок аренды лидерства и интервал её продления (в секундах).
+# Задачи выполняет только лидер; резервный процесс захватывает аренду после её истечения
+LEADER_LEASE_SECONDS = float(os.getenv('LEADER_LEASE_SECONDS', '10'))
+LEADER_HEARTBEAT_SECONDS = float(os.getenv('LEADER_HEARTBEAT_SECONDS', '3'))
+
+# Напоминания о скорых отключениях: за сколько минут до начала отключения (через запятую,
+# пустое значение отключает напоминания) и интервал проверки напоминаний (в секундах)
+REMINDER_OFFSETS_MINUTES = sorted(
+    {int(value) for value in os.getenv('REMINDER_OFFSETS_MINUTES', '720,60').split(',') if value.strip()},
+    reverse=True
+)
+REMINDER_CHECK_INTERVAL_SECONDS = int(os.getenv('REMINDER_CHECK_INTERVAL_SECONDS', '60'))
+
+# Сводки плановых отключений для групп с режимом доставки hourly/daily: час отправки
+# ежедневной сводки (местное время) и интервал проверки сводок (в секундах)
+DIGEST_DAILY_HOUR = int(os.getenv('DIGEST_DAILY_HOUR', '9'))
+DIGEST_CHECK_INTERVAL_SECONDS = int(os.getenv('DIGEST_CHECK_INTERVAL_SECONDS', '60'))
+
 # URL админ-панели
 ADMIN_PANEL_URL = os.getenv('ADMIN_PANEL_URL', 'http://localhost:80')
 
@@ -4,12 +4,13 @@ import os
 # Добавляем текущую директорию в путь поиска модулей
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.orm import sessionmaker, scoped_session
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.exc import SQLAlchemyError, OperationalError
 from databases.models import Base
 from data.config import DATABASE_URL
 import logging
+import threading
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
@@ -30,12 +31,18 @@ def create_database():
         else:
             engine = create_engine(DATABASE_URL, echo=False)
         
-        # Создаем все таблицы
-        Base.metadata.create_all(engine)
+        # Создаем все таблицы; несколько копий бота, запущенных одновременно,
+        # могут создавать таблицы наперегонки - тогда создание повторяется
+        try:
+            Base.metadata.create_all(engine)
+        except OperationalError as e:
+            logger.warning(f"Повторное создание таблиц после ошибки: {e.orig}")
+            Base.metadata.create_all(engine)
         
         # Проверяем существование индексов и создаем их при необходимости
         # Это нужно для случаев, когда индексы были добавлены после создания таблиц
         # В production среде лучше использовать миграции
+        add_missing_columns(engine)
         
         logger.info("База данных и таблицы успешно созданы")
         return engine
@@ -43,6 +50,71 @@ def create_database():
         logger.error(f"Ошибка при создании базы данных: {e}")
         raise
 
+def add_missing_columns(engine):
+    """Добавление в существующие таблицы колонок, появившихся в моделях позже"""
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            with engine.begin() as connection:
+                connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+            logger.info(f"Добавлена колонка {table.name}.{column.name}")
+            if column.index:
+                index_name = f'ix_{table.name}_{column.name}'
+                with engine.begin() as connection:
+                    connection.execute(text(f'CREATE INDEX IF NOT EXISTS {index_name} ON {table.name} ({column.name})'))
+
+class DataVersionWatcher:
+    """
+    Дешёвая проверка изменений базы данных другими соединениями.
+    
+    Для SQLite используется PRAGMA data_version на отдельном постоянном
+    соединении: значение меняется только после коммита другого соединения,
+    и проверка не читает таблицы. Для остальных баз изменения проверяются
+    каждый раз.
+    """
+    
+    def __init__(self, engine):
+        self.engine = engine
+        self.connection = None
+        self.version = None
+    
+    def changed(self) -> bool:
+        """Были ли коммиты других соединений с прошлой проверки"""
+        if self.engine.dialect.name != 'sqlite':
+            return True
+        try:
+            if self.connection is None:
+                self.connection = self.engine.raw_connection()
+            cursor = self.connection.cursor()
+            try:
+                cursor.execute('PRAGMA data_version')
+                version = cursor.fetchone()[0]
+            finally:
+                cursor.close()
+        except Exception as e:
+            logger.warning(f"Ошибка при проверке версии данных: {e}")
+            self.close()
+            return True
+        changed = version != self.version
+        self.version = version
+        return changed
+    
+    def close(self):
+        """Закрытие соединения для проверки"""
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception as e:
+                logger.warning(f"Ошибка при закрытии соединения проверки версии данных: {e}")
+            self.connection = None
+
 def get_session_factory(engine):
     """Получение фабрики сессий"""
     return sessionmaker(bind=engine)
@@ -59,6 +131,7 @@ class DatabaseSessionManager:
         self.engine = engine
         self.session_factory = get_session_factory(engine)
         self.scoped_session = get_scoped_session(engine)
+        self._local = threading.local()
     
     def get_session(self):
         """Получение новой сессии"""
@@ -73,17 +146,33 @@ class DatabaseSessionManager:
         self.scoped_session.remove()
     
     def __enter__(self):
-        """Вход в контекстный менеджер"""
-        self.session = self.session_factory()
-        return self.session
+        """
+        Вход в контекстный менеджер.
+        
+        Каждый вход открывает свою сессию и кладёт её в стек текущего
+        потока: менеджер используется одновременно из цикла событий и из
+        потоков планировщика, а общая сессия одного потока закрывалась бы
+        выходом из блока другого.
+        """
+        session = self.session_factory()
+        self._sessions().append(session)
+        return session
+    
+    def _sessions(self):
+        """Стек открытых сессий текущего потока"""
+        stack = getattr(self._local, 'sessions', None)
+        if stack is None:
+            stack = self._local.sessions = []
+        return stack
     
     def __exit__(self, exc_type, exc_val, exc_tb):
         """Выход из контекстного менеджера"""
+        session = self._sessions().pop()
         try:
             if exc_type is not None:
                 # Если возникло исключение, откатываем транзакцию
                 try:
-                    self.session.rollback()
+                    session.rollback()
                     logger.warning(f"Транзакция откачена из-за исключения: {exc_val}")
                 except Exception as rollback_error:
                     logger.error(f"Ошибка при откате транзакции: {rollback_error}")
@@ -92,11 +181,11 @@ class DatabaseSessionManager:
                 # Проверяем, что сессия еще не закрыта и не находится в процессе завершения
                 try:
                     # Проверяем состояние сессии перед коммитом
-                    if hasattr(self.session, 'is_active') and self.session.is_active:
+                    if hasattr(session, 'is_active') and session.is_active:
                         # Проверяем, есть ли незавершенные транзакции
-                        if not hasattr(self.session, '_transaction') or self.session._transaction is None or \
-                           (hasattr(self.session._transaction, 'is_active') and self.session._transaction.is_active):
-                            self.session.commit()
+                        if not hasattr(session, '_transaction') or session._transaction is None or \
+                           (hasattr(session._transaction, 'is_active') and session._transaction.is_active):
+                            session.commit()
                         else:
                             logger.debug("Нет активной транзакции для коммита")
                     else:
@@ -104,30 +193,30 @@ class DatabaseSessionManager:
                 except SQLAlchemyError as commit_error:
                     logger.error(f"Ошибка при коммите транзакции: {commit_error}")
                     try:
-                        self.session.rollback()
+                        session.rollback()
                     except Exception as rollback_error:
                         logger.error(f"Ошибка при откате транзакции: {rollback_error}")
                     raise
         except SQLAlchemyError as e:
             logger.error(f"Ошибка при завершении сессии: {e}")
             try:
-                if hasattr(self.session, 'is_active') and self.session.is_active:
-                    self.session.rollback()
+                if hasattr(session, 'is_active') and session.is_active:
+                    session.rollback()
             except Exception as rollback_error:
                 logger.error(f"Ошибка при откате транзакции: {rollback_error}")
             raise
         except Exception as e:
             logger.error(f"Неожиданная ошибка при завершении сессии: {e}")
             try:
-                if hasattr(self.session, 'is_active') and self.session.is_active:
-                    self.session.rollback()
+                if hasattr(session, 'is_active') and session.is_active:
+                    session.rollback()
             except Exception as rollback_error:
                 logger.error(f"Ошибка при откате транзакции: {rollback_error}")
             raise
         finally:
             # Всегда закрываем сессию
             try:
-                self.session.close()
+                session.close()
             except Exception as close_error:
                 logger.warning(f"Ошибка при закрытии сессии: {close_error}")
         
@@ -0,0 +1,161 @@
+from databases.base_manager import BaseManager
+from typing import Dict, List, Tuple
+from databases.models import OutageEvent, OutageGroupMatch, Outage, Group, Delivery, OutboxMessage
+from databases.match_manager import ID_BATCH_SIZE
+from databases.outbox_manager import DELIVERY_QUEUED, DELIVERY_SENT
+from databases.outage_manager import EVENT_UPDATED, EVENT_CANCELLED, EVENT_RESOLVED
+import logging
+import json
+from sqlalchemy import and_
+from sqlalchemy.exc import SQLAlchemyError
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# События, о которых группы получают сообщения об изменениях (новые отключения уведомляются через совпадения)
+UPDATE_EVENT_TYPES = (EVENT_UPDATED, EVENT_CANCELLED, EVENT_RESOLVED)
+
+class OutageEventManager(BaseManager):
+    """Менеджер для работы с событиями изменения отключений"""
+
+    def get_pending_events(self, limit: int = 500) -> List[Tuple[OutageEvent, Outage, list]]:
+        """
+        Необработанные события изменения отключений с получателями.
+
+        Для каждого события возвращается (событие, отключение, получатели),
+        где получатели - список (совпадение, группа, ID сообщения Telegram,
+        ID сообщения очереди с уведомлением) активных групп, которым уже
+        доставлено уведомление об отключении. Событие без получателей тоже
+        возвращается, чтобы его пометили обработанным.
+
+        События отключения, уведомление о котором ещё ждёт отправки в
+        очереди какой-либо активной группе, не возвращаются: они остаются
+        необработанными до доставки уведомления, после чего отправленное
+        уведомление будет исправлено. Если уведомление так и не доставлено,
+        его запись о доставке удаляется и событие обрабатывается без этой
+        группы.
+        """
+        with self.session_manager as session:
+            try:
+                rows = session.query(OutageEvent, Outage).join(
+                    Outage, Outage.id == OutageEvent.outage_id
+                ).filter(
+                    and_(
+                        OutageEvent.notified == False,
+                        OutageEvent.event_type.in_(UPDATE_EVENT_TYPES)
+                    )
+                ).order_by(OutageEvent.id).limit(limit).all()
+
+                outage_ids = list({outage.id for _, outage in rows})
+                queued_outage_ids = set()
+                for start in range(0, len(outage_ids), ID_BATCH_SIZE):
+                    batch = outage_ids[start:start + ID_BATCH_SIZE]
+                    queued_outage_ids.update(outage_id for outage_id, in session.query(Delivery.outage_id).join(
+                        Group, Group.id == Delivery.group_id
+                    ).filter(
+                        and_(
+                            Delivery.outage_id.in_(batch),
+                            Delivery.status == DELIVERY_QUEUED,
+                            Group.is_active == True
+                        )
+                    ).distinct().all())
+                if queued_outage_ids:
+                    logger.info(f"События {len(queued_outage_ids)} отключений ждут отправки уведомлений из очереди")
+                    rows = [(event, outage) for event, outage in rows if outage.id not in queued_outage_ids]
+                    outage_ids = [outage_id for outage_id in outage_ids if outage_id not in queued_outage_ids]
+
+                targets = {}
+                for start in range(0, len(outage_ids), ID_BATCH_SIZE):
+                    batch = outage_ids[start:start + ID_BATCH_SIZE]
+                    for match, group, message_id, outbox_id in session.query(
+                        OutageGroupMatch, Group, Delivery.message_id, Delivery.outbox_id
+                    ).join(
+                        Group, Group.id == OutageGroupMatch.group_id
+                    ).join(
+                        Delivery, and_(
+                            Delivery.outage_id == OutageGroupMatch.outage_id,
+                            Delivery.group_id == OutageGroupMatch.group_id,
+                            Delivery.status == DELIVERY_SENT
+                        )
+                    ).filter(
+                        and_(
+                            OutageGroupMatch.outage_id.in_(batch),
+                            Group.is_active == True
+                        )
+                    ).order_by(OutageGroupMatch.group_id).all():
+                        targets.setdefault(match.outage_id, []).append((match, group, message_id, outbox_id))
+
+                # Принудительно загружаем атрибуты и отсоединяем объекты от сессии
+                # (одно отключение и одна группа встречаются в нескольких строках)
+                detached = set()
+                objects = [obj for row in rows for obj in row]
+                objects.extend(obj for outage_targets in targets.values() for match, group, _, _ in outage_targets for obj in (match, group))
+                for obj in objects:
+                    if id(obj) in detached:
+                        continue
+                    if isinstance(obj, Outage):
+                        _ = obj.district
+                        _ = obj.resource
+                        _ = obj.addresses
+                        _ = obj.start_time
+                        _ = obj.end_time
+                    elif isinstance(obj, Group):
+                        _ = obj.group_id
+                        _ = obj.addresses
+                    elif isinstance(obj, OutageGroupMatch):
+                        _ = obj.address_index
+                    else:
+                        _ = obj.event_type
+                        _ = obj.changes
+                    session.expunge(obj)
+                    detached.add(id(obj))
+                return [(event, outage, targets.get(outage.id, [])) for event, outage in rows]
+            except SQLAlchemyError as e:
+                logger.error(f"Ошибка при получении событий изменения отключений: {e}")
+                raise
+
+    def get_sent_messages(self, outbox_ids: List[int]) -> Dict[int, Tuple[str, List[Tuple[OutageGroupMatch, Outage]]]]:
+        """
+        Содержимое отправленных уведомлений для их правки.
+
+        Для каждого сообщения очереди возвращается (текст, совпадения), где
+        совпадения - пары (совпадение, отключение) в порядке фрагментов
+        сообщения, с текущими полями отключений.
+        """
+        with self.session_manager as session:
+            try:
+                messages = {}
+                for start in range(0, len(outbox_ids), ID_BATCH_SIZE):
+                    batch = outbox_ids[start:start + ID_BATCH_SIZE]
+                    for outbox_id, body, match_ids in session.query(
+                        OutboxMessage.id, OutboxMessage.body, OutboxMessage.match_ids
+                    ).filter(OutboxMessage.id.in_(batch)).all():
+                        messages[outbox_id] = (body, json.loads(match_ids) if match_ids else [])
+
+                match_ids = list({match_id for _, message_match_ids in messages.values() for match_id in message_match_ids})
+                matches = {}
+                for start in range(0, len(match_ids), ID_BATCH_SIZE):
+                    batch = match_ids[start:start + ID_BATCH_SIZE]
+                    for match, outage in session.query(OutageGroupMatch, Outage).join(
+                        Outage, Outage.id == OutageGroupMatch.outage_id
+                    ).filter(OutageGroupMatch.id.in_(batch)).all():
+                        matches[match.id] = (match, outage)
+
+                # Принудительно загружаем атрибуты и отсоединяем объекты от сессии
+                detached = set()
+                for match, outage in matches.values():
+                    _ = match.address_index
+                    _ = outage.district
+                    _ = outage.addresses
+                    _ = outage.status
+                    for obj in (match, outage):
+                        if id(obj) not in detached:
+                            session.expunge(obj)
+                            detached.add(id(obj))
+                return {
+                    outbox_id: (body, [matches[match_id] for match_id in message_match_ids if match_id in matches])
+                    for outbox_id, (body, message_match_ids) in messages.items()
+                }
+            except SQLAlchemyError as e:
+                logger.error(f"Ошибка при получении отправленных уведомлений: {e}")
+                raise
@@ -3,10 +3,12 @@ from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
 from databases.models import Group
+from utils.delivery_priority import DELIVERY_IMMEDIATE, DIGEST_PERIODS
 import logging
 import json
-from sqlalchemy import and_
+from sqlalchemy import and_, func
 from sqlalchemy.exc import SQLAlchemyError
+from utils.gazetteer import street_gazetteer
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
@@ -14,8 +16,14 @@ logger = logging.getLogger(__name__)
 class GroupManager(BaseManager):
     """Менеджер для работы с группами"""
     
-    def add_group(self, group_id: str, name: str, addresses: List[str]) -> Group:
-        """Добавление новой группы или обновление существующей"""
+    def _resolve_street_ids(self, addresses: List[str]) -> str:
+        """ID улиц из справочника для адресов группы (JSON)"""
+        # Улицы регистрируются до открытия сессии группы, чтобы не держать две записи в SQLite одновременно
+        return json.dumps(street_gazetteer.resolve_many(addresses or []))
+    
+    def add_group(self, group_id: str, name: str, addresses: List[str], delivery_mode: Optional[str] = None) -> Group:
+        """Добавление новой группы или обновление существующей (без delivery_mode режим доставки не меняется)"""
+        street_ids = self._resolve_street_ids(addresses)
         with self.session_manager as session:
             try:
                 # Проверяем, существует ли уже группа с таким ID
@@ -25,7 +33,10 @@ class GroupManager(BaseManager):
                     # Если группа существует, обновляем её данные
                     existing_group.name = name
                     existing_group.addresses = json.dumps(addresses)
+                    existing_group.street_ids = street_ids
                     existing_group.is_active = True  # Активируем, если была неактивна
+                    if delivery_mode is not None:
+                        existing_group.delivery_mode = delivery_mode
                     session.flush()  # Принудительно записываем в БД, но не коммитим транзакцию
                     session.refresh(existing_group)  # Обновляем состояние объекта
                     # Принудительно загружаем атрибуты, чтобы они были доступны после закрытия сессии
@@ -33,14 +44,19 @@ class GroupManager(BaseManager):
                     _ = existing_group.group_id
                     _ = existing_group.name
                     _ = existing_group.addresses
+                    _ = existing_group.street_ids
                     _ = existing_group.is_active
+                    _ = existing_group.delivery_mode
+                    _ = existing_group.digest_sent_at
                     _ = existing_group.created_at
+                    _ = existing_group.updated_at
                     logger.info(f"Обновлена существующая группа: {name} ({group_id})")
                     return existing_group
                 else:
                     # Если группа не существует, создаем новую
                     addresses_json = json.dumps(addresses)
-                    group = Group(group_id=group_id, name=name, addresses=addresses_json)
+                    group = Group(group_id=group_id, name=name, addresses=addresses_json, street_ids=street_ids,
+                                  delivery_mode=delivery_mode or DELIVERY_IMMEDIATE)
                     session.add(group)
                     session.flush()  # Принудительно записываем в БД, но не коммитим транзакцию
                     session.refresh(group)  # Обновляем состояние объекта
@@ -49,8 +65,12 @@ class GroupManager(BaseManager):
                     _ = group.group_id
                     _ = group.name
                     _ = group.addresses
+                    _ = group.street_ids
                     _ = group.is_active
+                    _ = group.delivery_mode
+                    _ = group.digest_sent_at
                     _ = group.created_at
+                    _ = group.updated_at
                     logger.info(f"Добавлена новая группа: {name} ({group_id})")
                     return group
             except SQLAlchemyError as e:
@@ -69,8 +89,12 @@ class GroupManager(BaseManager):
                     _ = group.group_id
                     _ = group.name
                     _ = group.addresses
+                    _ = group.street_ids
                     _ = group.is_active
+                    _ = group.delivery_mode
+                    _ = group.digest_sent_at
                     _ = group.created_at
+                    _ = group.updated_at
                 # Отсоединяем все объекты от сессии после завершения запроса
                 for group in groups:
                     session.expunge(group)
@@ -79,6 +103,18 @@ class GroupManager(BaseManager):
                 logger.error(f"Ошибка при получении списка групп: {e}")
                 raise
     
+    def get_groups_version(self) -> tuple:
+        """Версия набора активных групп: меняется при добавлении, изменении и деактивации групп"""
+        with self.session_manager as session:
+            try:
+                count, max_id, last_update = session.query(
+                    func.count(Group.id), func.max(Group.id), func.max(Group.updated_at)
+                ).filter(Group.is_active == True).one()
+                return count, max_id, last_update
+            except SQLAlchemyError as e:
+                logger.error(f"Ошибка при получении версии групп: {e}")
+                raise
+    
     def get_group_by_id(self, group_id: str) -> Optional[Group]:
         """Получение группы по ID"""
         with self.session_manager as session:
@@ -96,8 +132,12 @@ class GroupManager(BaseManager):
                     _ = group.group_id
                     _ = group.name
                     _ = group.addresses
+                    _ = group.street_ids
                     _ = group.is_active
+                    _ = group.delivery_mode
+                    _ = group.digest_sent_at
                     _ = group.created_at
+                    _ = group.updated_at
                     # Отсоединяем объект от сессии после завершения запроса
                     session.expunge(group)
                 return group
@@ -122,8 +162,15 @@ class GroupManager(BaseManager):
                     _ = group.group_id
                     _ = group.name
                     _ = group.addresses
+                    _ = group.street_ids
                     _ = group.is_active
+                    _ = group.delivery_mode
+                    _ = group.digest_sent_at
                     _ = group.created_at
+                    _ = group.updated_at
+                # Отсоединяем все объекты от сессии после завершения запроса
+                for group in groups:
+                    session.expunge(group)
                 return groups
             except SQLAlchemyError as e:
                 logger.error(f"Ошибка при получении групп по списку ID: {e}")
@@ -131,11 +178,13 @@ class GroupManager(BaseManager):
     
     def update_group_addresses(self, group_id: str, addresses: List[str]) -> bool:
         """Обновление адресов группы"""
+        street_ids = self._resolve_street_ids(addresses)
         with self.session_manager as session:
             try:
                 group = session.query(Group).filter(Group.group_id == group_id).first()
                 if group:
                     group.addresses = json.dumps(addresses)
+                    group.street_ids = street_ids
                     logger.info(f"Обновлены адреса группы {group_id}")
                     return True
                 logger.warning(f"Группа {group_id} не найдена при обновлении адресов")
@@ -144,14 +193,19 @@ class GroupManager(BaseManager):
                 logger.error(f"Ошибка при обновлении адресов группы {group_id}: {e}")
                 raise
     
-    def update_group(self, group_id: int, name: str, addresses: List[str]) -> Optional[dict]:
-        """Обновление группы"""
+    def update_group(self, group_id: int, name: str, addresses: List[str],
+                     delivery_mode: Optional[str] = None) -> Optional[dict]:
+        """Обновление группы (без delivery_mode режим доставки не меняется)"""
+        street_ids = self._resolve_street_ids(addresses)
         with self.session_manager as session:
             try:
                 group = session.query(Group).filter(Group.id == group_id).first()
                 if group:
                     group.name = name
                     group.addresses = json.dumps(addresses)
+                    group.street_ids = street_ids
+                    if delivery_mode is not None:
+                        group.delivery_mode = delivery_mode
                     session.flush()  # Принудительно записываем в БД, но не коммитим транзакцию
                     
                     result = {
@@ -160,6 +214,7 @@ class GroupManager(BaseManager):
                         'name': group.name,
                         'addresses': addresses,
                         'is_active': group.is_active,
+                        'delivery_mode': group.delivery_mode or DELIVERY_IMMEDIATE,
                         'created_at': group.created_at.isoformat() if group.created_at else None
                     }
                     logger.info(f"Обновлена группа с ID {group_id}")
@@ -170,6 +225,44 @@ class GroupManager(BaseManager):
                 logger.error(f"Ошибка при обновлении группы с ID {group_id}: {e}")
                 raise
     
+    def get_digest_groups(self) -> List[Group]:
+        """Активные группы, получающие плановые отключения сводкой"""
+        with self.session_manager as session:
+            try:
+                groups = session.query(Group).filter(
+                    and_(
+                        Group.delivery_mode.in_(list(DIGEST_PERIODS)),
+                        Group.is_active == True
+                    )
+                ).all()
+                for group in groups:
+                    # Принудительно загружаем атрибуты, чтобы они были доступны после закрытия сессии
+                    _ = group.id
+                    _ = group.group_id
+                    _ = group.name
+                    _ = group.addresses
+                    _ = group.delivery_mode
+                    _ = group.digest_sent_at
+                    session.expunge(group)
+                return groups
+            except SQLAlchemyError as e:
+                logger.error(f"Ошибка при получении групп со сводками: {e}")
+                raise
+    
+    def mark_digests_sent(self, group_ids: List[int], sent_at: Optional[datetime] = None) -> int:
+        """Запись времени сводки групп; возвращает число обновлённых групп"""
+        if not group_ids:
+            return 0
+        with self.session_manager as session:
+            try:
+                updated = session.query(Group).filter(Group.id.in_(group_ids)).update(
+                    {Group.digest_sent_at: sent_at or datetime.utcnow()}, synchronize_session=False
+                )
+                return updated
+            except SQLAlchemyError as e:
+                logger.error(f"Ошибка при записи времени сводки групп: {e}")
+                raise
+    
     def deactivate_group(self, group_id: int) -> bool:
         """Деактивация группы"""
         with self.session_manager as session:
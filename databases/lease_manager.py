@@ -0,0 +1,121 @@
+from databases.base_manager import BaseManager
+from sqlalchemy.orm import Session
+from typing import Optional
+from datetime import datetime, timedelta
+from databases.models import Lease
+import logging
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Аренда, которой ограждаются запуск задач и записи очереди отправки
+SCHEDULER_LEASE = 'scheduler'
+
+class LeaseLostError(Exception):
+    """Токен ограждения устарел: аренду захватил другой процесс"""
+
+class LeaseManager(BaseManager):
+    """
+    Менеджер аренды лидерства.
+    
+    Аренда - строка таблицы leases с владельцем, временем окончания и
+    токеном ограждения. Владелец продлевает аренду, пока она не истекла;
+    истёкшую аренду захватывает другой процесс, и токен увеличивается.
+    Записи, выполняемые от имени лидера, проверяют токен в той же
+    транзакции, поэтому бывший лидер после паузы не может их выполнить.
+    """
+    
+    def acquire(self, name: str, holder: str, ttl_seconds: float) -> Optional[int]:
+        """Захват или продление аренды; возвращает токен ограждения или None, если аренда занята"""
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=ttl_seconds)
+        try:
+            with self.session_manager as session:
+                # Продление действующей аренды токен не меняет
+                renewed = session.query(Lease).filter(
+                    and_(Lease.name == name, Lease.holder == holder, Lease.expires_at >= now)
+                ).update({Lease.expires_at: expires_at, Lease.renewed_at: now}, synchronize_session=False)
+                if not renewed:
+                    # Захват свободной или истёкшей аренды одним условным UPDATE:
+                    # из нескольких претендентов его выполнит только первый
+                    acquired = session.query(Lease).filter(
+                        and_(Lease.name == name, or_(Lease.holder.is_(None), Lease.expires_at < now))
+                    ).update({
+                        Lease.holder: holder,
+                        Lease.token: Lease.token + 1,
+                        Lease.expires_at: expires_at,
+                        Lease.acquired_at: now,
+                        Lease.renewed_at: now
+                    }, synchronize_session=False)
+                    if not acquired:
+                        lease = session.query(Lease).filter(Lease.name == name).first()
+                        if lease is not None:
+                            return None
+                        session.add(Lease(name=name, holder=holder, token=1, expires_at=expires_at,
+                                          acquired_at=now, renewed_at=now))
+                        session.flush()
+                        logger.info(f"Аренда {name} создана и захвачена процессом {holder}")
+                        return 1
+                    
+                lease = session.query(Lease).filter(Lease.name == name).first()
+                if not renewed:
+                    logger.info(f"Аренда {name} захвачена процессом {holder}, токен {lease.token}")
+                return lease.token
+        except IntegrityError:
+            # Строку аренды одновременно создал другой процесс
+            return None
+        except SQLAlchemyError as e:
+            logger.error(f"Ошибка при захвате аренды {name}: {e}")
+            raise
+    
+    def release(self, name: str, holder: str) -> bool:
+        """Освобождение аренды владельцем, чтобы резервный процесс захватил её без ожидания"""
+        with self.session_manager as session:
+            try:
+                released = session.query(Lease).filter(
+                    and_(Lease.name == name, Lease.holder == holder)
+                ).update({Lease.holder: None, Lease.expires_at: datetime.utcnow()}, synchronize_session=False)
+                if released:
+                    logger.info(f"Аренда {name} освобождена процессом {holder}")
+                return bool(released)
+            except SQLAlchemyError as e:
+                logger.error(f"Ошибка при освобождении аренды {name}: {e}")
+                raise
+    
+    def get_lease(self, name: str) -> Optional[dict]:
+        """Текущее состояние аренды (None, если аренда ещё не создавалась)"""
+        with self.session_manager as session:
+            try:
+                lease = session.query(Lease).filter(Lease.name == name).first()
+                if lease is None:
+                    return None
+                return {
+                    'name': lease.name,
+                    'holder': lease.holder,
+                    'token': lease.token,
+                    'expires_at': lease.expires_at,
+                    'acquired_at': lease.acquired_at,
+                    'renewed_at': lease.renewed_at
+                }
+            except SQLAlchemyError as e:
+                logger.error(f"Ошибка при получении аренды {name}: {e}")
+                raise
+
+def check_fencing_token(session: Session, token: Optional[int], name: str = SCHEDULER_LEASE):
+    """
+    Проверка токена ограждения в транзакции записи.
+    
+    Проверка выполняется записью в строку аренды: транзакция сразу берёт
+    блокировку записи, и смена владельца не может произойти между
+    проверкой и остальными записями транзакции. Без токена (бот запущен
+    без выбора лидера) проверка не выполняется.
+    """
+    if token is None:
+        return
+    checked = session.query(Lease).filter(
+        and_(Lease.name == name, Lease.token == token)
+    ).update({Lease.token: Lease.token}, synchronize_session=False)
+    if not checked:
+        raise LeaseLostError(f"Токен ограждения {token} аренды {name} устарел")
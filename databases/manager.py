@@ -1,17 +1,39 @@
-from databases.database import create_database
+from databases.database import create_database, DataVersionWatcher
 from databases.admin_manager import AdminManager
 from databases.group_manager import GroupManager
 from databases.outage_manager import OutageManager
 from databases.task_manager import TaskManager
 from databases.notification_manager import NotificationManager
 from databases.stats_manager import StatsManager
+from databases.street_manager import StreetManager
+from databases.match_manager import MatchManager
+from databases.outbox_manager import OutboxManager
+from databases.source_manager import SourceManager
+from databases.lease_manager import LeaseManager
+from databases.task_run_manager import TaskRunManager
+from databases.reminder_manager import ReminderManager
+from databases.event_manager import OutageEventManager
+from data.config import STREET_GAZETTEER_FILE, ADAPTIVE_POLL_MIN_SECONDS, ADAPTIVE_POLL_MAX_SECONDS
+from utils.gazetteer import street_gazetteer, canonical_street_key
+from utils.address_matcher import AddressMatcher
+from utils.run_timer import stage, count
+import logging
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
 
 class DatabaseManager:
     """Менеджер для работы с базой данных"""
     
     def __init__(self):
         self.engine = create_database()
+        # Проверка изменений базы данных другими процессами (например, админкой)
+        self.data_version = DataVersionWatcher(self.engine)
+        # Индекс адресов групп для сопоставления новых отключений
+        self._matcher = None
+        self._matcher_version = None
         self._init_managers()
+        self._init_gazetteer()
     
     def _init_managers(self):
         """Инициализация всех менеджеров"""
@@ -21,6 +43,79 @@ class DatabaseManager:
         self.task_manager = TaskManager(self.engine)
         self.notification_manager = NotificationManager(self.engine)
         self.stats_manager = StatsManager(self.engine)
+        self.street_manager = StreetManager(self.engine)
+        self.match_manager = MatchManager(self.engine)
+        self.outbox_manager = OutboxManager(self.engine)
+        self.source_manager = SourceManager(self.engine)
+        self.lease_manager = LeaseManager(self.engine)
+        self.task_run_manager = TaskRunManager(self.engine)
+        self.reminder_manager = ReminderManager(self.engine)
+        self.event_manager = OutageEventManager(self.engine)
+    
+    def _init_gazetteer(self):
+        """Подключение справочника улиц к базе данных"""
+        try:
+            self.street_manager.load_gazetteer_file(STREET_GAZETTEER_FILE, canonical_street_key)
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке файла справочника улиц: {e}")
+        street_gazetteer.bind(
+            loader=self.street_manager.get_street_index_entries,
+            registrar=self.street_manager.add_streets
+        )
+    
+    @staticmethod
+    def _match_rows(matcher: AddressMatcher, outages: list) -> list:
+        """Строки совпадений для сохранения из результата индекса адресов"""
+        rows = []
+        for group_index, group_matches in matcher.match_outages(outages).items():
+            group = matcher.groups[group_index]
+            for match in group_matches:
+                rows.append({
+                    'outage_id': match.outage.id,
+                    'group_id': group.id,
+                    'address_index': match.address_index,
+                    'method': match.explanation.method,
+                    'score': match.explanation.score,
+                    'group_address': match.explanation.group_address,
+                })
+        return rows
+    
+    def _get_address_matcher(self) -> AddressMatcher:
+        """Индекс адресов активных групп (перестраивается только при изменении групп)"""
+        version = self.group_manager.get_groups_version()
+        if self._matcher is None or self._matcher_version != version:
+            self._matcher = AddressMatcher(self.group_manager.get_all_groups())
+            self._matcher_version = version
+        return self._matcher
+    
+    def match_new_outages(self) -> int:
+        """Сопоставление с группами только ещё не сопоставленных отключений"""
+        outages = self.outage_manager.get_unmatched_outages()
+        if not outages:
+            return 0
+        rows = self._match_rows(self._get_address_matcher(), outages)
+        self.match_manager.add_matches(rows)
+        self.outage_manager.mark_outages_as_matched([outage.id for outage in outages])
+        # Отключения без совпадений доставлять некому
+        matched_ids = {row['outage_id'] for row in rows}
+        unmatched_ids = [outage.id for outage in outages if outage.id not in matched_ids]
+        if unmatched_ids:
+            self.outage_manager.mark_outages_as_notified(unmatched_ids)
+        logger.info(f"Сопоставлено {len(outages)} новых отключений, найдено {len(rows)} совпадений")
+        return len(rows)
+    
+    def rematch_group(self, group) -> int:
+        """Пересопоставление одной изменённой группы с действующими отключениями, ещё не доставленными ей"""
+        outages = self.outage_manager.get_undelivered_active_outages(group.id)
+        rows = self._match_rows(AddressMatcher([group]), outages)
+        return self.match_manager.replace_group_matches(group.id, rows)
+    
+    def _rematch_group_safely(self, group):
+        """Пересопоставление группы без прерывания её сохранения при ошибке"""
+        try:
+            self.rematch_group(group)
+        except Exception as e:
+            logger.error(f"Ошибка при пересопоставлении группы {group.name}: {e}")
     
     # Delegate methods to AdminManager
     def add_admin(self, username: str, password_hash: str):
@@ -36,8 +131,12 @@ class DatabaseManager:
         return self.admin_manager.delete_admin(admin_id)
     
     # Delegate methods to GroupManager
-    def add_group(self, group_id: str, name: str, addresses: list):
-        return self.group_manager.add_group(group_id, name, addresses)
+    def add_group(self, group_id: str, name: str, addresses: list, delivery_mode: str = None):
+        group = self.group_manager.add_group(group_id, name, addresses, delivery_mode)
+        saved_group = self.group_manager.get_group_by_id(group_id)
+        if saved_group:
+            self._rematch_group_safely(saved_group)
+        return group
     
     def get_all_groups(self):
         return self.group_manager.get_all_groups()
@@ -49,31 +148,131 @@ class DatabaseManager:
         return self.group_manager.get_groups_by_ids(group_ids)
     
     def update_group_addresses(self, group_id: str, addresses: list) -> bool:
-        return self.group_manager.update_group_addresses(group_id, addresses)
-    
-    def update_group(self, group_id: int, name: str, addresses: list):
-        return self.group_manager.update_group(group_id, name, addresses)
+        updated = self.group_manager.update_group_addresses(group_id, addresses)
+        if updated:
+            group = self.group_manager.get_group_by_id(group_id)
+            if group:
+                self._rematch_group_safely(group)
+        return updated
+    
+    def update_group(self, group_id: int, name: str, addresses: list, delivery_mode: str = None):
+        result = self.group_manager.update_group(group_id, name, addresses, delivery_mode)
+        if result:
+            for group in self.group_manager.get_groups_by_ids([group_id]):
+                self._rematch_group_safely(group)
+        return result
     
     def deactivate_group(self, group_id: int) -> bool:
         return self.group_manager.deactivate_group(group_id)
     
+    def get_digest_groups(self):
+        return self.group_manager.get_digest_groups()
+    
+    def mark_digests_sent(self, group_ids: list, sent_at=None) -> int:
+        return self.group_manager.mark_digests_sent(group_ids, sent_at)
+    
     # Delegate methods to OutageManager
-    def add_outages(self, outages_data: list):
-        return self.outage_manager.add_outages(outages_data)
+    def add_outages(self, outages_data: list, timer=None):
+        outages = self.outage_manager.add_outages(outages_data, timer)
+        try:
+            with stage(timer, 'match'):
+                count(timer, 'matches_count', self.match_new_outages())
+        except Exception as e:
+            # Несопоставленные отключения будут сопоставлены при следующем добавлении
+            logger.error(f"Ошибка при сопоставлении новых отключений с группами: {e}")
+        return outages
     
     def get_unnotified_outages(self):
         return self.outage_manager.get_unnotified_outages()
     
+    def get_outages_version(self) -> tuple:
+        return self.outage_manager.get_outages_version()
+    
+    def get_current_outages(self, limit: int):
+        return self.outage_manager.get_current_outages(limit)
+    
     def get_outages_by_date_range(self, start_date, end_date):
         return self.outage_manager.get_outages_by_date_range(start_date, end_date)
     
     def mark_outages_as_notified(self, outage_ids: list) -> bool:
         return self.outage_manager.mark_outages_as_notified(outage_ids)
     
+    # Delegate methods to MatchManager
+    def get_pending_matches(self, group_ids: list = None):
+        return self.match_manager.get_pending_matches(group_ids)
+    
+    # Delegate methods to OutboxManager
+    def enqueue_outbox_messages(self, messages: list, fencing_token: int = None) -> int:
+        return self.outbox_manager.enqueue_messages(messages, fencing_token)
+    
+    def get_due_outbox_messages(self, limit: int = 500, fencing_token: int = None):
+        return self.outbox_manager.get_due_messages(limit, fencing_token)
+    
+    def acknowledge_outbox_message(self, message_id: int, telegram_message_id: int = None,
+                                   fencing_token: int = None) -> bool:
+        return self.outbox_manager.acknowledge_message(message_id, telegram_message_id, fencing_token)
+    
+    def fail_outbox_message(self, message_id: int, error: str, retry_at=None, fencing_token: int = None) -> bool:
+        return self.outbox_manager.fail_message(message_id, error, retry_at, fencing_token)
+    
+    def enqueue_reminders(self, messages: list, fencing_token: int = None) -> int:
+        return self.outbox_manager.enqueue_reminders(messages, fencing_token)
+    
+    def enqueue_outage_updates(self, messages: list, event_ids: list, fencing_token: int = None) -> int:
+        return self.outbox_manager.enqueue_outage_updates(messages, event_ids, fencing_token)
+    
+    # Delegate methods to OutageEventManager
+    def get_pending_outage_events(self, limit: int = 500):
+        return self.event_manager.get_pending_events(limit)
+    
+    def get_sent_outage_messages(self, outbox_ids: list):
+        return self.event_manager.get_sent_messages(outbox_ids)
+    
+    # Delegate methods to ReminderManager
+    def get_upcoming_outages(self, after):
+        return self.reminder_manager.get_upcoming_outages(after)
+    
+    def get_reminder_targets(self, outage_ids: list, offset_minutes: int):
+        return self.reminder_manager.get_reminder_targets(outage_ids, offset_minutes)
+    
+    # Delegate methods to LeaseManager
+    def acquire_lease(self, name: str, holder: str, ttl_seconds: float):
+        return self.lease_manager.acquire(name, holder, ttl_seconds)
+    
+    def release_lease(self, name: str, holder: str) -> bool:
+        return self.lease_manager.release(name, holder)
+    
+    def get_lease(self, name: str):
+        return self.lease_manager.get_lease(name)
+    
+    # Delegate methods to TaskRunManager
+    def add_task_run(self, task_id: int, task_name: str, started_at, finished_at, outcome: str,
+                     stages: dict, counters: dict, error: str = None) -> int:
+        return self.task_run_manager.add_run(task_id, task_name, started_at, finished_at, outcome, stages, counters, error)
+    
+    def get_task_run_stats(self, runs_per_task: int = 500):
+        return self.task_run_manager.get_run_stats(runs_per_task)
+    
+    def get_slowest_task_runs(self, limit: int = 20, task_id: int = None):
+        return self.task_run_manager.get_slowest_runs(limit, task_id)
+    
+    # Delegate methods to SourceManager
+    def record_source_check(self, source: str, digest: str, emergency: bool, initial_seconds: int = None) -> dict:
+        return self.source_manager.record_check(source, digest, emergency, ADAPTIVE_POLL_MIN_SECONDS,
+                                                ADAPTIVE_POLL_MAX_SECONDS, initial_seconds)
+    
+    def get_source_state(self, source: str):
+        return self.source_manager.get_source_state(source)
+    
+    def get_source_states(self):
+        return self.source_manager.get_source_states()
+    
     # Delegate methods to TaskManager
     def add_scheduled_task(self, name: str, task_type_names: list, interval_type: str, 
-                          interval_value: int, time_of_day: str = None, group_ids: list = None):
-        return self.task_manager.add_scheduled_task(name, task_type_names, interval_type, interval_value, time_of_day, group_ids)
+                          interval_value: int, time_of_day: str = None, group_ids: list = None,
+                          cron_expression: str = None, overlap_policy: str = None, timeout_seconds: int = None):
+        return self.task_manager.add_scheduled_task(name, task_type_names, interval_type, interval_value, time_of_day,
+                                                    group_ids, cron_expression, overlap_policy, timeout_seconds)
     
     def get_all_scheduled_tasks(self):
         return self.task_manager.get_all_scheduled_tasks()
@@ -88,7 +287,9 @@ class DatabaseManager:
         return self.task_manager.get_all_task_types()
     
     def initialize_task_types(self):
-        return self.task_manager.initialize_task_types()
+        # Реестр импортируется здесь: он загружает парсер страниц, который не нужен админке
+        from utils.task_registry import task_registry
+        return self.task_manager.initialize_task_types(task_registry.definitions())
     
     def get_task_groups(self, task_id: int):
         return self.task_manager.get_task_groups(task_id)
@@ -96,13 +297,31 @@ class DatabaseManager:
     def deactivate_scheduled_task(self, task_id: int) -> bool:
         return self.task_manager.deactivate_scheduled_task(task_id)
     
+    def get_scheduled_task(self, task_id: int):
+        return self.task_manager.get_scheduled_task(task_id)
+    
+    def record_task_run_event(self, task_id: int, event: str) -> bool:
+        return self.task_manager.record_task_run_event(task_id, event)
+    
+    def get_last_task_change_id(self) -> int:
+        return self.task_manager.get_last_task_change_id()
+    
+    def get_task_changes_since(self, change_id: int) -> list:
+        return self.task_manager.get_task_changes_since(change_id)
+    
+    def has_database_changes(self) -> bool:
+        return self.data_version.changed()
+    
     def update_scheduled_task(self, task_id: int, name: str, task_type_names: list, 
-                             interval_type: str, interval_value: int, time_of_day: str = None):
-        return self.task_manager.update_scheduled_task(task_id, name, task_type_names, interval_type, interval_value, time_of_day)
+                             interval_type: str, interval_value: int, time_of_day: str = None,
+                             cron_expression: str = None, overlap_policy: str = None, timeout_seconds: int = None):
+        return self.task_manager.update_scheduled_task(task_id, name, task_type_names, interval_type, interval_value,
+                                                       time_of_day, cron_expression, overlap_policy, timeout_seconds)
     
     # Delegate methods to NotificationManager
-    def add_notification(self, event_type: str, event_id: int, group_id: str, message: str, is_duplicate: bool = False):
-        return self.notification_manager.add_notification(event_type, event_id, group_id, message, is_duplicate)
+    def add_notification(self, event_type: str, event_id: int, group_id: str, message: str, is_duplicate: bool = False,
+                         match_details: list = None):
+        return self.notification_manager.add_notification(event_type, event_id, group_id, message, is_duplicate, match_details)
     
     def get_notifications(self, limit: int = 100):
         return self.notification_manager.get_notifications(limit)
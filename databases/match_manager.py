@@ -0,0 +1,127 @@
+from databases.base_manager import BaseManager
+from sqlalchemy.orm import Session
+from typing import List, Optional, Tuple
+from databases.models import OutageGroupMatch, Outage, Group, Delivery
+import logging
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import SQLAlchemyError
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Размер пачки ID в условии IN (ограничение числа параметров SQLite)
+ID_BATCH_SIZE = 500
+
+class MatchManager(BaseManager):
+    """Менеджер для работы с сохранёнными совпадениями отключений и групп"""
+
+    def _existing_pairs(self, session: Session, outage_ids: List[int]) -> set:
+        """Пары (ID отключения, ID группы), уже сохранённые для отключений (внутренний метод)"""
+        pairs = set()
+        for start in range(0, len(outage_ids), ID_BATCH_SIZE):
+            batch = outage_ids[start:start + ID_BATCH_SIZE]
+            pairs.update(session.query(OutageGroupMatch.outage_id, OutageGroupMatch.group_id).filter(
+                OutageGroupMatch.outage_id.in_(batch)
+            ).all())
+        return pairs
+
+    def add_matches(self, matches: List[dict]) -> int:
+        """Сохранение совпадений новых отключений (уже сохранённые пары пропускаются)"""
+        if not matches:
+            return 0
+        with self.session_manager as session:
+            try:
+                existing = self._existing_pairs(session, list({match['outage_id'] for match in matches}))
+                new_matches = [
+                    OutageGroupMatch(**match)
+                    for match in matches
+                    if (match['outage_id'], match['group_id']) not in existing
+                ]
+                session.add_all(new_matches)
+                logger.info(f"Сохранено {len(new_matches)} совпадений отключений с группами")
+                return len(new_matches)
+            except SQLAlchemyError as e:
+                logger.error(f"Ошибка при сохранении совпадений: {e}")
+                raise
+
+    def replace_group_matches(self, group_id: int, matches: List[dict]) -> int:
+        """Замена неотправленных совпадений группы после изменения её адресов"""
+        with self.session_manager as session:
+            try:
+                # Совпадения из журнала доставок остаются, чтобы группа не получила их повторно
+                delivered_outage_ids = session.query(Delivery.outage_id).filter(Delivery.group_id == group_id)
+                notified_outage_ids = {outage_id for (outage_id,) in delivered_outage_ids.all()}
+                deleted_count = session.query(OutageGroupMatch).filter(
+                    and_(
+                        OutageGroupMatch.group_id == group_id,
+                        OutageGroupMatch.outage_id.notin_(delivered_outage_ids.scalar_subquery())
+                    )
+                ).delete(synchronize_session=False)
+                new_matches = [
+                    OutageGroupMatch(**match)
+                    for match in matches
+                    if match['outage_id'] not in notified_outage_ids
+                ]
+                session.add_all(new_matches)
+                logger.info(f"Обновлены совпадения группы с ID {group_id}: удалено {deleted_count}, добавлено {len(new_matches)}")
+                return len(new_matches)
+            except SQLAlchemyError as e:
+                logger.error(f"Ошибка при обновлении совпадений группы с ID {group_id}: {e}")
+                raise
+
+    def get_pending_matches(self, group_ids: Optional[List[int]] = None) -> List[Tuple[OutageGroupMatch, Outage, Group]]:
+        """
+        Получение совпадений активных групп, которых нет в журнале доставок.
+
+        Анти-соединение с журналом по индексу (ID отключения, ID группы)
+        отбрасывает пары, уже поставленные в очередь или доставленные,
+        поэтому повторный запуск задачи не отправит их второй раз.
+        """
+        # Импорт здесь: менеджер отключений сам импортирует этот модуль
+        from databases.outage_manager import OUTAGE_ACTIVE
+        with self.session_manager as session:
+            try:
+                query = session.query(OutageGroupMatch, Outage, Group).join(
+                    Outage, Outage.id == OutageGroupMatch.outage_id
+                ).join(
+                    Group, Group.id == OutageGroupMatch.group_id
+                ).outerjoin(
+                    Delivery, and_(
+                        Delivery.outage_id == OutageGroupMatch.outage_id,
+                        Delivery.group_id == OutageGroupMatch.group_id
+                    )
+                ).filter(
+                    and_(
+                        Delivery.id.is_(None),
+                        # Отменённые и завершённые отключения не отправляются (NULL - до учёта изменений)
+                        or_(Outage.status.is_(None), Outage.status == OUTAGE_ACTIVE),
+                        Group.is_active == True
+                    )
+                )
+
+                if group_ids is None:
+                    rows = query.all()
+                else:
+                    rows = []
+                    for start in range(0, len(group_ids), ID_BATCH_SIZE):
+                        batch = group_ids[start:start + ID_BATCH_SIZE]
+                        rows.extend(query.filter(OutageGroupMatch.group_id.in_(batch)).all())
+                rows.sort(key=lambda row: (row[0].group_id, row[0].outage_id))
+
+                # Принудительно загружаем атрибуты и отсоединяем объекты от сессии
+                # (одно отключение и одна группа встречаются в нескольких строках)
+                detached = set()
+                for match, outage, group in rows:
+                    _ = match.id
+                    _ = match.address_index
+                    _ = match.method
+                    _ = match.score
+                    _ = match.group_address
+                    for obj in (match, outage, group):
+                        if id(obj) not in detached:
+                            session.expunge(obj)
+                            detached.add(id(obj))
+                return [tuple(row) for row in rows]
+            except SQLAlchemyError as e:
+                logger.error(f"Ошибка при получении неотправленных совпадений: {e}")
+                raise
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Boolean, ForeignKey, Table, Index
+from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Boolean, Float, ForeignKey, Table, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship, backref
 from datetime import datetime
@@ -25,8 +25,12 @@ class Group(Base):
     group_id = Column(String(50), unique=True, nullable=False, index=True)  # ID группы в Telegram
     name = Column(String(100), nullable=False)  # Название группы
     addresses = Column(Text) # Адреса, которые отслеживает группа (JSON)
+    street_ids = Column(Text)  # ID улиц из справочника для каждого адреса (JSON)
     is_active = Column(Boolean, default=True, index=True)
+    delivery_mode = Column(String(20), default='immediate')  # Режим доставки: immediate, hourly или daily (сводка плановых отключений)
+    digest_sent_at = Column(DateTime)  # Время последней сводки (UTC)
     created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # Время последнего изменения
     
     # Связь с запланированными задачами
     scheduled_tasks = relationship("ScheduledTask", secondary="task_groups", back_populates="groups")
@@ -47,9 +51,13 @@ class Outage(Base):
     reason = Column(String(200))  # Причина
     start_time = Column(String(50))  # Время начала
     end_time = Column(String(50))  # Время окончания
+    starts_at = Column(DateTime, index=True)  # Время начала, разобранное из start_time (местное время)
     created_at = Column(DateTime, default=datetime.utcnow, index=True)
     notified = Column(Boolean, default=False, index=True)  # Отправлено ли уведомление
+    matched = Column(Boolean, default=False, index=True)  # Сопоставлено ли с адресами групп
     content_hash = Column(String(64), unique=True, index=True)  # Хэш содержимого для проверки дубликатов
+    identity_key = Column(String(64), index=True)  # Стабильный ключ: место и время начала (не меняется при правках)
+    status = Column(String(20), default='active', index=True)  # active, cancelled, resolved (NULL - до учёта изменений)
     
     def __repr__(self):
         return f'<Outage(district={self.district}, resource={self.resource})>'
@@ -91,9 +99,15 @@ class ScheduledTask(Base):
     
     id = Column(Integer, primary_key=True)
     name = Column(String(100), nullable=False, index=True)  # Название задачи
-    interval_type = Column(String(20), nullable=False, index=True)  # Тип интервала (minute, hour, day, week, month)
+    interval_type = Column(String(20), nullable=False, index=True)  # Тип интервала (minute, hour, day, week, month, cron, adaptive)
     interval_value = Column(Integer, nullable=False)  # Значение интервала
     time_of_day = Column(String(10), index=True)  # Время суток для выполнения (HH:MM)
+    cron_expression = Column(String(100))  # Cron-выражение для типа интервала cron
+    overlap_policy = Column(String(20))  # Запуск во время выполнения предыдущего: skip, coalesce, queue (None - из конфигурации)
+    timeout_seconds = Column(Integer)  # Предельное время выполнения (None - из конфигурации)
+    skipped_runs = Column(Integer, default=0)  # Число пропущенных из-за наложения запусков
+    coalesced_runs = Column(Integer, default=0)  # Число запусков, объединённых с отложенным запуском
+    timed_out_runs = Column(Integer, default=0)  # Число запусков, прерванных по предельному времени
     is_active = Column(Boolean, default=True, index=True)
     last_run = Column(DateTime, index=True)  # Последний запуск
     created_at = Column(DateTime, default=datetime.utcnow, index=True)
@@ -107,6 +121,18 @@ class ScheduledTask(Base):
     def __repr__(self):
         return f'<ScheduledTask(name={self.name})>'
 
+class TaskChange(Base):
+    """Модель записи журнала изменений запланированных задач"""
+    __tablename__ = 'task_changes'
+    
+    id = Column(Integer, primary_key=True)
+    task_id = Column(Integer, nullable=False, index=True)  # ID изменённой задачи
+    action = Column(String(20), nullable=False)  # Тип изменения (add, update, deactivate)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f'<TaskChange(task_id={self.task_id}, action={self.action})>'
+
 class Notification(Base):
     """Модель уведомления"""
     __tablename__ = 'notifications'
@@ -118,6 +144,201 @@ class Notification(Base):
     message = Column(Text)  # Текст уведомления
     sent_at = Column(DateTime, default=datetime.utcnow, index=True)  # Время отправки
     is_duplicate = Column(Boolean, default=False, index=True)  # Является ли дубликатом
+    match_details = Column(Text)  # Объяснения совпадения адресов (JSON)
+    
+    def __repr__(self):
+        return f'<Notification(event_type={self.event_type}, group_id={self.group_id})>'
+
+class Street(Base):
+    """Модель улицы из справочника улиц"""
+    __tablename__ = 'streets'
+    
+    id = Column(Integer, primary_key=True)
+    canonical_key = Column(String(200), unique=True, nullable=False, index=True)  # Канонический ключ улицы
+    name = Column(String(200), nullable=False)  # Название улицы при первой регистрации
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f'<Street(canonical_key={self.canonical_key})>'
+
+class StreetAlias(Base):
+    """Модель псевдонима улицы (другое написание той же улицы)"""
+    __tablename__ = 'street_aliases'
+    
+    id = Column(Integer, primary_key=True)
+    alias_key = Column(String(200), unique=True, nullable=False, index=True)  # Канонический ключ псевдонима
+    street_id = Column(Integer, ForeignKey('streets.id', ondelete='CASCADE'), nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<StreetAlias(alias_key={self.alias_key}, street_id={self.street_id})>'
+
+class OutageGroupMatch(Base):
+    """Модель совпадения отключения с группой"""
+    __tablename__ = 'outage_group_matches'
+    __table_args__ = (
+        UniqueConstraint('outage_id', 'group_id', name='uq_outage_group_match'),
+        Index('idx_match_group_outage', 'group_id', 'outage_id'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    outage_id = Column(Integer, ForeignKey('outages.id', ondelete='CASCADE'), nullable=False, index=True)
+    group_id = Column(Integer, ForeignKey('groups.id', ondelete='CASCADE'), nullable=False, index=True)
+    address_index = Column(Integer)  # Номер совпавшего адреса в адресах отключения (None - все адреса)
+    method = Column(String(20), nullable=False)  # Способ совпадения (exact, street_id, substring, fuzzy, all)
+    score = Column(Float, default=1.0)  # Похожесть улиц
+    group_address = Column(String(200))  # Совпавший адрес группы
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f'<OutageGroupMatch(outage_id={self.outage_id}, group_id={self.group_id})>'
+
+class OutboxMessage(Base):
+    """Модель сообщения в очереди отправки (outbox)"""
+    __tablename__ = 'outbox'
+    __table_args__ = (
+        Index('idx_outbox_status_chat', 'status', 'chat_id', 'id'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(String(50), nullable=False, index=True)  # ID группы в Telegram
+    event_type = Column(String(50), nullable=False, default='outage')  # Тип события для истории уведомлений
+    body = Column(Text, nullable=False)  # Готовый HTML-текст сообщения
+    edit_message_id = Column(Integer)  # ID сообщения Telegram, которое изменяется вместо отправки нового
+    fallback_body = Column(Text)  # Текст нового сообщения, если изменить сообщение уже нельзя
+    match_ids = Column(Text)  # ID совпадений, доставляемых этим сообщением (JSON)
+    outage_ids = Column(Text)  # ID отключений в сообщении (JSON)
+    match_details = Column(Text)  # Объяснения совпадения адресов (JSON)
+    status = Column(String(20), nullable=False, default='pending', index=True)  # pending, sent, failed
+    priority = Column(Integer, index=True)  # Приоритет доставки (меньше - раньше): аварийные, скорые, плановые
+    attempts = Column(Integer, default=0)  # Число неудачных попыток отправки
+    last_error = Column(Text)  # Текст последней ошибки
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, index=True)  # Время следующей попытки
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    sent_at = Column(DateTime)  # Время подтверждения отправки Telegram
+    
+    def __repr__(self):
+        return f'<OutboxMessage(chat_id={self.chat_id}, status={self.status})>'
+
+class Delivery(Base):
+    """Модель доставки отключения группе (журнал доставок)"""
+    __tablename__ = 'deliveries'
+    __table_args__ = (
+        UniqueConstraint('outage_id', 'group_id', name='uq_delivery_outage_group'),
+        Index('idx_delivery_group_outage', 'group_id', 'outage_id'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    outage_id = Column(Integer, ForeignKey('outages.id', ondelete='CASCADE'), nullable=False)
+    group_id = Column(Integer, ForeignKey('groups.id', ondelete='CASCADE'), nullable=False)
+    status = Column(String(20), nullable=False, default='queued', index=True)  # queued, sent
+    outbox_id = Column(Integer, ForeignKey('outbox.id', ondelete='SET NULL'), index=True)  # Сообщение очереди, которым доставляется отключение
+    message_id = Column(Integer)  # ID сообщения в Telegram
+    notification_id = Column(Integer, ForeignKey('notifications.id', ondelete='SET NULL'))  # Запись истории уведомлений
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    sent_at = Column(DateTime)  # Время подтверждения отправки Telegram
+    
+    def __repr__(self):
+        return f'<Delivery(outage_id={self.outage_id}, group_id={self.group_id}, status={self.status})>'
+
+class Reminder(Base):
+    """Модель напоминания о скором отключении (журнал напоминаний)"""
+    __tablename__ = 'reminders'
+    __table_args__ = (
+        UniqueConstraint('outage_id', 'group_id', 'offset_minutes', name='uq_reminder_outage_group_offset'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    outage_id = Column(Integer, ForeignKey('outages.id', ondelete='CASCADE'), nullable=False)
+    group_id = Column(Integer, ForeignKey('groups.id', ondelete='CASCADE'), nullable=False, index=True)
+    offset_minutes = Column(Integer, nullable=False)  # За сколько минут до начала отключения напоминание
+    status = Column(String(20), nullable=False, default='queued', index=True)  # queued, sent
+    outbox_id = Column(Integer, ForeignKey('outbox.id', ondelete='SET NULL'), index=True)  # Сообщение очереди с напоминанием
+    message_id = Column(Integer)  # ID сообщения в Telegram
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    sent_at = Column(DateTime)  # Время подтверждения отправки Telegram
+    
+    def __repr__(self):
+        return f'<Reminder(outage_id={self.outage_id}, group_id={self.group_id}, offset_minutes={self.offset_minutes})>'
+
+class OutageEvent(Base):
+    """Модель события изменения отключения между проверками страницы"""
+    __tablename__ = 'outage_events'
+    
+    id = Column(Integer, primary_key=True)
+    outage_id = Column(Integer, ForeignKey('outages.id', ondelete='CASCADE'), nullable=False, index=True)
+    event_type = Column(String(20), nullable=False, index=True)  # new, updated, cancelled, resolved
+    changes = Column(Text)  # Изменённые поля: {поле: [старое значение, новое значение]} (JSON)
+    notified = Column(Boolean, default=False, index=True)  # Обработано ли событие для уведомления групп
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f'<OutageEvent(outage_id={self.outage_id}, event_type={self.event_type})>'
+
+class SourceState(Base):
+    """Модель состояния источника данных для адаптивного опроса"""
+    __tablename__ = 'source_states'
+    
+    id = Column(Integer, primary_key=True)
+    source = Column(String(200), nullable=False, unique=True)  # Ключ источника (например, outages)
+    content_digest = Column(String(64))  # Хэш содержимого при последней проверке
+    change_rate = Column(Float, default=0.0)  # Доля проверок с изменениями (экспоненциальное среднее)
+    interval_seconds = Column(Integer)  # Текущий интервал опроса
+    interval_reason = Column(String(200))  # Причина выбора текущего интервала
+    unchanged_checks = Column(Integer, default=0)  # Число проверок подряд без изменений
+    checks_count = Column(Integer, default=0)  # Всего проверок
+    changes_count = Column(Integer, default=0)  # Проверок с изменениями
+    last_checked_at = Column(DateTime)  # Время последней проверки
+    last_changed_at = Column(DateTime)  # Время последнего изменения содержимого
+    
+    def __repr__(self):
+        return f'<SourceState(source={self.source}, interval_seconds={self.interval_seconds})>'
+
+class Lease(Base):
+    """Модель аренды лидерства (выбор ведущего процесса бота)"""
+    __tablename__ = 'leases'
+    
+    id = Column(Integer, primary_key=True)
+    name = Column(String(50), nullable=False, unique=True)  # Имя аренды (например, scheduler)
+    holder = Column(String(200))  # Идентификатор процесса-владельца
+    token = Column(Integer, nullable=False, default=0)  # Токен ограждения, растёт при каждой смене владельца
+    expires_at = Column(DateTime, nullable=False)  # Время окончания аренды без продления
+    acquired_at = Column(DateTime)  # Время захвата аренды текущим владельцем
+    renewed_at = Column(DateTime)  # Время последнего продления
+    
+    def __repr__(self):
+        return f'<Lease(name={self.name}, holder={self.holder}, token={self.token})>'
+
+class TaskRun(Base):
+    """Модель запуска задачи с длительностями этапов (история запусков)"""
+    __tablename__ = 'task_runs'
+    __table_args__ = (
+        Index('idx_task_run_task_started', 'task_id', 'started_at'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    task_id = Column(Integer, nullable=False)  # ID запланированной задачи
+    task_name = Column(String(100))  # Название задачи на момент запуска
+    started_at = Column(DateTime, nullable=False, index=True)
+    finished_at = Column(DateTime)
+    outcome = Column(String(20), nullable=False, index=True)  # ok, error, cancelled
+    error = Column(Text)  # Текст ошибки
+    total_seconds = Column(Float)  # Длительность запуска
+    # Длительности этапов (в секундах)
+    fetch_seconds = Column(Float)
+    parse_seconds = Column(Float)
+    dedupe_seconds = Column(Float)  # Хэширование и поиск уже сохранённых отключений
+    ingest_seconds = Column(Float)
+    match_seconds = Column(Float)
+    render_seconds = Column(Float)
+    send_seconds = Column(Float)  # Постановка в очередь и отправка в Telegram
+    mark_seconds = Column(Float)
+    # Объём работы
+    bytes_fetched = Column(Integer)
+    rows_parsed = Column(Integer)
+    rows_new = Column(Integer)
+    matches_count = Column(Integer)
+    messages_count = Column(Integer)
+    sent_count = Column(Integer)
     
     def __repr__(self):
-        return f'<Notification(event_type={self.event_type}, group_id={self.group_id})>'
\ No newline at end of file
+        return f'<TaskRun(task_id={self.task_id}, outcome={self.outcome}, total_seconds={self.total_seconds})>'
@@ -4,6 +4,7 @@ from typing import List, Optional
 from datetime import datetime
 from databases.models import Notification
 import logging
+import json
 from sqlalchemy import desc
 from sqlalchemy.exc import SQLAlchemyError
 
@@ -13,7 +14,8 @@ logger = logging.getLogger(__name__)
 class NotificationManager(BaseManager):
     """Менеджер для работы с уведомлениями"""
     
-    def add_notification(self, event_type: str, event_id: int, group_id: str, message: str, is_duplicate: bool = False) -> Notification:
+    def add_notification(self, event_type: str, event_id: int, group_id: str, message: str, is_duplicate: bool = False,
+                         match_details: Optional[List[dict]] = None) -> Notification:
         """Добавление записи об уведомлении"""
         with self.session_manager as session:
             try:
@@ -22,7 +24,8 @@ class NotificationManager(BaseManager):
                     event_id=event_id,
                     group_id=group_id,
                     message=message,
-                    is_duplicate=is_duplicate
+                    is_duplicate=is_duplicate,
+                    match_details=json.dumps(match_details, ensure_ascii=False) if match_details else None
                 )
                 session.add(notification)
                 session.flush()  # Принудительно записываем в БД, но не коммитим транзакцию
@@ -34,6 +37,7 @@ class NotificationManager(BaseManager):
                 _ = notification.message
                 _ = notification.sent_at
                 _ = notification.is_duplicate
+                _ = notification.match_details
                 # Отсоединяем объект от сессии, чтобы избежать DetachedInstanceError
                 session.expunge(notification)
                 logger.info(f"Добавлено уведомление типа {event_type} для группы {group_id}")
@@ -57,6 +61,7 @@ class NotificationManager(BaseManager):
                     _ = notification.message
                     _ = notification.sent_at
                     _ = notification.is_duplicate
+                    _ = notification.match_details
                     # Отсоединяем объект от сессии, чтобы избежать DetachedInstanceError
                     session.expunge(notification)
                 logger.info(f"Получено {len(notifications)} последних уведомлений")
@@ -80,6 +85,7 @@ class NotificationManager(BaseManager):
                     _ = notification.message
                     _ = notification.sent_at
                     _ = notification.is_duplicate
+                    _ = notification.match_details
                     # Отсоединяем объект от сессии, чтобы избежать DetachedInstanceError
                     session.expunge(notification)
                 logger.info(f"Получено {len(notifications)} уведомлений типа {event_type}")
@@ -102,6 +108,7 @@ class NotificationManager(BaseManager):
                     _ = notification.message
                     _ = notification.sent_at
                     _ = notification.is_duplicate
+                    _ = notification.match_details
                     logger.info(f"Получено уведомление с ID {notification_id}")
                     # Отсоединяем объект от сессии после завершения запроса
                     session.expunge(notification)
@@ -127,6 +134,7 @@ class NotificationManager(BaseManager):
                     _ = notification.message
                     _ = notification.sent_at
                     _ = notification.is_duplicate
+                    _ = notification.match_details
                     # Отсоединяем объект от сессии, чтобы избежать DetachedInstanceError
                     session.expunge(notification)
                 logger.info(f"Получено {len(notifications)} уведомлений для группы {group_id}")
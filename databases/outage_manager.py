@@ -1,91 +1,218 @@
 from databases.base_manager import BaseManager
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from datetime import datetime
-from databases.models import Outage
+from databases.models import Outage, OutageEvent, Delivery
 import logging
 import json
-from sqlalchemy import and_, desc
+from sqlalchemy import and_, or_, desc, func
 from sqlalchemy.exc import SQLAlchemyError
 
 # Импортируем функцию для генерации хэша
-from utils.outage_hash import generate_outage_hash
+from utils.outage_hash import generate_outage_hash, generate_outage_identity, generate_outage_place_key, is_cancelled_outage
+from utils.run_timer import stage, count
+from utils.outage_time import parse_outage_time
+from databases.match_manager import ID_BATCH_SIZE
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
 
+# Статусы отключений
+OUTAGE_ACTIVE = 'active'
+OUTAGE_CANCELLED = 'cancelled'
+OUTAGE_RESOLVED = 'resolved'
+
+# Типы событий изменения отключений
+EVENT_NEW = 'new'
+EVENT_UPDATED = 'updated'
+EVENT_CANCELLED = 'cancelled'
+EVENT_RESOLVED = 'resolved'
+
+# Поля отключения вне стабильного ключа (поле модели, ключ строки страницы), изменения которых сравниваются
+OUTAGE_DIFF_FIELDS = (('start_time', 'start'), ('end_time', 'end'), ('reason', 'reason'), ('phone', 'phone'))
+
 class OutageManager(BaseManager):
     """Менеджер для работы с отключениями"""
     
-    def add_outages(self, outages_data: List[dict]) -> List[Outage]:
-        """Добавление новых отключений"""
+    def _load_outage(self, session: Session, outage: Outage) -> Outage:
+        """Принудительная загрузка атрибутов и отсоединение отключения от сессии (внутренний метод)"""
+        _ = outage.id
+        _ = outage.district
+        _ = outage.resource
+        _ = outage.organization
+        _ = outage.phone
+        _ = outage.addresses
+        _ = outage.reason
+        _ = outage.start_time
+        _ = outage.end_time
+        _ = outage.starts_at
+        _ = outage.identity_key
+        _ = outage.status
+        _ = outage.created_at
+        _ = outage.notified
+        _ = outage.content_hash
+        _ = outage.matched
+        # Отсоединяем объект от сессии, чтобы избежать DetachedInstanceError
+        session.expunge(outage)
+        return outage
+    
+    @staticmethod
+    def _outage_data(outage: Outage) -> dict:
+        """Данные сохранённого отключения в виде строки страницы (внутренний метод)"""
+        return {
+            'district': outage.district,
+            'resource': outage.resource,
+            'organization': outage.organization,
+            'addresses': json.loads(outage.addresses) if outage.addresses else [],
+            'start': outage.start_time
+        }
+    
+    @staticmethod
+    def _apply_changes(outage: Outage, data: dict, content_hash: str) -> dict:
+        """Перенос изменённых полей строки страницы в отключение; возвращает {поле: [было, стало]} (внутренний метод)"""
+        changes = {}
+        for field, key in OUTAGE_DIFF_FIELDS:
+            old_value, new_value = getattr(outage, field) or '', data.get(key, '') or ''
+            if old_value != new_value:
+                changes[field] = [old_value, new_value]
+                setattr(outage, field, new_value)
+        addresses_json = json.dumps(data.get('addresses', []))
+        if outage.addresses != addresses_json:
+            # Порядок адресов или ID улиц не меняют ключ отключения и не показываются группам
+            outage.addresses = addresses_json
+        outage.starts_at = parse_outage_time(data.get('start'))
+        outage.content_hash = content_hash
+        return changes
+    
+    def add_outages(self, outages_data: List[dict], timer=None) -> List[Outage]:
+        """
+        Добавление отключений из очередной проверки страницы.
+        
+        Уже сохранённые отключения находятся по хэшу содержимого пачками
+        запросов IN. Снимок страницы сравнивается с предыдущим (действующими
+        отключениями) по стабильному ключу как множества: новые ключи
+        добавляются, совпавшие ключи с другим содержимым обновляются на
+        месте, отключения с «отмена» вместо времени становятся отменёнными,
+        а пропавшие со страницы - завершёнными. Каждое изменение
+        записывается событием в outage_events. С таймером замеряются этапы
+        dedupe (хэширование и сравнение снимков) и ingest (запись).
+        """
         with self.session_manager as session:
             try:
-                outages = []
-                new_outages_count = 0
-                existing_outages_count = 0
+                with stage(timer, 'dedupe'):
+                    # Генерируем хэши для проверки дубликатов и ключи для сравнения снимков
+                    content_hashes = [generate_outage_hash(data) for data in outages_data]
+                    identity_keys = [generate_outage_identity(data) for data in outages_data]
+                    unique_hashes = list(dict.fromkeys(content_hashes))
+                    known = {}
+                    for start in range(0, len(unique_hashes), ID_BATCH_SIZE):
+                        batch = unique_hashes[start:start + ID_BATCH_SIZE]
+                        for outage in session.query(Outage).filter(Outage.content_hash.in_(batch)).all():
+                            known[outage.content_hash] = outage
+                    existing_hashes = set(known)
+                    # Предыдущий снимок - отключения, действующие после прошлой проверки
+                    previous = {
+                        outage.identity_key: outage
+                        for outage in session.query(Outage).filter(Outage.status == OUTAGE_ACTIVE).all()
+                    }
+                    previous_places = {}
+                    for identity_key, outage in previous.items():
+                        previous_places.setdefault(generate_outage_place_key(self._outage_data(outage)), []).append(identity_key)
                 
-                for data in outages_data:
-                    # Генерируем хэш для проверки дубликатов
-                    content_hash = generate_outage_hash(data)
+                with stage(timer, 'ingest'):
+                    new_outages = []
+                    events = []
+                    seen = set()
+                    for data, content_hash, identity_key in zip(outages_data, content_hashes, identity_keys):
+                        outage = known.get(content_hash)
+                        if outage is not None:
+                            if outage.status is None:
+                                # Отключение, сохранённое до учёта изменений, становится частью снимка
+                                outage.identity_key = identity_key
+                                outage.status = OUTAGE_CANCELLED if is_cancelled_outage(data) else OUTAGE_ACTIVE
+                            elif outage.status == OUTAGE_RESOLVED:
+                                # Отключение вернулось на страницу без изменений
+                                outage.status = OUTAGE_ACTIVE
+                            seen.add(outage.identity_key)
+                            continue
+                        
+                        if is_cancelled_outage(data):
+                            # Вместо времени указано «отмена»: отменяется действующее отключение в том же месте
+                            place_keys = [
+                                key for key in previous_places.get(generate_outage_place_key(data), [])
+                                if key not in seen and previous[key].status == OUTAGE_ACTIVE
+                            ]
+                            if place_keys:
+                                outage = previous[place_keys[0]]
+                                outage.status = OUTAGE_CANCELLED
+                                seen.add(outage.identity_key)
+                                events.append(OutageEvent(outage_id=outage.id, event_type=EVENT_CANCELLED))
+                                known[content_hash] = outage
+                                continue
+                        elif identity_key in previous and identity_key not in seen:
+                            outage = previous[identity_key]
+                            changes = self._apply_changes(outage, data, content_hash)
+                            seen.add(identity_key)
+                            known[content_hash] = outage
+                            if changes:
+                                events.append(OutageEvent(
+                                    outage_id=outage.id,
+                                    event_type=EVENT_UPDATED,
+                                    changes=json.dumps(changes, ensure_ascii=False)
+                                ))
+                            continue
+                        
+                        addresses_json = json.dumps(data.get('addresses', []))
+                        outage = Outage(
+                            district=data.get('district', ''),
+                            resource=data.get('resource', ''),
+                            organization=data.get('organization', ''),
+                            phone=data.get('phone', ''),
+                            addresses=addresses_json,
+                            reason=data.get('reason', ''),
+                            start_time=data.get('start', ''),
+                            end_time=data.get('end', ''),
+                            starts_at=parse_outage_time(data.get('start')),
+                            content_hash=content_hash,
+                            identity_key=identity_key,
+                            # Отмена неизвестного отключения сохраняется, но группам не отправляется
+                            status=OUTAGE_CANCELLED if is_cancelled_outage(data) else OUTAGE_ACTIVE
+                        )
+                        # Повтор записи в тех же данных считается уже существующим отключением
+                        known[content_hash] = outage
+                        seen.add(identity_key)
+                        new_outages.append(outage)
                     
-                    # Проверяем, существует ли уже отключение с таким хэшем
-                    existing_outage = session.query(Outage).filter(Outage.content_hash == content_hash).first()
-                    if existing_outage:
-                        logger.info(f"Отключение уже существует в базе данных (хэш: {content_hash[:8]}...)")
-                        # Принудительно загружаем атрибуты, чтобы они были доступны после закрытия сессии
-                        _ = existing_outage.id
-                        _ = existing_outage.district
-                        _ = existing_outage.resource
-                        _ = existing_outage.organization
-                        _ = existing_outage.phone
-                        _ = existing_outage.addresses
-                        _ = existing_outage.reason
-                        _ = existing_outage.start_time
-                        _ = existing_outage.end_time
-                        _ = existing_outage.created_at
-                        _ = existing_outage.notified
-                        _ = existing_outage.content_hash
-                        # Отсоединяем объект от сессии, чтобы избежать DetachedInstanceError
-                        session.expunge(existing_outage)
-                        outages.append(existing_outage)
-                        existing_outages_count += 1
-                        continue
+                    # Пустой снимок - скорее сбой страницы, чем завершение всех отключений
+                    resolved = [
+                        outage for identity_key, outage in previous.items()
+                        if identity_key not in seen and outage.status == OUTAGE_ACTIVE
+                    ] if outages_data else []
+                    for outage in resolved:
+                        outage.status = OUTAGE_RESOLVED
+                        events.append(OutageEvent(outage_id=outage.id, event_type=EVENT_RESOLVED))
                     
-                    addresses_json = json.dumps(data.get('addresses', []))
-                    outage = Outage(
-                        district=data.get('district', ''),
-                        resource=data.get('resource', ''),
-                        organization=data.get('organization', ''),
-                        phone=data.get('phone', ''),
-                        addresses=addresses_json,
-                        reason=data.get('reason', ''),
-                        start_time=data.get('start', ''),
-                        end_time=data.get('end', ''),
-                        content_hash=content_hash
-                    )
-                    session.add(outage)
+                    session.add_all(new_outages)
                     # Принудительно записываем в БД, но не коммитим транзакцию, чтобы получить ID
                     session.flush()
-                    # Принудительно загружаем атрибуты, чтобы они были доступны после закрытия сессии
-                    _ = outage.id
-                    _ = outage.district
-                    _ = outage.resource
-                    _ = outage.organization
-                    _ = outage.phone
-                    _ = outage.addresses
-                    _ = outage.reason
-                    _ = outage.start_time
-                    _ = outage.end_time
-                    _ = outage.created_at
-                    _ = outage.notified
-                    _ = outage.content_hash
-                    # Отсоединяем объект от сессии, чтобы избежать DetachedInstanceError
-                    session.expunge(outage)
-                    outages.append(outage)
-                    new_outages_count += 1
+                    # Новые отключения уведомляются через совпадения с группами, их события только фиксируются
+                    events.extend(
+                        OutageEvent(outage_id=outage.id, event_type=EVENT_NEW, notified=True)
+                        for outage in new_outages if outage.status == OUTAGE_ACTIVE
+                    )
+                    session.add_all(events)
+                    session.flush()
+                    # Изменённое отключение записано в known и под старым, и под новым хэшем
+                    for outage in {id(outage): outage for outage in known.values()}.values():
+                        self._load_outage(session, outage)
+                    outages = [known[content_hash] for content_hash in content_hashes]
                 
-                logger.info(f"Добавлено {len(outages)} записей об отключениях ({new_outages_count} новых, {existing_outages_count} существующих)")
+                existing_outages_count = sum(1 for content_hash in content_hashes if content_hash in existing_hashes)
+                count(timer, 'rows_new', len(new_outages))
+                events_count = {}
+                for event in events:
+                    events_count[event.event_type] = events_count.get(event.event_type, 0) + 1
+                logger.info(f"Добавлено {len(outages)} записей об отключениях ({len(new_outages)} новых, {existing_outages_count} существующих), события: {events_count}")
                 return outages
             except SQLAlchemyError as e:
                 logger.error(f"Ошибка при добавлении отключений: {e}")
@@ -111,6 +238,7 @@ class OutageManager(BaseManager):
                     _ = outage.created_at
                     _ = outage.notified
                     _ = outage.content_hash
+                    _ = outage.matched
                     # Отсоединяем объект от сессии, чтобы избежать DetachedInstanceError
                     session.expunge(outage)
                 return outages
@@ -119,6 +247,90 @@ class OutageManager(BaseManager):
                 raise
     
     
+    def get_outages_version(self) -> tuple:
+        """Версия набора текущих отключений: меняется при добавлении отключений и событиях их изменения"""
+        with self.session_manager as session:
+            try:
+                active_count, max_id = session.query(
+                    func.count(Outage.id), func.max(Outage.id)
+                ).filter(Outage.status == OUTAGE_ACTIVE).one()
+                max_event_id = session.query(func.max(OutageEvent.id)).scalar()
+                return active_count, max_id, max_event_id
+            except SQLAlchemyError as e:
+                logger.error(f"Ошибка при получении версии отключений: {e}")
+                raise
+    
+    def get_current_outages(self, limit: int) -> Tuple[int, List[Outage]]:
+        """Число действующих отключений и первые limit из них по времени начала"""
+        with self.session_manager as session:
+            try:
+                query = session.query(Outage).filter(Outage.status == OUTAGE_ACTIVE)
+                total = query.count()
+                outages = query.order_by(
+                    Outage.starts_at.is_(None), Outage.starts_at, Outage.id
+                ).limit(limit).all()
+                return total, [self._load_outage(session, outage) for outage in outages]
+            except SQLAlchemyError as e:
+                logger.error(f"Ошибка при получении текущих отключений: {e}")
+                raise
+    
+    def get_undelivered_active_outages(self, group_id: int) -> List[Outage]:
+        """
+        Действующие отключения, которых нет в журнале доставок группы.
+
+        Используются при пересопоставлении добавленной или изменённой
+        группы: она получает и текущие отключения, уже доставленные другим
+        группам (и поэтому помеченные нотифицированными).
+        """
+        with self.session_manager as session:
+            try:
+                outages = session.query(Outage).outerjoin(
+                    Delivery, and_(Delivery.outage_id == Outage.id, Delivery.group_id == group_id)
+                ).filter(
+                    and_(
+                        Delivery.id.is_(None),
+                        # NULL - отключения, добавленные до учёта изменений
+                        or_(Outage.status.is_(None), Outage.status == OUTAGE_ACTIVE)
+                    )
+                ).all()
+                return [self._load_outage(session, outage) for outage in outages]
+            except SQLAlchemyError as e:
+                logger.error(f"Ошибка при получении действующих отключений для группы с ID {group_id}: {e}")
+                raise
+    
+    def get_unmatched_outages(self) -> List[Outage]:
+        """Получение отключений, ещё не сопоставленных с группами"""
+        with self.session_manager as session:
+            try:
+                outages = session.query(Outage).filter(
+                    # Отключения, добавленные до появления колонки, содержат NULL
+                    Outage.matched.isnot(True)
+                ).all()
+                for outage in outages:
+                    # Принудительно загружаем атрибуты, чтобы они были доступны после закрытия сессии
+                    _ = outage.id
+                    _ = outage.addresses
+                    _ = outage.notified
+                    _ = outage.matched
+                    # Отсоединяем объект от сессии, чтобы избежать DetachedInstanceError
+                    session.expunge(outage)
+                return outages
+            except SQLAlchemyError as e:
+                logger.error(f"Ошибка при получении несопоставленных отключений: {e}")
+                raise
+    
+    def mark_outages_as_matched(self, outage_ids: List[int]) -> bool:
+        """Пометить отключения как сопоставленные с группами"""
+        with self.session_manager as session:
+            try:
+                session.query(Outage).filter(Outage.id.in_(outage_ids)).update(
+                    {Outage.matched: True}, synchronize_session=False
+                )
+                return True
+            except SQLAlchemyError as e:
+                logger.error(f"Ошибка при пометке отключений как сопоставленных: {e}")
+                raise
+    
     def get_outages_by_date_range(self, start_date: datetime, end_date: datetime) -> List[Outage]:
         """Получение отключений в заданном диапазоне дат"""
         with self.session_manager as session:
@@ -144,6 +356,7 @@ class OutageManager(BaseManager):
                     _ = outage.created_at
                     _ = outage.notified
                     _ = outage.content_hash
+                    _ = outage.matched
                     # Отсоединяем объект от сессии, чтобы избежать DetachedInstanceError
                     session.expunge(outage)
                 return outages
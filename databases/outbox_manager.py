@@ -0,0 +1,393 @@
+from databases.base_manager import BaseManager
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from datetime import datetime
+from databases.models import OutboxMessage, OutageGroupMatch, Outage, Group, Notification, Delivery, Reminder, OutageEvent
+from databases.match_manager import ID_BATCH_SIZE
+from databases.lease_manager import check_fencing_token
+from utils.delivery_priority import DEFAULT_PRIORITY
+import logging
+import json
+from sqlalchemy import and_
+from sqlalchemy.exc import SQLAlchemyError
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Статусы сообщений в очереди отправки
+OUTBOX_PENDING = 'pending'
+OUTBOX_SENT = 'sent'
+OUTBOX_FAILED = 'failed'
+
+# Статусы записей журнала доставок
+DELIVERY_QUEUED = 'queued'
+DELIVERY_SENT = 'sent'
+
+# Статусы записей журнала напоминаний
+REMINDER_QUEUED = 'queued'
+REMINDER_SENT = 'sent'
+
+class OutboxManager(BaseManager):
+    """Менеджер для работы с очередью отправки сообщений (outbox)"""
+
+    def _match_pairs(self, session: Session, match_ids: List[int]) -> dict:
+        """Пары (ID отключения, ID группы) совпадений по их ID (внутренний метод)"""
+        pairs = {}
+        for start in range(0, len(match_ids), ID_BATCH_SIZE):
+            batch = match_ids[start:start + ID_BATCH_SIZE]
+            for match_id, outage_id, group_id in session.query(
+                OutageGroupMatch.id, OutageGroupMatch.outage_id, OutageGroupMatch.group_id
+            ).filter(OutageGroupMatch.id.in_(batch)).all():
+                pairs[match_id] = (outage_id, group_id)
+        return pairs
+
+    def _delivered_pairs(self, session: Session, outage_ids: List[int]) -> set:
+        """Пары (ID отключения, ID группы), уже записанные в журнал доставок (внутренний метод)"""
+        pairs = set()
+        for start in range(0, len(outage_ids), ID_BATCH_SIZE):
+            batch = outage_ids[start:start + ID_BATCH_SIZE]
+            pairs.update(session.query(Delivery.outage_id, Delivery.group_id).filter(
+                Delivery.outage_id.in_(batch)
+            ).all())
+        return pairs
+
+    def enqueue_messages(self, messages: List[dict], fencing_token: Optional[int] = None) -> int:
+        """
+        Постановка готовых сообщений в очередь одной транзакцией.
+
+        Каждое сообщение - словарь с chat_id, body, match_ids, outage_ids
+        и match_details. Пары (отключение, группа) из сообщений
+        записываются в журнал доставок, чтобы следующий запуск не подготовил
+        их повторно. Сообщение, все пары которого уже есть в журнале, не
+        ставится в очередь и записывается в историю как дубликат.
+        Устаревший токен ограждения (лидером стал другой процесс) отменяет
+        транзакцию с LeaseLostError.
+        """
+        if not messages:
+            return 0
+        with self.session_manager as session:
+            try:
+                check_fencing_token(session, fencing_token)
+                match_pairs = self._match_pairs(
+                    session, [match_id for message in messages for match_id in message.get('match_ids', [])]
+                )
+                delivered = self._delivered_pairs(session, list({outage_id for outage_id, _ in match_pairs.values()}))
+
+                queued_count = 0
+                for message in messages:
+                    pairs = [match_pairs[match_id] for match_id in message.get('match_ids', []) if match_id in match_pairs]
+                    new_pairs = [pair for pair in dict.fromkeys(pairs) if pair not in delivered]
+                    outage_ids = message.get('outage_ids', [])
+                    if pairs and not new_pairs:
+                        # Повтор уже отправленного или стоящего в очереди уведомления не отправляется
+                        session.add(Notification(
+                            event_type=message.get('event_type', 'outage'),
+                            event_id=outage_ids[0] if outage_ids else None,
+                            group_id=message['chat_id'],
+                            message=message['body'],
+                            is_duplicate=True,
+                            match_details=json.dumps(message['match_details'], ensure_ascii=False) if message.get('match_details') else None
+                        ))
+                        logger.info(f"Повторное уведомление для группы {message['chat_id']} не поставлено в очередь")
+                        continue
+
+                    outbox_message = OutboxMessage(
+                        chat_id=message['chat_id'],
+                        event_type=message.get('event_type', 'outage'),
+                        body=message['body'],
+                        match_ids=json.dumps(message.get('match_ids', [])),
+                        outage_ids=json.dumps(outage_ids),
+                        match_details=json.dumps(message.get('match_details') or [], ensure_ascii=False),
+                        priority=message.get('priority', DEFAULT_PRIORITY),
+                        status=OUTBOX_PENDING
+                    )
+                    session.add(outbox_message)
+                    session.flush()
+                    for outage_id, group_id in new_pairs:
+                        session.add(Delivery(
+                            outage_id=outage_id,
+                            group_id=group_id,
+                            status=DELIVERY_QUEUED,
+                            outbox_id=outbox_message.id
+                        ))
+                        delivered.add((outage_id, group_id))
+                    queued_count += 1
+                logger.info(f"Поставлено в очередь отправки {queued_count} сообщений")
+                return queued_count
+            except SQLAlchemyError as e:
+                logger.error(f"Ошибка при постановке сообщений в очередь отправки: {e}")
+                raise
+
+    def enqueue_reminders(self, messages: List[dict], fencing_token: Optional[int] = None) -> int:
+        """
+        Постановка напоминаний в очередь одной транзакцией.
+        
+        Каждое сообщение - словарь с chat_id, body, outage_ids и reminders
+        (список троек: ID отключения, ID группы, смещение в минутах).
+        Тройки записываются в журнал напоминаний вместе с сообщением, а
+        напоминания, уже записанные в журнал, пропускаются: каждое
+        напоминание отправляется не больше одного раза.
+        """
+        if not messages:
+            return 0
+        with self.session_manager as session:
+            try:
+                check_fencing_token(session, fencing_token)
+                outage_ids = list({outage_id for message in messages for outage_id, _, _ in message['reminders']})
+                existing = set()
+                for start in range(0, len(outage_ids), ID_BATCH_SIZE):
+                    batch = outage_ids[start:start + ID_BATCH_SIZE]
+                    existing.update(session.query(Reminder.outage_id, Reminder.group_id, Reminder.offset_minutes).filter(
+                        Reminder.outage_id.in_(batch)
+                    ).all())
+                
+                queued_count = 0
+                for message in messages:
+                    new_reminders = [reminder for reminder in dict.fromkeys(message['reminders']) if reminder not in existing]
+                    if not new_reminders:
+                        continue
+                    outbox_message = OutboxMessage(
+                        chat_id=message['chat_id'],
+                        event_type='reminder',
+                        body=message['body'],
+                        match_ids=json.dumps([]),
+                        outage_ids=json.dumps(message.get('outage_ids', [])),
+                        match_details=json.dumps([]),
+                        priority=message.get('priority', DEFAULT_PRIORITY),
+                        status=OUTBOX_PENDING
+                    )
+                    session.add(outbox_message)
+                    session.flush()
+                    for outage_id, group_id, offset_minutes in new_reminders:
+                        session.add(Reminder(
+                            outage_id=outage_id,
+                            group_id=group_id,
+                            offset_minutes=offset_minutes,
+                            status=REMINDER_QUEUED,
+                            outbox_id=outbox_message.id
+                        ))
+                        existing.add((outage_id, group_id, offset_minutes))
+                    queued_count += 1
+                logger.info(f"Поставлено в очередь отправки {queued_count} напоминаний")
+                return queued_count
+            except SQLAlchemyError as e:
+                logger.error(f"Ошибка при постановке напоминаний в очередь отправки: {e}")
+                raise
+
+    def enqueue_outage_updates(self, messages: List[dict], event_ids: List[int],
+                               fencing_token: Optional[int] = None) -> int:
+        """
+        Постановка сообщений об изменениях отключений в очередь одной транзакцией.
+        
+        Каждое сообщение - словарь с chat_id, body, outage_ids и event_ids;
+        правка отправленного сообщения содержит также edit_message_id,
+        fallback_body (новое сообщение, если правка невозможна) и match_ids
+        (совпадения исправляемого уведомления). События
+        event_ids помечаются обработанными в той же транзакции; сообщение,
+        все события которого уже обработаны, не ставится в очередь, поэтому
+        сообщение об изменении отправляется один раз.
+        """
+        if not event_ids:
+            return 0
+        with self.session_manager as session:
+            try:
+                check_fencing_token(session, fencing_token)
+                processed = set()
+                for start in range(0, len(event_ids), ID_BATCH_SIZE):
+                    batch = event_ids[start:start + ID_BATCH_SIZE]
+                    processed.update(event_id for (event_id,) in session.query(OutageEvent.id).filter(
+                        and_(OutageEvent.id.in_(batch), OutageEvent.notified == True)
+                    ).all())
+                
+                queued_count = 0
+                for message in messages:
+                    if message['event_ids'] and all(event_id in processed for event_id in message['event_ids']):
+                        continue
+                    session.add(OutboxMessage(
+                        chat_id=message['chat_id'],
+                        event_type='outage_update',
+                        body=message['body'],
+                        edit_message_id=message.get('edit_message_id'),
+                        fallback_body=message.get('fallback_body'),
+                        match_ids=json.dumps(message.get('match_ids', [])),
+                        outage_ids=json.dumps(message.get('outage_ids', [])),
+                        match_details=json.dumps([]),
+                        priority=message.get('priority', DEFAULT_PRIORITY),
+                        status=OUTBOX_PENDING
+                    ))
+                    queued_count += 1
+                for start in range(0, len(event_ids), ID_BATCH_SIZE):
+                    batch = event_ids[start:start + ID_BATCH_SIZE]
+                    session.query(OutageEvent).filter(OutageEvent.id.in_(batch)).update(
+                        {OutageEvent.notified: True}, synchronize_session=False
+                    )
+                logger.info(f"Поставлено в очередь отправки {queued_count} сообщений об изменениях отключений")
+                return queued_count
+            except SQLAlchemyError as e:
+                logger.error(f"Ошибка при постановке сообщений об изменениях в очередь отправки: {e}")
+                raise
+
+    def get_due_messages(self, limit: int = 500, fencing_token: Optional[int] = None) -> List[OutboxMessage]:
+        """
+        Получение сообщений, готовых к отправке.
+
+        Сообщения возвращаются по приоритету доставки, а с одним
+        приоритетом - по порядку постановки. Сообщения одного чата
+        возвращаются только до первого сообщения, время повтора которого ещё
+        не наступило, чтобы части одного уведомления не обгоняли друг друга.
+        С токеном ограждения сообщения получает только текущий лидер.
+        """
+        with self.session_manager as session:
+            try:
+                check_fencing_token(session, fencing_token)
+                # Срочные сообщения читаются первыми; части одного уведомления идут с неубывающим приоритетом
+                messages = session.query(OutboxMessage).filter(
+                    OutboxMessage.status == OUTBOX_PENDING
+                ).order_by(OutboxMessage.priority, OutboxMessage.id).limit(limit).all()
+
+                now = datetime.utcnow()
+                blocked_chats = set()
+                due_messages = []
+                for message in messages:
+                    if message.chat_id in blocked_chats:
+                        continue
+                    if message.next_attempt_at and message.next_attempt_at > now:
+                        blocked_chats.add(message.chat_id)
+                        continue
+                    # Принудительно загружаем атрибуты, чтобы они были доступны после закрытия сессии
+                    _ = message.id
+                    _ = message.body
+                    _ = message.edit_message_id
+                    _ = message.fallback_body
+                    _ = message.priority
+                    _ = message.attempts
+                    due_messages.append(message)
+                for message in messages:
+                    session.expunge(message)
+                return due_messages
+            except SQLAlchemyError as e:
+                logger.error(f"Ошибка при получении сообщений из очереди отправки: {e}")
+                raise
+
+    def _mark_delivered_outages(self, session: Session, outage_ids: List[int]):
+        """Пометить нотифицированными отключения, доставленные всем активным группам (внутренний метод)"""
+        if not outage_ids:
+            return
+        waiting = {
+            outage_id for (outage_id,) in session.query(OutageGroupMatch.outage_id).join(
+                Group, Group.id == OutageGroupMatch.group_id
+            ).outerjoin(
+                Delivery, and_(
+                    Delivery.outage_id == OutageGroupMatch.outage_id,
+                    Delivery.group_id == OutageGroupMatch.group_id,
+                    Delivery.status == DELIVERY_SENT
+                )
+            ).filter(
+                and_(
+                    OutageGroupMatch.outage_id.in_(outage_ids),
+                    Delivery.id.is_(None),
+                    Group.is_active == True
+                )
+            ).distinct().all()
+        }
+        delivered = [outage_id for outage_id in outage_ids if outage_id not in waiting]
+        if delivered:
+            session.query(Outage).filter(Outage.id.in_(delivered)).update(
+                {Outage.notified: True}, synchronize_session=False
+            )
+
+    def acknowledge_message(self, message_id: int, telegram_message_id: Optional[int] = None,
+                            fencing_token: Optional[int] = None) -> bool:
+        """
+        Подтверждение отправки сообщения Telegram.
+
+        Одной транзакцией помечает сообщение отправленным, записывает
+        историю уведомлений, отмечает доставку в журнале (с ID сообщения
+        Telegram) и помечает нотифицированными отключения, доставленные
+        всем группам. Если правка уведомления заменена новым сообщением,
+        доставки этого уведомления переносятся на новое сообщение, чтобы
+        следующие изменения правили его, а не недоступное старое.
+        """
+        with self.session_manager as session:
+            try:
+                check_fencing_token(session, fencing_token)
+                message = session.query(OutboxMessage).filter(OutboxMessage.id == message_id).first()
+                if not message or message.status == OUTBOX_SENT:
+                    return False
+                message.status = OUTBOX_SENT
+                message.sent_at = datetime.utcnow()
+
+                outage_ids = json.loads(message.outage_ids) if message.outage_ids else []
+                notification = Notification(
+                    event_type=message.event_type,
+                    event_id=outage_ids[0] if outage_ids else None,
+                    group_id=message.chat_id,
+                    message=message.body,
+                    is_duplicate=False,
+                    match_details=message.match_details if message.match_details != '[]' else None
+                )
+                session.add(notification)
+                session.flush()
+
+                session.query(Delivery).filter(Delivery.outbox_id == message_id).update({
+                    Delivery.status: DELIVERY_SENT,
+                    Delivery.message_id: telegram_message_id,
+                    Delivery.notification_id: notification.id,
+                    Delivery.sent_at: message.sent_at
+                }, synchronize_session=False)
+                session.query(Reminder).filter(Reminder.outbox_id == message_id).update({
+                    Reminder.status: REMINDER_SENT,
+                    Reminder.message_id: telegram_message_id,
+                    Reminder.sent_at: message.sent_at
+                }, synchronize_session=False)
+                if message.edit_message_id and telegram_message_id and telegram_message_id != message.edit_message_id:
+                    group_ids = session.query(Group.id).filter(Group.group_id == message.chat_id).scalar_subquery()
+                    session.query(Delivery).filter(
+                        and_(
+                            Delivery.group_id.in_(group_ids),
+                            Delivery.message_id == message.edit_message_id
+                        )
+                    ).update({
+                        Delivery.message_id: telegram_message_id,
+                        Delivery.outbox_id: message.id
+                    }, synchronize_session=False)
+                self._mark_delivered_outages(session, outage_ids)
+                return True
+            except SQLAlchemyError as e:
+                logger.error(f"Ошибка при подтверждении отправки сообщения {message_id}: {e}")
+                raise
+
+    def fail_message(self, message_id: int, error: str, retry_at: Optional[datetime],
+                     fencing_token: Optional[int] = None) -> bool:
+        """
+        Учёт неудачной попытки отправки.
+
+        Если retry_at не задан, попытки исчерпаны: сообщение помечается
+        неотправленным, а его пары удаляются из журнала доставок (и
+        напоминания - из журнала напоминаний), чтобы следующий запуск
+        задачи сформировал сообщение заново.
+        """
+        with self.session_manager as session:
+            try:
+                check_fencing_token(session, fencing_token)
+                message = session.query(OutboxMessage).filter(OutboxMessage.id == message_id).first()
+                if not message:
+                    return False
+                message.attempts = (message.attempts or 0) + 1
+                message.last_error = error
+                if retry_at is not None:
+                    message.next_attempt_at = retry_at
+                    return True
+
+                message.status = OUTBOX_FAILED
+                session.query(Delivery).filter(
+                    and_(Delivery.outbox_id == message_id, Delivery.status == DELIVERY_QUEUED)
+                ).delete(synchronize_session=False)
+                session.query(Reminder).filter(
+                    and_(Reminder.outbox_id == message_id, Reminder.status == REMINDER_QUEUED)
+                ).delete(synchronize_session=False)
+                logger.warning(f"Сообщение {message_id} для группы {message.chat_id} не отправлено после {message.attempts} попыток")
+                return True
+            except SQLAlchemyError as e:
+                logger.error(f"Ошибка при учёте неудачной отправки сообщения {message_id}: {e}")
+                raise
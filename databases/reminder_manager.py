@@ -0,0 +1,120 @@
+from databases.base_manager import BaseManager
+from typing import List, Tuple
+from datetime import datetime
+from databases.models import Reminder, OutageGroupMatch, Outage, Group, Delivery
+from databases.match_manager import ID_BATCH_SIZE
+from databases.outbox_manager import DELIVERY_SENT
+from databases.outage_manager import OUTAGE_ACTIVE
+from utils.outage_time import parse_outage_time
+import logging
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import SQLAlchemyError
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+class ReminderManager(BaseManager):
+    """Менеджер для работы с напоминаниями о скорых отключениях"""
+
+    def get_upcoming_outages(self, after: datetime) -> List[Tuple[int, datetime]]:
+        """
+        Действующие отключения с совпадениями, начинающиеся после after: (ID, время начала).
+
+        Время начала отключений, добавленных до появления колонки
+        starts_at, сначала разбирается из текста start_time.
+        """
+        with self.session_manager as session:
+            try:
+                backfilled = 0
+                for outage in session.query(Outage).filter(
+                    and_(Outage.starts_at.is_(None), Outage.start_time.isnot(None), Outage.start_time != '')
+                ).all():
+                    starts_at = parse_outage_time(outage.start_time)
+                    if starts_at is not None:
+                        outage.starts_at = starts_at
+                        backfilled += 1
+                if backfilled:
+                    session.flush()
+                    logger.info(f"Разобрано время начала {backfilled} отключений")
+
+                rows = session.query(Outage.id, Outage.starts_at).join(
+                    OutageGroupMatch, OutageGroupMatch.outage_id == Outage.id
+                ).filter(
+                    and_(
+                        Outage.starts_at > after,
+                        or_(Outage.status.is_(None), Outage.status == OUTAGE_ACTIVE)
+                    )
+                ).distinct().all()
+                return [(outage_id, starts_at) for outage_id, starts_at in rows]
+            except SQLAlchemyError as e:
+                logger.error(f"Ошибка при получении предстоящих отключений: {e}")
+                raise
+
+    def get_reminder_targets(self, outage_ids: List[int],
+                             offset_minutes: int) -> List[Tuple[OutageGroupMatch, Outage, Group, datetime]]:
+        """
+        Получатели напоминания: (совпадение, отключение, группа, время доставки уведомления).
+
+        Напоминание получают активные группы, которым уже доставлено
+        уведомление об отключении; группы, для которых напоминание с этим
+        смещением уже есть в журнале напоминаний, отсекаются анти-соединением.
+        """
+        with self.session_manager as session:
+            try:
+                query = session.query(OutageGroupMatch, Outage, Group, Delivery.sent_at).join(
+                    Outage, Outage.id == OutageGroupMatch.outage_id
+                ).join(
+                    Group, Group.id == OutageGroupMatch.group_id
+                ).join(
+                    Delivery, and_(
+                        Delivery.outage_id == OutageGroupMatch.outage_id,
+                        Delivery.group_id == OutageGroupMatch.group_id,
+                        Delivery.status == DELIVERY_SENT
+                    )
+                ).outerjoin(
+                    Reminder, and_(
+                        Reminder.outage_id == OutageGroupMatch.outage_id,
+                        Reminder.group_id == OutageGroupMatch.group_id,
+                        Reminder.offset_minutes == offset_minutes
+                    )
+                ).filter(
+                    and_(
+                        Reminder.id.is_(None),
+                        # Отменённые и завершённые отключения не напоминаются
+                        or_(Outage.status.is_(None), Outage.status == OUTAGE_ACTIVE),
+                        Group.is_active == True
+                    )
+                )
+
+                rows = []
+                for start in range(0, len(outage_ids), ID_BATCH_SIZE):
+                    batch = outage_ids[start:start + ID_BATCH_SIZE]
+                    rows.extend(query.filter(OutageGroupMatch.outage_id.in_(batch)).all())
+                rows.sort(key=lambda row: (row[0].group_id, row[0].outage_id))
+
+                # Принудительно загружаем атрибуты и отсоединяем объекты от сессии
+                # (одно отключение и одна группа встречаются в нескольких строках)
+                detached = set()
+                for match, outage, group, _ in rows:
+                    _ = match.id
+                    _ = match.address_index
+                    _ = outage.district
+                    _ = outage.resource
+                    _ = outage.organization
+                    _ = outage.phone
+                    _ = outage.addresses
+                    _ = outage.reason
+                    _ = outage.start_time
+                    _ = outage.end_time
+                    _ = outage.starts_at
+                    _ = group.group_id
+                    _ = group.name
+                    _ = group.addresses
+                    for obj in (match, outage, group):
+                        if id(obj) not in detached:
+                            session.expunge(obj)
+                            detached.add(id(obj))
+                return rows
+            except SQLAlchemyError as e:
+                logger.error(f"Ошибка при получении получателей напоминаний: {e}")
+                raise
@@ -0,0 +1,101 @@
+from databases.base_manager import BaseManager
+from typing import List, Optional
+from datetime import datetime
+from databases.models import SourceState
+from utils.adaptive_polling import clamp_interval, next_poll_interval
+import logging
+from sqlalchemy.exc import SQLAlchemyError
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+class SourceManager(BaseManager):
+    """Менеджер для работы с состояниями источников данных (адаптивный опрос)"""
+    
+    @staticmethod
+    def _state_to_dict(state: SourceState) -> dict:
+        """Состояние источника в виде словаря (внутренний метод)"""
+        return {
+            'source': state.source,
+            'content_digest': state.content_digest,
+            'change_rate': state.change_rate or 0.0,
+            'interval_seconds': state.interval_seconds,
+            'interval_reason': state.interval_reason,
+            'unchanged_checks': state.unchanged_checks or 0,
+            'checks_count': state.checks_count or 0,
+            'changes_count': state.changes_count or 0,
+            'last_checked_at': state.last_checked_at,
+            'last_changed_at': state.last_changed_at
+        }
+    
+    def record_check(self, source: str, digest: str, emergency: bool, floor: int, ceiling: int,
+                     initial_seconds: Optional[int] = None) -> dict:
+        """
+        Учёт проверки источника и пересчёт интервала опроса.
+        
+        Первая проверка только запоминает хэш содержимого: интервал
+        остаётся начальным, пока не станет известно, как часто меняется
+        источник (аварийные отключения опускают его до нижней границы сразу).
+        """
+        with self.session_manager as session:
+            try:
+                now = datetime.utcnow()
+                state = session.query(SourceState).filter(SourceState.source == source).first()
+                if state is None:
+                    interval = floor if emergency else clamp_interval(initial_seconds, floor, ceiling)
+                    state = SourceState(
+                        source=source,
+                        content_digest=digest,
+                        change_rate=0.0,
+                        interval_seconds=interval,
+                        interval_reason="на странице есть аварийные отключения" if emergency else "первая проверка",
+                        unchanged_checks=0,
+                        checks_count=1,
+                        changes_count=0,
+                        last_checked_at=now,
+                        last_changed_at=now
+                    )
+                    session.add(state)
+                    session.flush()
+                    return self._state_to_dict(state)
+                
+                changed = state.content_digest != digest
+                unchanged_checks = 0 if changed else (state.unchanged_checks or 0) + 1
+                interval, change_rate, reason = next_poll_interval(
+                    clamp_interval(state.interval_seconds or initial_seconds, floor, ceiling),
+                    state.change_rate or 0.0, unchanged_checks, changed, emergency, floor, ceiling
+                )
+                state.content_digest = digest
+                state.change_rate = change_rate
+                state.interval_seconds = interval
+                state.interval_reason = reason
+                state.unchanged_checks = unchanged_checks
+                state.checks_count = (state.checks_count or 0) + 1
+                state.last_checked_at = now
+                if changed:
+                    state.changes_count = (state.changes_count or 0) + 1
+                    state.last_changed_at = now
+                logger.info(f"Источник {source}: интервал опроса {interval} с ({reason})")
+                return self._state_to_dict(state)
+            except SQLAlchemyError as e:
+                logger.error(f"Ошибка при учёте проверки источника {source}: {e}")
+                raise
+    
+    def get_source_state(self, source: str) -> Optional[dict]:
+        """Получение состояния источника (None, если источник ещё не проверялся)"""
+        with self.session_manager as session:
+            try:
+                state = session.query(SourceState).filter(SourceState.source == source).first()
+                return self._state_to_dict(state) if state else None
+            except SQLAlchemyError as e:
+                logger.error(f"Ошибка при получении состояния источника {source}: {e}")
+                raise
+    
+    def get_source_states(self) -> List[dict]:
+        """Получение состояний всех источников"""
+        with self.session_manager as session:
+            try:
+                return [self._state_to_dict(state) for state in session.query(SourceState).order_by(SourceState.source).all()]
+            except SQLAlchemyError as e:
+                logger.error(f"Ошибка при получении состояний источников: {e}")
+                raise
@@ -0,0 +1,100 @@
+from databases.base_manager import BaseManager
+from sqlalchemy.orm import Session
+from typing import Dict, List, Tuple
+from databases.models import Street, StreetAlias
+import logging
+import json
+import os
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+class StreetManager(BaseManager):
+    """Менеджер для работы со справочником улиц"""
+
+    def get_street_index_entries(self) -> List[Tuple[str, int]]:
+        """Получение пар (канонический ключ, ID улицы) для улиц и их псевдонимов"""
+        with self.session_manager as session:
+            try:
+                entries = session.query(Street.canonical_key, Street.id).all()
+                aliases = session.query(StreetAlias.alias_key, StreetAlias.street_id).all()
+                return [(key, street_id) for key, street_id in entries] + \
+                       [(key, street_id) for key, street_id in aliases]
+            except SQLAlchemyError as e:
+                logger.error(f"Ошибка при получении справочника улиц: {e}")
+                raise
+
+    def _find_street_ids(self, session: Session, keys: List[str]) -> Dict[str, int]:
+        """Поиск ID улиц по каноническим ключам улиц и псевдонимов (внутренний метод)"""
+        found = dict(session.query(Street.canonical_key, Street.id).filter(Street.canonical_key.in_(keys)).all())
+        missing = [key for key in keys if key not in found]
+        if missing:
+            found.update(session.query(StreetAlias.alias_key, StreetAlias.street_id).filter(
+                StreetAlias.alias_key.in_(missing)
+            ).all())
+        return found
+
+    def add_streets(self, names_by_key: Dict[str, str]) -> Dict[str, int]:
+        """Получение ID улиц с регистрацией отсутствующих в справочнике"""
+        keys = list(names_by_key)
+        try:
+            with self.session_manager as session:
+                found = self._find_street_ids(session, keys)
+                for key in keys:
+                    if key in found:
+                        continue
+                    street = Street(canonical_key=key, name=names_by_key[key])
+                    session.add(street)
+                    session.flush()  # Принудительно записываем в БД, чтобы получить ID
+                    found[key] = street.id
+                    logger.info(f"Добавлена улица в справочник: {names_by_key[key]} ({key})")
+                return found
+        except IntegrityError:
+            # Улицу одновременно зарегистрировал другой процесс - читаем её ID
+            with self.session_manager as session:
+                return self._find_street_ids(session, keys)
+        except SQLAlchemyError as e:
+            logger.error(f"Ошибка при добавлении улиц в справочник: {e}")
+            raise
+
+    def load_gazetteer_file(self, path: str, key_function) -> int:
+        """
+        Загрузка канонических улиц и псевдонимов из JSON файла.
+
+        Формат: [{"name": "проспект Ленина", "aliases": ["Ленинский пр-т"]}, ...]
+        """
+        if not os.path.exists(path):
+            return 0
+
+        with open(path, encoding='utf-8') as f:
+            entries = json.load(f)
+
+        added_count = 0
+        with self.session_manager as session:
+            try:
+                for entry in entries:
+                    key = key_function(entry['name'])
+                    if not key:
+                        continue
+                    street = session.query(Street).filter(Street.canonical_key == key).first()
+                    if not street:
+                        street = Street(canonical_key=key, name=entry['name'])
+                        session.add(street)
+                        session.flush()
+                        added_count += 1
+                    for alias in entry.get('aliases', []):
+                        alias_key = key_function(alias)
+                        if not alias_key or alias_key == key:
+                            continue
+                        alias_obj = session.query(StreetAlias).filter(StreetAlias.alias_key == alias_key).first()
+                        if alias_obj:
+                            alias_obj.street_id = street.id
+                        else:
+                            session.add(StreetAlias(alias_key=alias_key, street_id=street.id))
+                            added_count += 1
+                logger.info(f"Загружен справочник улиц из {path}: добавлено {added_count} записей")
+                return added_count
+            except SQLAlchemyError as e:
+                logger.error(f"Ошибка при загрузке справочника улиц из {path}: {e}")
+                raise
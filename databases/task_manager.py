@@ -1,10 +1,10 @@
 from databases.base_manager import BaseManager
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from datetime import datetime
-from databases.models import ScheduledTask, TaskTypeDefinition, Group
+from databases.models import ScheduledTask, TaskTypeDefinition, Group, TaskChange
 import logging
-from sqlalchemy import and_
+from sqlalchemy import and_, func
 from sqlalchemy.exc import SQLAlchemyError
 
 # Настройка логирования
@@ -13,8 +13,14 @@ logger = logging.getLogger(__name__)
 class TaskManager(BaseManager):
     """Менеджер для работы с запланированными задачами"""
     
+    def _record_change(self, session: Session, task_id: int, action: str):
+        """Запись изменения задачи в журнал в той же транзакции (внутренний метод)"""
+        session.add(TaskChange(task_id=task_id, action=action))
+    
     def add_scheduled_task(self, name: str, task_type_names: List[str], interval_type: str, 
-                          interval_value: int, time_of_day: str = None, group_ids: List[int] = None) -> dict:
+                          interval_value: int, time_of_day: str = None, group_ids: List[int] = None,
+                          cron_expression: str = None, overlap_policy: str = None,
+                          timeout_seconds: int = None) -> dict:
         """Добавление запланированной задачи"""
         with self.session_manager as session:
             try:
@@ -22,10 +28,14 @@ class TaskManager(BaseManager):
                     name=name,
                     interval_type=interval_type,
                     interval_value=interval_value,
-                    time_of_day=time_of_day
+                    time_of_day=time_of_day,
+                    cron_expression=cron_expression,
+                    overlap_policy=overlap_policy,
+                    timeout_seconds=timeout_seconds
                 )
                 session.add(task)
                 session.flush()  # Принудительно записываем в БД, но не коммитим транзакцию
+                self._record_change(session, task.id, 'add')
                 
                 # Если указаны типы задач, добавляем связи
                 assigned_task_type_ids = []
@@ -54,6 +64,12 @@ class TaskManager(BaseManager):
                     'interval_type': task.interval_type,
                     'interval_value': task.interval_value,
                     'time_of_day': task.time_of_day,
+                    'cron_expression': task.cron_expression,
+                    'overlap_policy': task.overlap_policy,
+                    'timeout_seconds': task.timeout_seconds,
+                    'skipped_runs': task.skipped_runs or 0,
+                    'coalesced_runs': task.coalesced_runs or 0,
+                    'timed_out_runs': task.timed_out_runs or 0,
                     'is_active': task.is_active,
                     'assigned_groups': assigned_group_ids,
                     'last_run': task.last_run,
@@ -94,6 +110,12 @@ class TaskManager(BaseManager):
                         'interval_type': task.interval_type,
                         'interval_value': task.interval_value,
                         'time_of_day': task.time_of_day,
+                        'cron_expression': task.cron_expression,
+                        'overlap_policy': task.overlap_policy,
+                        'timeout_seconds': task.timeout_seconds,
+                        'skipped_runs': task.skipped_runs or 0,
+                        'coalesced_runs': task.coalesced_runs or 0,
+                        'timed_out_runs': task.timed_out_runs or 0,
                         'is_active': task.is_active,
                         'assigned_groups': assigned_group_ids,
                         'last_run': task.last_run,
@@ -134,6 +156,12 @@ class TaskManager(BaseManager):
                         'interval_type': task.interval_type,
                         'interval_value': task.interval_value,
                         'time_of_day': task.time_of_day,
+                        'cron_expression': task.cron_expression,
+                        'overlap_policy': task.overlap_policy,
+                        'timeout_seconds': task.timeout_seconds,
+                        'skipped_runs': task.skipped_runs or 0,
+                        'coalesced_runs': task.coalesced_runs or 0,
+                        'timed_out_runs': task.timed_out_runs or 0,
                         'is_active': task.is_active,
                         'assigned_groups': assigned_group_ids,
                         'last_run': task.last_run,
@@ -186,19 +214,10 @@ class TaskManager(BaseManager):
                 logger.error(f"Ошибка при получении всех типов задач: {e}")
                 raise
     
-    def initialize_task_types(self):
-        """Инициализация стандартных типов задач"""
+    def initialize_task_types(self, required_types: List[dict]):
+        """Инициализация типов задач из реестра обработчиков (словари с name, display_name, description)"""
         with self.session_manager as session:
             try:
-                # Создаем список всех необходимых типов задач
-                required_types = [
-                    {
-                        'name': 'outages_check',
-                        'display_name': 'Проверка отключений',
-                        'description': 'Проверка текущих отключений коммунальных услуг'
-                    }
-                ]
-                
                 # Получаем все существующие типы задач
                 existing_types = session.query(TaskTypeDefinition).all()
                 existing_names = {t.name for t in existing_types}
@@ -236,8 +255,10 @@ class TaskManager(BaseManager):
                         _ = group.group_id
                         _ = group.name
                         _ = group.addresses
+                        _ = group.street_ids
                         _ = group.is_active
                         _ = group.created_at
+                        _ = group.updated_at
                     return list(task.groups)
                 logger.warning(f"Задача с ID {task_id} не найдена")
                 return []
@@ -252,6 +273,7 @@ class TaskManager(BaseManager):
                 task = session.query(ScheduledTask).filter(ScheduledTask.id == task_id).first()
                 if task:
                     task.is_active = False
+                    self._record_change(session, task_id, 'deactivate')
                     logger.info(f"Деактивирована задача с ID {task_id}")
                     return True
                 logger.warning(f"Задача с ID {task_id} не найдена")
@@ -261,7 +283,9 @@ class TaskManager(BaseManager):
                 raise
     
     def update_scheduled_task(self, task_id: int, name: str, task_type_names: List[str], 
-                             interval_type: str, interval_value: int, time_of_day: str = None) -> Optional[dict]:
+                             interval_type: str, interval_value: int, time_of_day: str = None,
+                             cron_expression: str = None, overlap_policy: str = None,
+                             timeout_seconds: int = None) -> Optional[dict]:
         """Обновление запланированной задачи"""
         with self.session_manager as session:
             try:
@@ -272,6 +296,9 @@ class TaskManager(BaseManager):
                     task.interval_type = interval_type
                     task.interval_value = interval_value
                     task.time_of_day = time_of_day
+                    task.cron_expression = cron_expression
+                    task.overlap_policy = overlap_policy
+                    task.timeout_seconds = timeout_seconds
                     
                     # Обновляем типы задач
                     if task_type_names:
@@ -279,6 +306,7 @@ class TaskManager(BaseManager):
                         task.task_types = task_types
                     
                     session.flush()  # Принудительно записываем в БД, но не коммитим транзакцию
+                    self._record_change(session, task_id, 'update')
                     
                     # Получаем обновленные данные
                     assigned_group_ids = [group.id for group in task.groups] if hasattr(task, 'groups') else []
@@ -291,6 +319,12 @@ class TaskManager(BaseManager):
                         'interval_type': task.interval_type,
                         'interval_value': task.interval_value,
                         'time_of_day': task.time_of_day,
+                        'cron_expression': task.cron_expression,
+                        'overlap_policy': task.overlap_policy,
+                        'timeout_seconds': task.timeout_seconds,
+                        'skipped_runs': task.skipped_runs or 0,
+                        'coalesced_runs': task.coalesced_runs or 0,
+                        'timed_out_runs': task.timed_out_runs or 0,
                         'is_active': task.is_active,
                         'assigned_groups': assigned_group_ids,
                         'last_run': task.last_run.isoformat() if task.last_run else None,
@@ -303,4 +337,71 @@ class TaskManager(BaseManager):
                 return None
             except SQLAlchemyError as e:
                 logger.error(f"Ошибка при обновлении задачи с ID {task_id}: {e}")
-                raise
\ No newline at end of file
+                raise
+    
+    def get_scheduled_task(self, task_id: int) -> Optional[dict]:
+        """Получение запланированной задачи по ID (в том числе неактивной)"""
+        with self.session_manager as session:
+            try:
+                task = session.query(ScheduledTask).filter(ScheduledTask.id == task_id).first()
+                if not task:
+                    return None
+                return {
+                    'id': task.id,
+                    'name': task.name,
+                    'task_types': [task_type.id for task_type in task.task_types],
+                    'interval_type': task.interval_type,
+                    'interval_value': task.interval_value,
+                    'time_of_day': task.time_of_day,
+                    'cron_expression': task.cron_expression,
+                    'overlap_policy': task.overlap_policy,
+                    'timeout_seconds': task.timeout_seconds,
+                    'skipped_runs': task.skipped_runs or 0,
+                    'coalesced_runs': task.coalesced_runs or 0,
+                    'timed_out_runs': task.timed_out_runs or 0,
+                    'is_active': task.is_active,
+                    'assigned_groups': [group.id for group in task.groups],
+                    'last_run': task.last_run,
+                    'created_at': task.created_at
+                }
+            except SQLAlchemyError as e:
+                logger.error(f"Ошибка при получении задачи с ID {task_id}: {e}")
+                raise
+    
+    def record_task_run_event(self, task_id: int, event: str) -> bool:
+        """Учёт пропущенного (skipped), объединённого (coalesced) или прерванного (timed_out) запуска задачи"""
+        counters = {
+            'skipped': ScheduledTask.skipped_runs,
+            'coalesced': ScheduledTask.coalesced_runs,
+            'timed_out': ScheduledTask.timed_out_runs
+        }
+        column = counters[event]
+        with self.session_manager as session:
+            try:
+                updated = session.query(ScheduledTask).filter(ScheduledTask.id == task_id).update(
+                    {column: func.coalesce(column, 0) + 1}, synchronize_session=False
+                )
+                return updated > 0
+            except SQLAlchemyError as e:
+                logger.error(f"Ошибка при учёте запуска задачи с ID {task_id}: {e}")
+                raise
+    
+    def get_last_task_change_id(self) -> int:
+        """ID последней записи журнала изменений задач (0, если журнал пуст)"""
+        with self.session_manager as session:
+            try:
+                return session.query(func.max(TaskChange.id)).scalar() or 0
+            except SQLAlchemyError as e:
+                logger.error(f"Ошибка при получении последнего изменения задач: {e}")
+                raise
+    
+    def get_task_changes_since(self, change_id: int) -> List[Tuple[int, int]]:
+        """Изменения задач после записи с ID change_id: [(ID записи, ID задачи), ...]"""
+        with self.session_manager as session:
+            try:
+                return [tuple(row) for row in session.query(TaskChange.id, TaskChange.task_id).filter(
+                    TaskChange.id > change_id
+                ).order_by(TaskChange.id).all()]
+            except SQLAlchemyError as e:
+                logger.error(f"Ошибка при получении изменений задач: {e}")
+                raise
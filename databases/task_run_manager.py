@@ -0,0 +1,120 @@
+from databases.base_manager import BaseManager
+from typing import Dict, List, Optional
+from datetime import datetime
+from databases.models import TaskRun
+from utils.run_timer import PIPELINE_STAGES, RUN_COUNTERS
+import logging
+import math
+from sqlalchemy.exc import SQLAlchemyError
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Перцентили длительностей в статистике запусков
+RUN_PERCENTILES = (50, 90, 99)
+
+def _percentile(sorted_values: List[float], percent: int) -> Optional[float]:
+    """Перцентиль по методу ближайшего ранга"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(percent / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+class TaskRunManager(BaseManager):
+    """Менеджер истории запусков задач"""
+    
+    @staticmethod
+    def _run_to_dict(run: TaskRun) -> dict:
+        """Запуск в виде словаря (внутренний метод)"""
+        result = {
+            'id': run.id,
+            'task_id': run.task_id,
+            'task_name': run.task_name,
+            'started_at': run.started_at,
+            'finished_at': run.finished_at,
+            'outcome': run.outcome,
+            'error': run.error,
+            'total_seconds': run.total_seconds,
+            'stages': {name: getattr(run, f'{name}_seconds') for name in PIPELINE_STAGES},
+        }
+        result.update({name: getattr(run, name) for name in RUN_COUNTERS})
+        return result
+    
+    def add_run(self, task_id: int, task_name: str, started_at: datetime, finished_at: datetime, outcome: str,
+                stages: Dict[str, float], counters: Dict[str, int], error: str = None) -> int:
+        """Запись запуска задачи; возвращает ID записи"""
+        with self.session_manager as session:
+            try:
+                run = TaskRun(
+                    task_id=task_id,
+                    task_name=task_name,
+                    started_at=started_at,
+                    finished_at=finished_at,
+                    outcome=outcome,
+                    error=error,
+                    total_seconds=(finished_at - started_at).total_seconds()
+                )
+                for name in PIPELINE_STAGES:
+                    setattr(run, f'{name}_seconds', stages.get(name))
+                for name in RUN_COUNTERS:
+                    setattr(run, name, counters.get(name))
+                session.add(run)
+                session.flush()
+                return run.id
+            except SQLAlchemyError as e:
+                logger.error(f"Ошибка при записи запуска задачи {task_id}: {e}")
+                raise
+    
+    def get_run_stats(self, runs_per_task: int = 500) -> List[dict]:
+        """
+        Статистика последних запусков по задачам.
+        
+        Для каждой задачи - число запусков по исходам и перцентили общей
+        длительности и длительности каждого этапа по последним
+        runs_per_task запускам.
+        """
+        with self.session_manager as session:
+            try:
+                task_ids = [task_id for (task_id,) in session.query(TaskRun.task_id).distinct().all()]
+                stats = []
+                for task_id in task_ids:
+                    runs = session.query(TaskRun).filter(TaskRun.task_id == task_id).order_by(
+                        TaskRun.started_at.desc()
+                    ).limit(runs_per_task).all()
+                    outcomes = {}
+                    for run in runs:
+                        outcomes[run.outcome] = outcomes.get(run.outcome, 0) + 1
+                    
+                    def percentiles(values):
+                        values = sorted(value for value in values if value is not None)
+                        return {f'p{percent}': _percentile(values, percent) for percent in RUN_PERCENTILES}
+                    
+                    stats.append({
+                        'task_id': task_id,
+                        'task_name': runs[0].task_name,
+                        'runs_count': len(runs),
+                        'outcomes': outcomes,
+                        'last_run_at': runs[0].started_at,
+                        'total': percentiles(run.total_seconds for run in runs),
+                        'stages': {
+                            name: percentiles(getattr(run, f'{name}_seconds') for run in runs)
+                            for name in PIPELINE_STAGES
+                        }
+                    })
+                return stats
+            except SQLAlchemyError as e:
+                logger.error(f"Ошибка при получении статистики запусков задач: {e}")
+                raise
+    
+    def get_slowest_runs(self, limit: int = 20, task_id: Optional[int] = None) -> List[dict]:
+        """Самые долгие запуски (всех задач или одной задачи)"""
+        with self.session_manager as session:
+            try:
+                query = session.query(TaskRun)
+                if task_id is not None:
+                    query = query.filter(TaskRun.task_id == task_id)
+                runs = query.order_by(TaskRun.total_seconds.desc()).limit(limit).all()
+                return [self._run_to_dict(run) for run in runs]
+            except SQLAlchemyError as e:
+                logger.error(f"Ошибка при получении самых долгих запусков задач: {e}")
+                raise
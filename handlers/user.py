@@ -1,7 +1,6 @@
 from aiogram import Dispatcher, types
 from aiogram.dispatcher.filters import CommandStart, CommandHelp
-from databases.manager import db_manager
-import json
+from utils.outage_snapshot import outage_snapshot
 import logging
 import requests
 
@@ -27,52 +26,15 @@ async def cmd_help(message: types.Message):
 async def cmd_outages(message: types.Message):
     """Обработчик команды /outages"""
     try:
-        # Получаем нотифицированные отключения
-        unnotified_outages = db_manager.get_unnotified_outages()
-        
-        if not unnotified_outages:
-            await message.answer("На данный момент нет новых отключений.")
-            return
-        
-        # Формируем сообщение
-        response = f"⚠️ *Новые отключения* ({len(unnotified_outages)} шт.):\n\n"
-        
-        for outage in unnotified_outages[:5]:  # Ограничиваем 5 отключениями
-            # Парсим адреса
-            try:
-                addresses = json.loads(outage.addresses) if outage.addresses else []
-                addresses_text = ""
-                if addresses:
-                    addresses_parts = []
-                    for addr in addresses:
-                        street = addr.get('street', '')
-                        houses = addr.get('houses', [])
-                        if houses:
-                            addresses_parts.append(f"{street} ({', '.join(houses)})")
-                        else:
-                            addresses_parts.append(street)
-                    addresses_text = "; ".join(addresses_parts)
-            except:
-                addresses_text = outage.addresses or ""
-            
-            response += f"🏢 *Район:* {outage.district}\n"
-            response += f"💡 *Ресурс:* {outage.resource}\n"
-            if outage.organization:
-                response += f"🏢 *Организация:* {outage.organization}\n"
-            if outage.phone:
-                response += f"📞 *Телефон:* {outage.phone}\n"
-            if addresses_text:
-                response += f"📍 *Адреса:* {addresses_text}\n"
-            if outage.reason:
-                response += f"📝 *Причина:* {outage.reason}\n"
-            if outage.start_time and outage.end_time:
-                response += f"⏰ *Время:* {outage.start_time} - {outage.end_time}\n"
-            response += "\n"
-        
-        if len(unnotified_outages) > 5:
-            response += f"... и ещё {len(unnotified_outages) - 5} отключений\n\n"
-        
-        await message.answer(response, parse_mode="Markdown")
+        # Ответ берётся из снимка в памяти; сверка с базой и сборка выполняются вне цикла событий
+        text = outage_snapshot.get_text()
+        if text is None:
+            # Снимок ещё не собран: первый запрос ждёт его сборки в пуле потоков
+            await outage_snapshot.refresh()
+            text = outage_snapshot.get_text()
+        else:
+            outage_snapshot.request_refresh()
+        await message.answer(text, parse_mode="Markdown")
     except Exception as e:
         await message.answer(f"Ошибка при получении отключений: {str(e)}")
 
@@ -0,0 +1,64 @@
+# Модуль адаптивного интервала опроса источников данных
+import hashlib
+from typing import List, Optional, Tuple
+from utils.outage_hash import generate_outage_hash
+from utils.delivery_priority import is_emergency_reason
+
+# Ключ источника отключений в таблице состояний источников
+OUTAGES_SOURCE = 'outages'
+
+# Вес последней проверки в оценке доли проверок с изменениями
+CHANGE_RATE_ALPHA = 0.3
+
+# Доля проверок с изменениями, при которой интервал не увеличивается
+HIGH_CHANGE_RATE = 0.5
+
+# Во сколько раз интервал уменьшается при изменении и увеличивается без изменений
+TIGHTEN_FACTOR = 2
+BACKOFF_FACTOR = 2
+
+
+def content_digest(outages_data: List[dict]) -> str:
+    """
+    Хэш содержимого страницы по разобранным записям.
+
+    Хэшируются записи, а не HTML, чтобы счётчики, реклама и порядок строк
+    на странице не считались изменением.
+    """
+    row_hashes = sorted(generate_outage_hash(outage) for outage in outages_data)
+    return hashlib.sha256('\n'.join(row_hashes).encode('utf-8')).hexdigest()
+
+
+def has_emergency(outages_data: List[dict]) -> bool:
+    """Есть ли среди записей аварийные отключения"""
+    return any(is_emergency_reason(outage.get('reason')) for outage in outages_data)
+
+
+def next_poll_interval(interval: int, change_rate: float, unchanged_checks: int, changed: bool,
+                       emergency: bool, floor: int, ceiling: int) -> Tuple[int, float, str]:
+    """
+    Новый интервал опроса (в секундах), оценка доли изменений и причина выбора.
+
+    Аварийные отключения сразу опускают интервал до нижней границы,
+    изменение содержимого делит его на TIGHTEN_FACTOR. Без изменений
+    интервал растёт экспоненциально до верхней границы, если страница не
+    менялась в большинстве последних проверок.
+    """
+    change_rate = CHANGE_RATE_ALPHA * (1.0 if changed else 0.0) + (1 - CHANGE_RATE_ALPHA) * change_rate
+    if emergency:
+        interval, reason = floor, "на странице есть аварийные отключения"
+    elif changed:
+        interval, reason = interval // TIGHTEN_FACTOR, "содержимое страницы изменилось"
+    elif change_rate >= HIGH_CHANGE_RATE:
+        reason = f"страница часто меняется ({change_rate:.0%} проверок с изменениями)"
+    else:
+        interval = interval * BACKOFF_FACTOR
+        reason = f"без изменений {unchanged_checks} проверок подряд"
+    return max(floor, min(ceiling, interval)), change_rate, reason
+
+
+def clamp_interval(seconds: Optional[int], floor: int, ceiling: int) -> int:
+    """Интервал в пределах границ (без значения - верхняя граница)"""
+    if not seconds:
+        return ceiling
+    return max(floor, min(ceiling, int(seconds)))
@@ -0,0 +1,329 @@
+# Модуль для сопоставления адресов групп с адресами отключений
+import re
+import json
+import logging
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+from data.config import FUZZY_MATCH_THRESHOLD
+from utils.house_numbers import HouseIndex
+from utils.street_index import TrigramIndex, forms_compatible, similarity, street_fuzzy_key
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Регулярные выражения, скомпилированные для производительности
+STREET_TYPE_SUFFIX_PATTERN = re.compile(
+    r'\s*(улица|ул\.?|проспект|пр-т|переулок|пер\.?|площадь|пл\.?|проезд|бульвар|б-р|набережная|наб\.?)\s*$'
+)
+GROUP_HOUSE_PATTERN = re.compile(r'(\d+(?:/\d+)?[а-я]?)$')
+DIGIT_PATTERN = re.compile(r'\d')
+
+# Способы совпадения в порядке убывания точности
+METHOD_EXACT = 'exact'
+METHOD_STREET_ID = 'street_id'
+METHOD_SUBSTRING = 'substring'
+METHOD_FUZZY = 'fuzzy'
+METHOD_ALL = 'all'
+
+
+def normalize_street_name(street_name: str) -> str:
+    """Очистка названия улицы от типов улиц и лишних символов"""
+    return STREET_TYPE_SUFFIX_PATTERN.sub('', street_name).strip()
+
+
+class GroupAddress:
+    """Подготовленный адрес группы: все производные значения вычисляются один раз"""
+
+    __slots__ = ('group_index', 'raw', 'street_id', 'clean', 'key', 'fuzzy_key', 'house', 'has_digit')
+
+    def __init__(self, group_index: int, raw: str, street_id: Optional[int] = None):
+        self.group_index = group_index
+        self.raw = raw
+        self.street_id = street_id
+        self.clean = raw.lower().strip()
+        self.key = normalize_street_name(self.clean)
+        self.fuzzy_key = street_fuzzy_key(self.clean)
+        house_match = GROUP_HOUSE_PATTERN.search(self.clean)
+        self.house = house_match.group(1) if house_match else None
+        self.has_digit = bool(DIGIT_PATTERN.search(self.clean))
+
+    def matches_houses(self, outage_houses: HouseIndex) -> bool:
+        """Проверка домов отключения при уже совпавшей улице"""
+        if not outage_houses:
+            # Если дома не указаны в отключении, отправляем уведомление по улице
+            return True
+        if self.house is not None:
+            # Точный номер, диапазон ("1-15") или сторона улицы ("чётная сторона")
+            return outage_houses.contains(self.house)
+        # Если дом не указан в адресе группы, отправляем уведомление по улице
+        return not self.has_digit
+
+
+class OutageAddress:
+    """Подготовленный адрес отключения"""
+
+    __slots__ = ('street', 'street_id', 'key', 'fuzzy_key', 'houses')
+
+    def __init__(self, outage_addr: Dict[str, Any]):
+        self.street = outage_addr.get('street', '').lower().strip()
+        self.street_id = outage_addr.get('street_id')
+        self.key = normalize_street_name(self.street)
+        self.fuzzy_key = street_fuzzy_key(self.street)
+        self.houses = HouseIndex(outage_addr.get('houses', []))
+
+
+class MatchExplanation(NamedTuple):
+    """Объяснение совпадения: способ, похожесть улиц и адрес группы"""
+    method: str
+    score: float
+    group_address: Optional[str]
+
+    def to_dict(self, outage_id=None, outage_street=None) -> Dict[str, Any]:
+        """Представление для истории уведомлений"""
+        return {
+            'outage_id': outage_id,
+            'method': self.method,
+            'score': round(self.score, 3),
+            'group_address': self.group_address,
+            'outage_street': outage_street,
+        }
+
+
+class OutageMatch(NamedTuple):
+    """Отключение, совпавшее с группой"""
+    outage: Any
+    address: Optional[Dict[str, Any]]
+    explanation: MatchExplanation
+    address_index: Optional[int] = None
+
+
+def explain_address_match(group_addr: str, outage_addr: Dict[str, Any],
+                          threshold: float = FUZZY_MATCH_THRESHOLD,
+                          group_street_id: Optional[int] = None) -> Optional[MatchExplanation]:
+    """Сравнение одного адреса группы с одним адресом отключения с объяснением"""
+    group_address = GroupAddress(-1, group_addr, group_street_id)
+    outage_address = OutageAddress(outage_addr)
+
+    # Проверяем точное совпадение улицы
+    if group_address.clean == outage_address.street:
+        return MatchExplanation(METHOD_EXACT, 1.0, group_addr)
+
+    # Проверяем совпадение улиц по справочнику (сравнение чисел)
+    if group_address.street_id is not None and group_address.street_id == outage_address.street_id:
+        if group_address.matches_houses(outage_address.houses):
+            return MatchExplanation(METHOD_STREET_ID, 1.0, group_addr)
+
+    # Проверяем совпадение очищенных названий улиц
+    if outage_address.key in group_address.key or group_address.key in outage_address.key:
+        if group_address.matches_houses(outage_address.houses):
+            return MatchExplanation(METHOD_SUBSTRING, 1.0, group_addr)
+        return None
+
+    # Проверяем похожесть улиц по триграммам (опечатки, другой порядок слов)
+    # Разный тип улицы или род окончания ("Садовая" и "Садовый") - разные улицы
+    score = similarity(group_address.fuzzy_key, outage_address.fuzzy_key)
+    if (score >= threshold and forms_compatible(group_address.clean, outage_address.street)
+            and group_address.matches_houses(outage_address.houses)):
+        return MatchExplanation(METHOD_FUZZY, score, group_addr)
+    return None
+
+
+def address_match(group_addr: str, outage_addr: Dict[str, Any]) -> bool:
+    """Сравнение одного адреса группы с одним адресом отключения"""
+    return explain_address_match(group_addr, outage_addr) is not None
+
+
+def load_group_addresses(group) -> List[Any]:
+    """Получение списка адресов группы из JSON"""
+    return json.loads(group.addresses) if group.addresses else []
+
+
+def load_group_street_ids(group, group_addresses: List[Any]) -> List[Optional[int]]:
+    """Получение ID улиц адресов группы (пустой список, если они не совпадают с адресами)"""
+    try:
+        street_ids = json.loads(group.street_ids) if getattr(group, 'street_ids', None) else []
+    except Exception as e:
+        logger.warning(f"Ошибка при парсинге ID улиц группы {group.name}: {e}")
+        return [None] * len(group_addresses)
+    if len(street_ids) != len(group_addresses):
+        return [None] * len(group_addresses)
+    return street_ids
+
+
+class AddressMatcher:
+    """
+    Инвертированный индекс адресов групп.
+
+    Строится один раз для набора групп. Каждый адрес отключения проверяется
+    только против групп-кандидатов, найденных по индексу, вместо полного
+    перебора групп и их адресов. Семантика совпадения та же, что у
+    address_match: точное совпадение улицы, вхождение одной очищенной
+    улицы в другую или похожесть улиц по триграммам не ниже порога,
+    с последующей проверкой домов.
+    """
+
+    def __init__(self, groups: Iterable[Any], threshold: float = FUZZY_MATCH_THRESHOLD):
+        self.groups = list(groups)
+        self.threshold = threshold
+        # Группы без адресов получают все отключения
+        self.match_all_groups: List[int] = []
+        # Группы с ошибкой в адресах получают все отключения (как и раньше)
+        self.broken_groups: List[int] = []
+        self._entries: List[GroupAddress] = []
+        self._by_clean: Dict[str, List[int]] = {}
+        self._by_key: Dict[str, List[int]] = {}
+        self._by_street_id: Dict[int, List[int]] = {}
+        self._suffixes: List[str] = []
+        self._suffix_keys: Dict[str, List[str]] = {}
+        self._by_fuzzy_key: Dict[str, List[int]] = {}
+        self._fuzzy_index: Optional[TrigramIndex] = None
+        self._build()
+
+    def _build(self):
+        """Построение индекса по адресам всех групп"""
+        for group_index, group in enumerate(self.groups):
+            try:
+                group_addresses = load_group_addresses(group)
+            except Exception as e:
+                logger.error(f"Ошибка при парсинге адресов группы {group.name}: {e}")
+                self.broken_groups.append(group_index)
+                continue
+
+            if not group_addresses:
+                self.match_all_groups.append(group_index)
+                continue
+
+            street_ids = load_group_street_ids(group, group_addresses)
+            for raw, street_id in zip(group_addresses, street_ids):
+                if not isinstance(raw, str):
+                    continue
+                entry_id = len(self._entries)
+                entry = GroupAddress(group_index, raw, street_id)
+                self._entries.append(entry)
+                if street_id is not None:
+                    self._by_street_id.setdefault(street_id, []).append(entry_id)
+                self._by_clean.setdefault(entry.clean, []).append(entry_id)
+                self._by_key.setdefault(entry.key, []).append(entry_id)
+                self._by_fuzzy_key.setdefault(entry.fuzzy_key, []).append(entry_id)
+
+        # Фрагменты ключей: все суффиксы очищенных названий. Ключ отключения
+        # входит в ключ группы тогда и только тогда, когда он является
+        # префиксом одного из суффиксов ключа группы.
+        for key in self._by_key:
+            for start in range(len(key) + 1):
+                self._suffix_keys.setdefault(key[start:], []).append(key)
+        self._suffixes = sorted(self._suffix_keys)
+        self._fuzzy_index = TrigramIndex(self._by_fuzzy_key, self.threshold)
+
+        logger.info(
+            f"Построен индекс адресов: {len(self.groups)} групп, {len(self._entries)} адресов, "
+            f"{len(self._by_key)} уникальных улиц"
+        )
+
+    def _keys_containing(self, key: str) -> Iterable[str]:
+        """Ключи групп, в которые входит ключ отключения"""
+        position = bisect_left(self._suffixes, key)
+        while position < len(self._suffixes) and self._suffixes[position].startswith(key):
+            yield from self._suffix_keys[self._suffixes[position]]
+            position += 1
+
+    def _keys_contained_in(self, key: str) -> Iterable[str]:
+        """Ключи групп, которые входят в ключ отключения"""
+        seen = set()
+        length = len(key)
+        for start in range(length + 1):
+            for end in range(start, length + 1):
+                fragment = key[start:end]
+                if fragment in seen:
+                    continue
+                seen.add(fragment)
+                if fragment in self._by_key:
+                    yield fragment
+
+    def _match_address(self, outage_address: OutageAddress) -> Dict[int, MatchExplanation]:
+        """Группы, совпавшие с одним адресом отключения, с объяснением совпадения"""
+        matched: Dict[int, MatchExplanation] = {}
+
+        # Точное совпадение улицы не требует проверки домов
+        for entry_id in self._by_clean.get(outage_address.street, ()):
+            entry = self._entries[entry_id]
+            matched.setdefault(entry.group_index, MatchExplanation(METHOD_EXACT, 1.0, entry.raw))
+
+        # Совпадение улиц по справочнику - сравнение целых ID
+        if outage_address.street_id is not None:
+            for entry_id in self._by_street_id.get(outage_address.street_id, ()):
+                entry = self._entries[entry_id]
+                if entry.group_index not in matched and entry.matches_houses(outage_address.houses):
+                    matched[entry.group_index] = MatchExplanation(METHOD_STREET_ID, 1.0, entry.raw)
+
+        candidate_keys = set(self._keys_containing(outage_address.key))
+        candidate_keys.update(self._keys_contained_in(outage_address.key))
+        for key in candidate_keys:
+            for entry_id in self._by_key[key]:
+                entry = self._entries[entry_id]
+                if entry.group_index in matched:
+                    continue
+                if entry.matches_houses(outage_address.houses):
+                    matched[entry.group_index] = MatchExplanation(METHOD_SUBSTRING, 1.0, entry.raw)
+
+        # Нечёткое совпадение только для групп, не совпавших точнее
+        for fuzzy_key, score in self._fuzzy_index.search(outage_address.fuzzy_key):
+            for entry_id in self._by_fuzzy_key[fuzzy_key]:
+                entry = self._entries[entry_id]
+                if entry.group_index in matched or entry.key in candidate_keys:
+                    continue
+                if not forms_compatible(entry.clean, outage_address.street):
+                    continue
+                if entry.matches_houses(outage_address.houses):
+                    matched[entry.group_index] = MatchExplanation(METHOD_FUZZY, score, entry.raw)
+        return matched
+
+    def match(self, outage_addresses: List[Any]) -> Dict[int, Tuple[int, MatchExplanation]]:
+        """
+        Сопоставление адресов одного отключения с адресами групп.
+
+        Возвращает словарь {индекс группы: (индекс первого совпавшего адреса
+        отключения, объяснение)}. Группы без адресов в результат не входят.
+        """
+        result: Dict[int, Tuple[int, MatchExplanation]] = {}
+        for address_index, outage_addr in enumerate(outage_addresses):
+            try:
+                outage_address = OutageAddress(outage_addr)
+            except Exception as e:
+                logger.error(f"Ошибка при сравнении адресов: {e}")
+                continue
+            for group_index, explanation in self._match_address(outage_address).items():
+                result.setdefault(group_index, (address_index, explanation))
+        return result
+
+    def match_outages(self, outages: List[Any]) -> Dict[int, List[OutageMatch]]:
+        """
+        Распределение отключений по группам.
+
+        Возвращает словарь {индекс группы: [OutageMatch, ...]} с сохранением
+        порядка отключений. Для групп без адресов совпавший адрес равен None.
+        """
+        result: Dict[int, List[OutageMatch]] = {}
+        unconditional = self.match_all_groups + self.broken_groups
+        match_all = MatchExplanation(METHOD_ALL, 1.0, None)
+
+        for outage in outages:
+            for group_index in unconditional:
+                result.setdefault(group_index, []).append(OutageMatch(outage, None, match_all))
+
+            if not self._entries:
+                continue
+
+            try:
+                outage_addresses = json.loads(outage.addresses) if outage.addresses else []
+            except Exception as e:
+                logger.warning(f"Ошибка при парсинге адресов отключения {outage.id}: {e}")
+                continue
+
+            for group_index, (address_index, explanation) in self.match(outage_addresses).items():
+                result.setdefault(group_index, []).append(
+                    OutageMatch(outage, outage_addresses[address_index], explanation, address_index)
+                )
+
+        # Восстанавливаем исходный порядок групп
+        return {group_index: result[group_index] for group_index in sorted(result)}
@@ -0,0 +1,94 @@
+# Модуль приоритетов и режимов доставки уведомлений
+from datetime import datetime, timedelta
+from typing import Optional
+from data.config import DIGEST_DAILY_HOUR
+
+# Классы приоритета: аварийные отключения, отключения, которые скоро начнутся, остальные плановые
+PRIORITY_EMERGENCY = 'emergency'
+PRIORITY_SOON = 'soon'
+PRIORITY_PLANNED = 'planned'
+PRIORITY_CLASSES = (PRIORITY_EMERGENCY, PRIORITY_SOON, PRIORITY_PLANNED)
+
+# Шаг приоритета между классами; внутри класса приоритет уточняется близостью совпадения адреса
+PRIORITY_CLASS_STEP = 10
+
+# Сколько ступеней внутри класса отводится на неточность совпадения (похожесть улиц от 0 до 1)
+MATCH_PRIORITY_STEPS = 5
+
+# Отключение, начинающееся раньше, чем через столько часов, доставляется раньше остальных плановых
+SOON_HOURS = 24
+
+# Приоритет сообщений без отключений (например, созданных до появления приоритетов)
+DEFAULT_PRIORITY = PRIORITY_CLASSES.index(PRIORITY_PLANNED) * PRIORITY_CLASS_STEP
+
+# Режимы доставки группы: каждое уведомление сразу или плановые отключения сводкой раз в час или раз в день
+DELIVERY_IMMEDIATE = 'immediate'
+DELIVERY_HOURLY = 'hourly'
+DELIVERY_DAILY = 'daily'
+DELIVERY_MODES = (DELIVERY_IMMEDIATE, DELIVERY_HOURLY, DELIVERY_DAILY)
+
+# Период сводки для режимов со сводками
+DIGEST_PERIODS = {DELIVERY_HOURLY: timedelta(hours=1), DELIVERY_DAILY: timedelta(days=1)}
+
+
+def is_emergency_reason(reason: Optional[str]) -> bool:
+    """Аварийное ли отключение по тексту причины"""
+    return 'аварийн' in (reason or '').lower()
+
+
+def delivery_priority(reason: Optional[str], starts_at: Optional[datetime] = None,
+                      match_score: Optional[float] = 1.0, now: Optional[datetime] = None) -> int:
+    """
+    Приоритет доставки уведомления группе (меньше - раньше).
+
+    Класс определяется причиной и временем начала отключения: аварийные,
+    затем начинающиеся в ближайшие SOON_HOURS часов (или уже начавшиеся),
+    затем остальные. Внутри класса точные совпадения адреса доставляются
+    раньше нечётких.
+    """
+    if is_emergency_reason(reason):
+        priority_class = PRIORITY_EMERGENCY
+    elif starts_at is not None and starts_at <= (now or datetime.now()) + timedelta(hours=SOON_HOURS):
+        priority_class = PRIORITY_SOON
+    else:
+        priority_class = PRIORITY_PLANNED
+    score = 1.0 if match_score is None else min(max(match_score, 0.0), 1.0)
+    return PRIORITY_CLASSES.index(priority_class) * PRIORITY_CLASS_STEP + round((1.0 - score) * MATCH_PRIORITY_STEPS)
+
+
+def priority_class(priority: Optional[int]) -> str:
+    """Класс приоритета по его значению (для метрик)"""
+    if priority is None:
+        return PRIORITY_PLANNED
+    index = min(max(priority // PRIORITY_CLASS_STEP, 0), len(PRIORITY_CLASSES) - 1)
+    return PRIORITY_CLASSES[index]
+
+
+def digest_period_start(mode: str, now: datetime) -> datetime:
+    """Начало текущего периода сводки (местное время): начало часа или DIGEST_DAILY_HOUR часов"""
+    if mode == DELIVERY_HOURLY:
+        return now.replace(minute=0, second=0, microsecond=0)
+    start = now.replace(hour=DIGEST_DAILY_HOUR, minute=0, second=0, microsecond=0)
+    return start if start <= now else start - DIGEST_PERIODS[DELIVERY_DAILY]
+
+
+def is_digest_due(mode: Optional[str], last_sent_at: Optional[datetime], now: datetime) -> bool:
+    """Пора ли отправить сводку: в текущем периоде она ещё не отправлялась"""
+    if mode not in DIGEST_PERIODS:
+        return False
+    return last_sent_at is None or last_sent_at < digest_period_start(mode, now)
+
+
+def holds_for_digest(mode: Optional[str], priority: int, starts_at: Optional[datetime],
+                     now: Optional[datetime] = None) -> bool:
+    """
+    Откладывается ли уведомление до сводки группы.
+
+    Аварийные отключения доставляются сразу в любом режиме, как и
+    отключения, которые начнутся раньше следующей сводки.
+    """
+    if mode not in DIGEST_PERIODS or priority_class(priority) == PRIORITY_EMERGENCY:
+        return False
+    now = now or datetime.now()
+    next_digest_at = digest_period_start(mode, now) + DIGEST_PERIODS[mode]
+    return starts_at is None or starts_at >= next_digest_at
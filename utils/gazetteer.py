@@ -0,0 +1,182 @@
+# Справочник улиц: канонические ключи, псевдонимы и стабильные ID улиц
+import re
+import logging
+import threading
+from array import array
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from utils.street_index import TRAILING_HOUSE_PATTERN
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Сокращения и полные названия типов улиц, приводимые к одному виду
+STREET_TYPES = {
+    'ул': 'улица', 'улица': 'улица',
+    'пр': 'проспект', 'пр-т': 'проспект', 'просп': 'проспект', 'проспект': 'проспект',
+    'пер': 'переулок', 'переулок': 'переулок',
+    'пл': 'площадь', 'площадь': 'площадь',
+    'пр-д': 'проезд', 'проезд': 'проезд',
+    'б-р': 'бульвар', 'бул': 'бульвар', 'бульвар': 'бульвар',
+    'наб': 'набережная', 'набережная': 'набережная',
+    'ш': 'шоссе', 'шоссе': 'шоссе',
+    'туп': 'тупик', 'тупик': 'тупик',
+    'мкр': 'микрорайон', 'мкрн': 'микрорайон', 'микрорайон': 'микрорайон',
+}
+# Слова, не влияющие на улицу ("им. Ленина" и "Ленина" - одна улица)
+STREET_STOP_WORDS = frozenset({'им', 'имени'})
+
+# Разделитель названия и типа улицы в каноническом ключе
+KEY_SEPARATOR = '|'
+
+# Регулярные выражения, скомпилированные для производительности
+STREET_TOKEN_PATTERN = re.compile(r'[0-9a-zа-я]+(?:-[0-9a-zа-я]+)*')
+
+# Число новых улиц, после которого дополнительный словарь сливается в массив
+OVERLAY_COMPACT_SIZE = 1024
+
+
+@lru_cache(maxsize=65536)
+def canonical_street_key(name: str) -> str:
+    """
+    Канонический ключ улицы.
+
+    Слова названия сортируются (порядок слов не важен), тип улицы
+    приводится к полному названию и записывается после разделителя:
+    "пр-т Ленина", "Ленина проспект" и "проспект им. Ленина" дают
+    ключ "ленина|проспект". Номер дома в конце отбрасывается.
+    """
+    text = name.lower().replace('ё', 'е').strip()
+    text = TRAILING_HOUSE_PATTERN.sub('', text)
+    street_type = ''
+    words = []
+    for token in STREET_TOKEN_PATTERN.findall(text):
+        if token in STREET_TYPES:
+            street_type = street_type or STREET_TYPES[token]
+        elif token not in STREET_STOP_WORDS:
+            words.append(token)
+    if not words:
+        return ''
+    return ' '.join(sorted(words)) + KEY_SEPARATOR + street_type
+
+
+class StreetGazetteer:
+    """
+    Справочник улиц в виде компактного отсортированного массива.
+
+    Канонические ключи улиц и псевдонимов хранятся в отсортированном
+    списке, ID улиц - в параллельном массиве целых чисел; поиск выполняется
+    делением пополам. Новые улицы регистрируются через registrar (обычно
+    в базе данных, чтобы ID были стабильными) и до уплотнения хранятся
+    в небольшом дополнительном словаре.
+    """
+
+    def __init__(self):
+        self._keys: List[str] = []
+        self._ids = array('l')
+        self._overlay: Dict[str, int] = {}
+        self._loader: Optional[Callable[[], Iterable[Tuple[str, int]]]] = None
+        self._registrar: Optional[Callable[[Dict[str, str]], Dict[str, int]]] = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def bind(self, loader: Callable[[], Iterable[Tuple[str, int]]],
+             registrar: Callable[[Dict[str, str]], Dict[str, int]]):
+        """Подключение источника улиц и функции регистрации новых улиц"""
+        self._loader = loader
+        self._registrar = registrar
+        self._loaded = False
+
+    def load(self, entries: Iterable[Tuple[str, int]]):
+        """Построение массива из пар (канонический ключ, ID улицы)"""
+        merged = dict(entries)
+        with self._lock:
+            self._keys = sorted(merged)
+            self._ids = array('l', (merged[key] for key in self._keys))
+            self._overlay = {}
+            self._loaded = True
+        logger.info(f"Загружен справочник улиц: {len(self._keys)} ключей")
+
+    def reload(self):
+        """Перезагрузка справочника из источника"""
+        if self._loader is None:
+            return
+        try:
+            self.load(self._loader())
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке справочника улиц: {e}")
+
+    def _ensure_loaded(self):
+        """Ленивая загрузка справочника при первом обращении"""
+        if not self._loaded and self._loader is not None:
+            self.reload()
+
+    def __len__(self):
+        return len(self._keys) + len(self._overlay)
+
+    def _find(self, key: str) -> Optional[int]:
+        """Поиск ID по точному ключу"""
+        position = bisect_left(self._keys, key)
+        if position < len(self._keys) and self._keys[position] == key:
+            return self._ids[position]
+        return self._overlay.get(key)
+
+    def _find_untyped(self, key: str) -> Optional[int]:
+        """Поиск улицы без указанного типа: подходит, если улица с таким названием одна"""
+        # Ключ без типа оканчивается разделителем и является префиксом ключей с типом
+        found = {street_id for overlay_key, street_id in self._overlay.items() if overlay_key.startswith(key)}
+        position = bisect_left(self._keys, key)
+        while position < len(self._keys) and self._keys[position].startswith(key):
+            found.add(self._ids[position])
+            position += 1
+            if len(found) > 1:
+                return None
+        return found.pop() if len(found) == 1 else None
+
+    def lookup(self, name: str) -> Optional[int]:
+        """ID улицы по названию без регистрации новых улиц"""
+        self._ensure_loaded()
+        key = canonical_street_key(name)
+        if not key:
+            return None
+        street_id = self._find(key)
+        if street_id is None and key.endswith(KEY_SEPARATOR):
+            street_id = self._find_untyped(key)
+        return street_id
+
+    def resolve(self, name: str) -> Optional[int]:
+        """ID улицы по названию с регистрацией неизвестной улицы"""
+        street_id = self.lookup(name)
+        if street_id is not None or self._registrar is None:
+            return street_id
+        key = canonical_street_key(name)
+        if not key:
+            return None
+        try:
+            street_id = self._registrar({key: name.strip()}).get(key)
+        except Exception as e:
+            logger.error(f"Ошибка при регистрации улицы {name}: {e}")
+            return None
+        if street_id is not None:
+            with self._lock:
+                self._overlay[key] = street_id
+                if len(self._overlay) >= OVERLAY_COMPACT_SIZE:
+                    self._compact()
+        return street_id
+
+    def resolve_many(self, names: Iterable[object]) -> List[Optional[int]]:
+        """ID улиц для списка названий (не строки дают None)"""
+        return [self.resolve(name) if isinstance(name, str) else None for name in names]
+
+    def _compact(self):
+        """Слияние дополнительного словаря в отсортированный массив"""
+        merged = dict(zip(self._keys, self._ids))
+        merged.update(self._overlay)
+        self._keys = sorted(merged)
+        self._ids = array('l', (merged[key] for key in self._keys))
+        self._overlay = {}
+
+
+# Глобальный экземпляр справочника улиц
+street_gazetteer = StreetGazetteer()
@@ -0,0 +1,148 @@
+# Модуль для разбора номеров домов и индексации диапазонов домов
+import re
+from bisect import bisect_right
+from functools import lru_cache
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+# Верхняя граница для "всей стороны улицы"
+MAX_HOUSE_NUMBER = 10 ** 6
+
+# Чётность: None - любые дома, 0 - чётные, 1 - нечётные
+ANY_PARITY = None
+EVEN = 0
+ODD = 1
+
+# Регулярные выражения, скомпилированные для производительности
+HOUSE_PREFIX_PATTERN = re.compile(r'^(?:дом|д\.?)\s*')
+RANGE_PATTERN = re.compile(r'(?<![\d/])(\d+)\s*(?:[-–—]|по)\s*(\d+)')
+HOUSE_PATTERN = re.compile(r'^(\d+)\s*-?\s*([а-я])?(?:\s*(?:/|корп\.?|к\.?|стр\.?)\s*(\d+))?$')
+ODD_PATTERN = re.compile(r'нечет|неч\.')
+EVEN_PATTERN = re.compile(r'(?<!не)чет')
+
+
+class HouseNumber(NamedTuple):
+    """Разобранный номер дома: номер, литера и корпус"""
+    number: int
+    letter: str
+    building: Optional[int]
+
+
+@lru_cache(maxsize=65536)
+def parse_house_number(text: str) -> Optional[HouseNumber]:
+    """Разбор одного номера дома ("17", "17а", "2/1", "5 корп. 2")"""
+    text = HOUSE_PREFIX_PATTERN.sub('', text.lower().replace('ё', 'е').strip())
+    match = HOUSE_PATTERN.match(text)
+    if not match:
+        return None
+    number, letter, building = match.groups()
+    return HouseNumber(int(number), letter or '', int(building) if building else None)
+
+
+def _parity_of(text: str):
+    """Определение чётности, указанной в записи о домах"""
+    if ODD_PATTERN.search(text):
+        return ODD
+    if EVEN_PATTERN.search(text):
+        return EVEN
+    return ANY_PARITY
+
+
+@lru_cache(maxsize=65536)
+def parse_house_token(token: str) -> Tuple[Tuple[int, int, Optional[int]], ...]:
+    """
+    Разбор записи о домах из отключения в список интервалов.
+
+    Каждый интервал - это (начало, конец, чётность). Одиночный номер без
+    литеры превращается в вырожденный интервал, "чётная сторона" без
+    номеров - в интервал на всю улицу. Номера с литерой или корпусом
+    интервалов не дают и проверяются только точным совпадением.
+    """
+    text = HOUSE_PREFIX_PATTERN.sub('', token.lower().replace('ё', 'е').strip())
+    parity = _parity_of(text)
+
+    range_match = RANGE_PATTERN.search(text)
+    if range_match:
+        start, end = sorted((int(range_match.group(1)), int(range_match.group(2))))
+        return ((start, end, parity),)
+
+    house = parse_house_number(text)
+    if house is not None:
+        if house.letter or house.building is not None:
+            return ()
+        return ((house.number, house.number, ANY_PARITY),)
+
+    if parity is not ANY_PARITY and not re.search(r'\d', text):
+        return ((1, MAX_HOUSE_NUMBER, parity),)
+
+    return ()
+
+
+def _merge_intervals(intervals: List[Tuple[int, int]]) -> Tuple[List[int], List[int]]:
+    """Слияние пересекающихся интервалов в отсортированные начала и концы"""
+    starts: List[int] = []
+    ends: List[int] = []
+    for start, end in sorted(intervals):
+        if starts and start <= ends[-1] + 1:
+            ends[-1] = max(ends[-1], end)
+        else:
+            starts.append(start)
+            ends.append(end)
+    return starts, ends
+
+
+class HouseIndex:
+    """
+    Индекс домов одного адреса отключения.
+
+    Хранит точные записи о домах и непересекающиеся отсортированные
+    интервалы номеров отдельно для любых, чётных и нечётных домов, поэтому
+    проверка дома группы - это поиск делением пополам.
+    """
+
+    __slots__ = ('tokens', 'singles', '_intervals')
+
+    def __init__(self, houses: Iterable[str]):
+        self.tokens = frozenset(h.lower().strip() for h in houses)
+        self.singles = set()
+        grouped = {ANY_PARITY: [], EVEN: [], ODD: []}
+        for token in self.tokens:
+            for start, end, parity in parse_house_token(token):
+                if start == end and parity is ANY_PARITY:
+                    self.singles.add(start)
+                else:
+                    grouped[parity].append((start, end))
+        self._intervals = {
+            parity: _merge_intervals(intervals)
+            for parity, intervals in grouped.items() if intervals
+        }
+
+    def __bool__(self):
+        return bool(self.tokens)
+
+    def _in_intervals(self, parity, number: int) -> bool:
+        """Проверка попадания номера в интервалы заданной чётности"""
+        intervals = self._intervals.get(parity)
+        if not intervals:
+            return False
+        starts, ends = intervals
+        position = bisect_right(starts, number) - 1
+        return position >= 0 and number <= ends[position]
+
+    def contains(self, house: str) -> bool:
+        """Проверка, затрагивает ли отключение дом группы"""
+        if house in self.tokens:
+            return True
+
+        parsed = parse_house_number(house)
+        if parsed is None:
+            return False
+
+        # Одиночный номер затрагивает сам дом и его корпуса, но не дома с литерой
+        if not parsed.letter and parsed.number in self.singles:
+            return True
+
+        # Диапазоны и стороны улицы затрагивают все дома с номером внутри
+        return (
+            self._in_intervals(ANY_PARITY, parsed.number)
+            or self._in_intervals(parsed.number % 2, parsed.number)
+        )
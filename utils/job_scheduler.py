@@ -0,0 +1,321 @@
+# Модуль планировщика заданий на куче времён запуска
+import asyncio
+import calendar
+import heapq
+import itertools
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Максимальная пауза цикла (в секундах): после перевода системных часов
+# время ближайшего запуска пересчитывается не позже чем через эту паузу
+MAX_SLEEP_SECONDS = 60
+
+# Сколько дней вперёд искать время запуска по cron-выражению
+CRON_SEARCH_DAYS = 366 * 5
+
+# Допустимые значения полей cron-выражения: минуты, часы, дни месяца, месяцы, дни недели
+CRON_FIELD_RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+
+class CronSpec:
+    """
+    Cron-выражение из пяти полей: минуты, часы, день месяца, месяц, день недели.
+
+    Поддерживаются *, списки (1,15), диапазоны (1-5) и шаги (*/10, 8-18/2).
+    День недели 0 и 7 - воскресенье. Если ограничены и день месяца, и день
+    недели, подходит любой из них (как в классическом cron).
+    """
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron-выражение должно состоять из 5 полей: {expression!r}")
+        parsed = [self._parse_field(field, low, high) for field, (low, high) in zip(fields, CRON_FIELD_RANGES)]
+        self.minutes, self.hours, self.days, self.months, weekdays = parsed
+        # Воскресенье приводится к 0, дни недели - к нумерации datetime.weekday() (0 - понедельник)
+        self.weekdays = {(day % 7 - 1) % 7 for day in weekdays}
+        self.days_restricted = fields[2] != '*'
+        self.weekdays_restricted = fields[4] != '*'
+
+    @staticmethod
+    def _parse_field(field: str, low: int, high: int) -> set:
+        values = set()
+        for part in field.split(','):
+            step = 1
+            if '/' in part:
+                part, step_text = part.split('/', 1)
+                step = int(step_text)
+                if step <= 0:
+                    raise ValueError(f"Некорректный шаг в cron-выражении: {field!r}")
+            if part == '*':
+                start, end = low, high
+            elif '-' in part:
+                start_text, end_text = part.split('-', 1)
+                start, end = int(start_text), int(end_text)
+            else:
+                start = int(part)
+                end = high if step > 1 else start
+            if start < low or end > high or start > end:
+                raise ValueError(f"Значение вне допустимого диапазона {low}-{high}: {field!r}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day_match = moment.day in self.days
+        weekday_match = moment.weekday() in self.weekdays
+        if self.days_restricted and self.weekdays_restricted:
+            return day_match or weekday_match
+        return day_match and weekday_match
+
+    def next_after(self, after: datetime) -> datetime:
+        """Ближайшее время запуска строго после after (с точностью до минуты)"""
+        moment = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = after + timedelta(days=CRON_SEARCH_DAYS)
+        while moment <= limit:
+            if moment.month not in self.months:
+                year = moment.year + moment.month // 12
+                moment = moment.replace(year=year, month=moment.month % 12 + 1, day=1, hour=0, minute=0)
+                continue
+            if not self._day_matches(moment):
+                moment = (moment + timedelta(days=1)).replace(hour=0, minute=0)
+                continue
+            if moment.hour not in self.hours:
+                moment = (moment + timedelta(hours=1)).replace(minute=0)
+                continue
+            if moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+                continue
+            return moment
+        raise ValueError(f"Cron-выражение никогда не срабатывает: {self.expression!r}")
+
+
+def add_months(moment: datetime, months: int) -> datetime:
+    """Прибавление календарных месяцев (день ограничивается длиной месяца)"""
+    month_index = moment.month - 1 + months
+    year = moment.year + month_index // 12
+    month = month_index % 12 + 1
+    day = min(moment.day, calendar.monthrange(year, month)[1])
+    return moment.replace(year=year, month=month, day=day)
+
+
+def utc_to_local(moment: datetime) -> datetime:
+    """Перевод времени UTC из базы (без часового пояса) в местное время"""
+    return moment.replace(tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+
+
+def parse_time_of_day(time_of_day: Optional[str]):
+    """Разбор времени суток HH:MM; None, если время не задано"""
+    if not time_of_day:
+        return None
+    hour_text, minute_text = time_of_day.strip().split(':', 1)
+    hour, minute = int(hour_text), int(minute_text)
+    if not (0 <= hour <= 23 and 0 <= minute <= 59):
+        raise ValueError(f"Некорректное время суток: {time_of_day!r}")
+    return hour, minute
+
+
+def validate_task_schedule(interval_type: str, interval_value, time_of_day: Optional[str] = None,
+                           cron_expression: Optional[str] = None, overlap_policy: Optional[str] = None,
+                           timeout_seconds=None):
+    """Проверка расписания задачи; при ошибке выбрасывает ValueError"""
+    if overlap_policy and overlap_policy not in ('skip', 'coalesce', 'queue'):
+        raise ValueError(f"Неизвестная политика наложения запусков: {overlap_policy}")
+    if timeout_seconds is not None and int(timeout_seconds) < 0:
+        raise ValueError("Предельное время выполнения не может быть отрицательным")
+    if interval_type == 'cron':
+        if not cron_expression:
+            raise ValueError("Для типа интервала cron нужно cron-выражение")
+        CronSpec(cron_expression)
+        return
+    if interval_type not in ('minute', 'hour', 'day', 'week', 'month', 'adaptive'):
+        raise ValueError(f"Неизвестный тип интервала: {interval_type}")
+    if int(interval_value) <= 0:
+        raise ValueError("Значение интервала должно быть положительным")
+    parse_time_of_day(time_of_day)
+
+
+def next_run_time(task: dict, after: datetime) -> datetime:
+    """
+    Следующее время запуска задачи после запуска в after (местное время).
+
+    Интервалы minute и hour отсчитываются от after. Для day, week и month
+    прибавляются дни, недели или календарные месяцы, а при заданном
+    time_of_day время запуска выставляется на это время суток. Интервал
+    adaptive берётся из poll_interval_seconds (текущий интервал опроса
+    источника), а до первой проверки источника - из interval_value в минутах.
+    """
+    interval_type = task['interval_type']
+    if interval_type == 'cron':
+        return CronSpec(task['cron_expression']).next_after(after)
+
+    value = int(task['interval_value'])
+    if interval_type == 'adaptive':
+        if task.get('poll_interval_seconds'):
+            return after + timedelta(seconds=task['poll_interval_seconds'])
+        return after + timedelta(minutes=value)
+    if interval_type == 'minute':
+        return after + timedelta(minutes=value)
+    if interval_type == 'hour':
+        return after + timedelta(hours=value)
+    if interval_type == 'day':
+        moment = after + timedelta(days=value)
+    elif interval_type == 'week':
+        moment = after + timedelta(weeks=value)
+    elif interval_type == 'month':
+        moment = add_months(after, value)
+    else:
+        raise ValueError(f"Неизвестный тип интервала: {interval_type}")
+
+    time_of_day = parse_time_of_day(task.get('time_of_day'))
+    if time_of_day:
+        moment = moment.replace(hour=time_of_day[0], minute=time_of_day[1], second=0, microsecond=0)
+    return moment
+
+
+def first_run_time(task: dict, now: datetime) -> datetime:
+    """
+    Время первого запуска задачи после старта планировщика.
+
+    Расписание продолжается от last_run: пропущенные за время остановки
+    запуски сливаются в один запуск сразу после старта. Задача, которая ещё
+    не запускалась, выполняется через интервал, а при заданных time_of_day
+    или cron-выражении - в ближайшее подходящее время.
+    """
+    if task.get('last_run'):
+        return max(now, next_run_time(task, utc_to_local(task['last_run'])))
+    if task['interval_type'] == 'cron':
+        return CronSpec(task['cron_expression']).next_after(now)
+
+    time_of_day = parse_time_of_day(task.get('time_of_day'))
+    if time_of_day and task['interval_type'] in ('day', 'week', 'month'):
+        moment = now.replace(hour=time_of_day[0], minute=time_of_day[1], second=0, microsecond=0)
+        return moment if moment > now else moment + timedelta(days=1)
+    return next_run_time(task, now)
+
+
+class _Job:
+    """Задание планировщика"""
+
+    def __init__(self, key: str, callback: Callable[[], None],
+                 next_time: Callable[[datetime], Optional[datetime]], run_at: datetime):
+        self.key = key
+        self.callback = callback
+        self.next_time = next_time
+        self.run_at = run_at
+        self.cancelled = False
+
+
+class HeapScheduler:
+    """
+    Планировщик заданий в цикле событий asyncio.
+
+    Время следующего запуска заданий хранится в куче, и цикл спит ровно до
+    ближайшего из них; добавление задания будит цикл. После запуска время
+    следующего запуска вычисляется функцией задания от момента запуска.
+    Задание должно быстро вернуть управление (например, создать задачу
+    asyncio), чтобы не задерживать остальные задания.
+    """
+
+    def __init__(self):
+        self._heap: List[tuple] = []
+        self._jobs: Dict[str, _Job] = {}
+        self._counter = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def add_job(self, key: str, callback: Callable[[], None],
+                next_time: Callable[[datetime], Optional[datetime]], run_at: Optional[datetime] = None):
+        """Добавление (или замена) задания; run_at - время первого запуска (по умолчанию next_time(сейчас))"""
+        self.remove_job(key)
+        if run_at is None:
+            run_at = next_time(datetime.now())
+        job = _Job(key, callback, next_time, run_at)
+        self._jobs[key] = job
+        self._push(job)
+        logger.info(f"Задание {key} запланировано на {run_at:%Y-%m-%d %H:%M:%S}")
+
+    def add_interval_job(self, key: str, callback: Callable[[], None], seconds: float):
+        """Добавление задания, выполняемого каждые seconds секунд"""
+        self.add_job(key, callback, lambda after: after + timedelta(seconds=seconds))
+
+    def remove_job(self, key: str):
+        """Удаление задания (запись в куче отбрасывается при извлечении)"""
+        job = self._jobs.pop(key, None)
+        if job is not None:
+            job.cancelled = True
+
+    def clear(self):
+        """Удаление всех заданий"""
+        for job in self._jobs.values():
+            job.cancelled = True
+        self._jobs.clear()
+        self._heap.clear()
+
+    def reschedule(self, key: str, run_at: datetime) -> bool:
+        """Перенос следующего запуска задания; False, если задания нет"""
+        job = self._jobs.get(key)
+        if job is None:
+            return False
+        self.add_job(key, job.callback, job.next_time, run_at)
+        return True
+
+    def get_run_at(self, key: str) -> Optional[datetime]:
+        """Время следующего запуска задания (None, если задания нет)"""
+        job = self._jobs.get(key)
+        return job.run_at if job is not None else None
+
+    def get_jobs(self) -> List[dict]:
+        """Задания и время их следующего запуска"""
+        return [{'key': job.key, 'run_at': job.run_at} for job in sorted(self._jobs.values(), key=lambda job: job.run_at)]
+
+    def _push(self, job: _Job):
+        heapq.heappush(self._heap, (job.run_at, next(self._counter), job))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _run_due(self, now: datetime):
+        """Запуск всех заданий, время которых наступило"""
+        while self._heap and self._heap[0][0] <= now:
+            _, _, job = heapq.heappop(self._heap)
+            if job.cancelled:
+                continue
+            try:
+                job.callback()
+            except Exception as e:
+                logger.error(f"Ошибка при запуске задания {job.key}: {e}", exc_info=True)
+            # Задание могло быть удалено или заменено во время запуска
+            if job.cancelled or self._jobs.get(job.key) is not job:
+                continue
+            try:
+                run_at = job.next_time(now)
+            except Exception as e:
+                logger.error(f"Ошибка при расчёте следующего запуска задания {job.key}: {e}")
+                run_at = None
+            if run_at is None:
+                self._jobs.pop(job.key, None)
+                continue
+            job.run_at = max(run_at, now)
+            self._push(job)
+
+    async def run(self):
+        """Цикл планировщика (работает до отмены задачи)"""
+        self._wakeup = asyncio.Event()
+        logger.info("Запуск цикла планировщика")
+        while True:
+            self._wakeup.clear()
+            now = datetime.now()
+            self._run_due(now)
+            # Отменённые записи не должны определять время пробуждения
+            while self._heap and self._heap[0][2].cancelled:
+                heapq.heappop(self._heap)
+            delay = MAX_SLEEP_SECONDS
+            if self._heap:
+                delay = min(delay, max(0.0, (self._heap[0][0] - datetime.now()).total_seconds()))
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,112 @@
+# Модуль выбора ведущего процесса бота по аренде в общей базе данных
+import argparse
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Optional
+from data.config import LEADER_LEASE_SECONDS, LEADER_HEARTBEAT_SECONDS
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+
+class LeaderElector:
+    """
+    Выбор лидера по аренде в базе данных.
+
+    Каждый процесс бота периодически вызывает heartbeat(): лидер продлевает
+    аренду, резервные процессы пытаются захватить её после истечения.
+    Лидер считает себя лидером только до окончания аренды по своим
+    монотонным часам (с запасом), поэтому процесс после долгой паузы
+    перестаёт действовать как лидер ещё до следующего обращения к базе.
+    Токен ограждения передаётся в записи очереди отправки и журнала
+    доставок и отсекает записи бывшего лидера.
+    """
+
+    def __init__(self, name: str, ttl_seconds: float = LEADER_LEASE_SECONDS, holder: Optional[str] = None):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.holder = holder or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.token: Optional[int] = None
+        self._valid_until = 0.0
+
+    def is_leader(self) -> bool:
+        """Действует ли аренда процесса по его собственным часам"""
+        return self.token is not None and time.monotonic() < self._valid_until
+
+    @property
+    def fencing_token(self) -> Optional[int]:
+        """Токен ограждения лидера (None, если процесс не лидер)"""
+        return self.token if self.is_leader() else None
+
+    def heartbeat(self) -> bool:
+        """Захват или продление аренды; возвращает, является ли процесс лидером"""
+        from databases.manager import db_manager
+        # Срок отсчитывается от начала запроса: ответ базы мог задержаться
+        started = time.monotonic()
+        try:
+            token = db_manager.acquire_lease(self.name, self.holder, self.ttl_seconds)
+        except Exception as e:
+            logger.error(f"Ошибка при продлении аренды {self.name}: {e}")
+            token = self.token if self.is_leader() else None
+        else:
+            # Запас на расхождение часов процессов: лидер уступает раньше, чем аренду смогут захватить
+            self._valid_until = started + self.ttl_seconds * 0.8
+
+        was_leader = self.token is not None
+        if token is not None and token != self.token:
+            if was_leader:
+                self._demote()
+            self.token = token
+            logger.info(f"Процесс {self.holder} стал лидером {self.name} (токен {token})")
+        elif token is None and was_leader:
+            self._demote()
+        return self.is_leader()
+
+    def _demote(self):
+        logger.warning(f"Процесс {self.holder} больше не лидер {self.name} (токен {self.token})")
+        self.token = None
+        self._valid_until = 0.0
+
+    def release(self):
+        """Освобождение аренды при остановке, чтобы резервный процесс стал лидером без ожидания"""
+        if self.token is None:
+            return
+        from databases.manager import db_manager
+        try:
+            db_manager.release_lease(self.name, self.holder)
+        except Exception as e:
+            logger.error(f"Ошибка при освобождении аренды {self.name}: {e}")
+        self.token = None
+        self._valid_until = 0.0
+
+
+def main():
+    """
+    Проверка выбора лидера несколькими процессами на одной базе.
+
+    Пример (в нескольких терминалах, с одним файлом SQLite):
+        DATABASE_URL=sqlite:///leader_test.db python -m utils.leader_election
+    Остановка лидера (Ctrl+C или kill -STOP) передаёт лидерство другому процессу.
+    """
+    parser = argparse.ArgumentParser(description="Проверка выбора лидера по аренде в базе данных")
+    parser.add_argument('--name', default='scheduler', help="Имя аренды")
+    parser.add_argument('--ttl', type=float, default=LEADER_LEASE_SECONDS, help="Срок аренды в секундах")
+    parser.add_argument('--heartbeat', type=float, default=LEADER_HEARTBEAT_SECONDS, help="Интервал продления в секундах")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    elector = LeaderElector(args.name, args.ttl)
+    try:
+        while True:
+            leader = elector.heartbeat()
+            logger.info(f"{elector.holder}: {'лидер, токен ' + str(elector.token) if leader else 'резерв'}")
+            time.sleep(args.heartbeat)
+    except KeyboardInterrupt:
+        elector.release()
+
+
+if __name__ == '__main__':
+    main()
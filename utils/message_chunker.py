@@ -0,0 +1,142 @@
+# Модуль для разбиения HTML-сообщений на части в пределах лимита Telegram
+import re
+from typing import Any, Iterable, List, NamedTuple, Optional, Tuple
+
+# Максимальная длина текста сообщения в Telegram
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+# Регулярные выражения, скомпилированные для производительности
+HTML_TOKEN_PATTERN = re.compile(r'<(/?)([a-zA-Z][a-zA-Z0-9-]*)[^>]*>|&#?[a-zA-Z0-9]+;|[^<&]+|[<&]')
+SPLIT_POINT_PATTERN = re.compile(r'\s')
+
+
+class MessageChunk(NamedTuple):
+    """Часть сообщения и ключи фрагментов, полностью вошедших в неё"""
+    text: str
+    keys: List[Any]
+
+
+def _closing_tags(open_tags: List[Tuple[str, str]]) -> str:
+    """Закрывающие теги для незакрытых тегов в обратном порядке"""
+    return ''.join(f'</{name}>' for name, _ in reversed(open_tags))
+
+
+def split_html(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT) -> List[str]:
+    """
+    Разбиение HTML-текста на части не длиннее limit.
+
+    Разрез делается между тегами и сущностями (&amp; и т.п.), по возможности
+    на пробеле. Незакрытые на границе части теги закрываются в конце части
+    и открываются заново в начале следующей, поэтому каждая часть остаётся
+    корректным HTML для Telegram.
+    """
+    if len(text) <= limit:
+        return [text]
+
+    parts: List[str] = []
+    open_tags: List[Tuple[str, str]] = []  # (имя тега, открывающий тег)
+    current: List[str] = []
+    length = 0
+
+    def flush():
+        nonlocal current, length
+        parts.append(''.join(current) + _closing_tags(open_tags))
+        current = [opening for _, opening in open_tags]
+        length = sum(len(opening) for opening in current)
+
+    for match in HTML_TOKEN_PATTERN.finditer(text):
+        token = match.group(0)
+        is_tag = match.group(2) is not None
+        reserve = len(_closing_tags(open_tags))
+
+        if is_tag and match.group(1):
+            # Закрывающий тег место для себя уже зарезервировал
+            current.append(token)
+            length += len(token)
+            if open_tags and open_tags[-1][0] == match.group(2).lower():
+                open_tags.pop()
+            continue
+
+        if is_tag:
+            # Открывающий тег требует места и под свой закрывающий тег
+            needed = len(token) + len(match.group(2)) + 3
+            if length + needed + reserve > limit and length > 0:
+                flush()
+            current.append(token)
+            length += len(token)
+            open_tags.append((match.group(2).lower(), token))
+            continue
+
+        if len(token) > 1 and token[0] != '&':
+            # Обычный текст можно резать, предпочтительно по пробелам
+            while length + len(token) + reserve > limit:
+                available = limit - length - reserve
+                if available <= 0:
+                    if length > sum(len(opening) for _, opening in open_tags):
+                        flush()
+                        reserve = len(_closing_tags(open_tags))
+                        continue
+                    # Одни только открывающие теги не помещаются - режем хотя бы по символу
+                    available = 1
+                cut = -1
+                for space in SPLIT_POINT_PATTERN.finditer(token, 0, available):
+                    cut = space.end()
+                if cut <= 0:
+                    cut = available
+                current.append(token[:cut])
+                length += cut
+                token = token[cut:]
+                flush()
+                reserve = len(_closing_tags(open_tags))
+            if token:
+                current.append(token)
+                length += len(token)
+            continue
+
+        # Сущность или одиночный символ не разрезаются
+        if length + len(token) + reserve > limit and length > 0:
+            flush()
+        current.append(token)
+        length += len(token)
+
+    if current and length > sum(len(opening) for _, opening in open_tags):
+        parts.append(''.join(current) + _closing_tags(open_tags))
+    return parts
+
+
+def chunk_fragments(fragments: Iterable[Tuple[str, Optional[Any]]],
+                    limit: int = TELEGRAM_MESSAGE_LIMIT) -> List[MessageChunk]:
+    """
+    Сборка фрагментов в сообщения не длиннее limit.
+
+    Фрагменты (текст, ключ) не разрезаются, если помещаются в одно
+    сообщение; слишком длинный фрагмент разбивается split_html. Ключ
+    фрагмента попадает в ту часть, где фрагмент закончился, поэтому
+    по отправленным частям видно, какие фрагменты доставлены полностью.
+    """
+    chunks: List[MessageChunk] = []
+    current: List[str] = []
+    keys: List[Any] = []
+    length = 0
+
+    def flush():
+        nonlocal current, keys, length
+        if current:
+            chunks.append(MessageChunk(''.join(current), keys))
+        current, keys, length = [], [], 0
+
+    for text, key in fragments:
+        if length + len(text) > limit:
+            flush()
+        if len(text) > limit:
+            pieces = split_html(text, limit)
+            for piece in pieces[:-1]:
+                chunks.append(MessageChunk(piece, []))
+            text = pieces[-1]
+        current.append(text)
+        length += len(text)
+        if key is not None:
+            keys.append(key)
+
+    flush()
+    return chunks
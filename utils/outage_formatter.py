@@ -0,0 +1,190 @@
+# Модуль форматирования уведомлений об отключениях и попарного сопоставления адресов
+import json
+import logging
+from utils.address_matcher import address_match, normalize_street_name
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Заголовок уведомления об отключениях
+OUTAGES_HEADER = "<b>⚠️ Обнаружены отключения коммунальных услуг:</b>\n\n"
+
+
+class OutageFormatter:
+    """
+    HTML-фрагменты и сообщения об отключениях для групп.
+
+    Не обращается к базе данных и Telegram, поэтому модуль можно
+    импортировать без настроек бота (например, в бенчмарке).
+    Попарное сопоставление адресов (_filter_outages_by_group_addresses)
+    оставлено для сравнения с индексом адресов.
+    """
+
+    def __init__(self):
+        # Кэш HTML-фрагментов отключений на время подготовки сообщений
+        self._fragment_cache = {}
+    
+    def _format_outages_message(self, outages, group=None, matched_addresses=None):
+        """Форматирование сообщения об отключениях"""
+        if not outages:
+            return "Нет данных об отключениях."
+        # Сообщение собирается списком, без повторных склеек строк
+        return "".join(self._build_outage_fragments(outages, group, matched_addresses))
+    
+    def _build_outage_fragments(self, outages, group=None, matched_addresses=None, header=OUTAGES_HEADER):
+        """
+        HTML-фрагменты сообщения об отключениях, по одному на отключение.
+        
+        Заголовок приклеен к первому фрагменту, поэтому при разбиении
+        сообщения на части он не окажется в конце части отдельно.
+        """
+        fragments = [self._get_outage_fragment(outage, group, matched_addresses) for outage in outages]
+        if fragments:
+            fragments[0] = header + fragments[0]
+        return fragments
+    
+    def _format_address(self, address):
+        """Форматирование одного адреса отключения: улица и дома"""
+        street = address.get('street', '')
+        houses = address.get('houses', [])
+        if houses:
+            return f"{street} ({', '.join(houses)})"
+        return street
+    
+    def _get_outage_address_variant(self, outage, addresses, group=None, matched_addresses=None):
+        """Адрес отключения, показываемый группе (None - показываются все адреса)"""
+        if matched_addresses and matched_addresses.get(outage.id):
+            # Совпавший адрес уже найден индексом адресов
+            return matched_addresses[outage.id]
+        if group and group.addresses:
+            # Получаем адреса группы для фильтрации и находим совпавший адрес
+            group_addresses = json.loads(group.addresses) if group.addresses else []
+            return self._find_matched_address(group_addresses, addresses)
+        return None
+    
+    def _get_outage_fragment(self, outage, group=None, matched_addresses=None):
+        """
+        HTML-фрагмент одного отключения.
+        
+        Фрагменты кэшируются по (ID отключения, показываемый адрес), поэтому
+        отключение, совпавшее со многими группами, форматируется один раз
+        для каждого варианта адреса.
+        """
+        try:
+            addresses = json.loads(outage.addresses) if outage.addresses else []
+            address = self._get_outage_address_variant(outage, addresses, group, matched_addresses) if addresses else None
+        except Exception as e:
+            logger.warning(f"Ошибка при парсинге адресов: {e}")
+            return self._render_outage_fragment(outage, outage.addresses or "")
+        
+        variant = (address.get('street', ''), tuple(address.get('houses', []))) if address else None
+        cache_key = (outage.id, variant)
+        fragment = self._fragment_cache.get(cache_key)
+        if fragment is None:
+            if address:
+                # Показываем только совпавший адрес
+                addresses_text = self._format_address(address)
+            else:
+                # Если группа не передана, показываем все адреса
+                addresses_text = "; ".join(self._format_address(addr) for addr in addresses)
+            fragment = self._render_outage_fragment(outage, addresses_text)
+            self._fragment_cache[cache_key] = fragment
+        return fragment
+    
+    def _render_outage_fragment(self, outage, addresses_text):
+        """Формирование текста для одного отключения"""
+        parts = [f"<b>🏢 Район:</b> {outage.district}\n", f"<b>💡 Ресурс:</b> {outage.resource}\n"]
+        if outage.organization:
+            parts.append(f"<b>🏢 Организация:</b> {outage.organization}\n")
+        if outage.phone:
+            parts.append(f"<b>📞 Телефон:</b> {outage.phone}\n")
+        if addresses_text:
+            parts.append(f"<b>📍 Адреса:</b> {addresses_text}\n")
+        if outage.reason:
+            parts.append(f"<b>📝 Причина:</b> {outage.reason}\n")
+        if outage.start_time and outage.end_time:
+            parts.append(f"<b>⏰ Время:</b> {outage.start_time} - {outage.end_time}\n")
+        parts.append("\n")
+        return "".join(parts)
+    
+    def _normalize_street_name(self, street_name):
+        """Очистка названия улицы от типов улиц и лишних символов"""
+        return normalize_street_name(street_name)
+    
+    def _address_match_utility(self, group_addr, outage_addr):
+        """Утилита для сравнения адресов (вспомогательный метод)"""
+        try:
+            if address_match(group_addr, outage_addr):
+                return True, outage_addr
+            return False, None
+        except Exception as e:
+            logger.error(f"Ошибка при сравнении адресов: {e}")
+            return False, None
+    
+    def _find_matched_address(self, group_addresses, outage_addresses):
+        """Находит совпавший адрес между группой и отключением"""
+        try:
+            # Проходим по всем адресам отключения
+            for outage_addr in outage_addresses:
+                # Проходим по всем адресам группы
+                for group_addr in group_addresses:
+                    is_match, matched_address = self._address_match_utility(group_addr, outage_addr)
+                    if is_match:
+                        return matched_address
+            
+            # Если не нашли совпадение, возвращаем первый адрес
+            return outage_addresses[0] if outage_addresses else None
+        except Exception as e:
+            logger.error(f"Ошибка при поиске совпавшего адреса: {e}")
+            return outage_addresses[0] if outage_addresses else None
+
+    
+    
+    def _filter_outages_by_group_addresses(self, outages, group):
+        """Фильтрация отключений по адресам группы"""
+        try:
+            # Получаем адреса группы
+            group_addresses = json.loads(group.addresses) if group.addresses else []
+            
+            # Если у группы нет адресов, отправляем все отключения
+            if not group_addresses:
+                logger.info(f"Группа {group.name} не имеет указанных адресов, отправляем все отключения")
+                return outages
+            
+            logger.info(f"Фильтрация отключений для группы {group.name} по адресам: {group_addresses}")
+            
+            filtered_outages = []
+            for outage in outages:
+                # Парсим адреса отключения
+                outage_addresses = []
+                try:
+                    outage_addresses = json.loads(outage.addresses) if outage.addresses else []
+                except Exception as e:
+                    logger.warning(f"Ошибка при парсинге адресов отключения {outage.id}: {e}")
+                    continue
+                
+                # Проверяем, есть ли совпадение по адресам
+                if self._addresses_match(group_addresses, outage_addresses):
+                    filtered_outages.append(outage)
+            
+            logger.info(f"Отобрано {len(filtered_outages)} отключений для группы {group.name}")
+            return filtered_outages
+        except Exception as e:
+            logger.error(f"Ошибка при фильтрации отключений для группы {group.name}: {e}")
+            return outages  # Возвращаем все отключения в случае ошибки
+    
+    def _addresses_match(self, group_addresses, outage_addresses):
+        """Проверка совпадения адресов группы и отключения"""
+        try:
+            # Для каждого адреса отключения проверяем совпадение с любым адресом группы
+            for outage_addr in outage_addresses:
+                # Для каждого адреса группы проверяем совпадение
+                for group_addr in group_addresses:
+                    is_match, _ = self._address_match_utility(group_addr, outage_addr)
+                    if is_match:
+                        return True
+            
+            return False
+        except Exception as e:
+            logger.error(f"Ошибка при проверке совпадения адресов: {e}")
+            return False
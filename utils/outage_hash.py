@@ -1,5 +1,6 @@
 import hashlib
 import json
+from utils.outage_time import parse_outage_time
 
 def generate_outage_hash(outage_data):
     """
@@ -11,13 +12,19 @@ def generate_outage_hash(outage_data):
     Returns:
         str: SHA256 хэш данных об отключении
     """
+    # ID улицы из справочника не является содержимым отключения и не влияет на хэш
+    addresses = [
+        {key: value for key, value in address.items() if key != 'street_id'} if isinstance(address, dict) else address
+        for address in outage_data.get('addresses', [])
+    ]
+    
     # Создаем копию данных для хэширования
     hash_data = {
         'district': outage_data.get('district', ''),
         'resource': outage_data.get('resource', ''),
         'organization': outage_data.get('organization', ''),
         'phone': outage_data.get('phone', ''),
-        'addresses': sorted(outage_data.get('addresses', []), key=lambda x: x.get('street', '') if isinstance(x, dict) else ''),
+        'addresses': sorted(addresses, key=lambda x: x.get('street', '') if isinstance(x, dict) else ''),
         'reason': outage_data.get('reason', ''),
         'start': outage_data.get('start', ''),
         'end': outage_data.get('end', '')
@@ -25,4 +32,60 @@ def generate_outage_hash(outage_data):
     
     # Преобразуем в строку и генерируем хэш
     data_string = json.dumps(hash_data, sort_keys=True, ensure_ascii=False)
-    return hashlib.sha256(data_string.encode('utf-8')).hexdigest()
\ No newline at end of file
+    return hashlib.sha256(data_string.encode('utf-8')).hexdigest()
+
+def _normalize_text(value) -> str:
+    """Текст в нижнем регистре без лишних пробелов"""
+    return ' '.join(str(value or '').lower().split())
+
+
+def _normalized_addresses(addresses) -> list:
+    """Набор адресов без учёта порядка, регистра и пробелов"""
+    normalized = set()
+    for address in addresses or []:
+        if isinstance(address, dict):
+            houses = tuple(sorted(_normalize_text(house) for house in address.get('houses', [])))
+            normalized.add((_normalize_text(address.get('street', '')), houses))
+        else:
+            normalized.add((_normalize_text(address), ()))
+    return sorted(normalized)
+
+
+def is_cancelled_outage(outage_data) -> bool:
+    """Отмечено ли отключение на странице как отменённое"""
+    return 'отмена' in _normalize_text(outage_data.get('start', ''))
+
+
+def generate_outage_place_key(outage_data) -> str:
+    """
+    Генерирует хэш места отключения: район, ресурс, организация и
+    нормализованный набор адресов (без времени).
+    
+    По нему отменённое отключение, у которого вместо времени начала
+    указано «отмена», находится среди действующих.
+    """
+    place_data = {
+        'district': _normalize_text(outage_data.get('district', '')),
+        'resource': _normalize_text(outage_data.get('resource', '')),
+        'organization': _normalize_text(outage_data.get('organization', '')),
+        'addresses': _normalized_addresses(outage_data.get('addresses', []))
+    }
+    data_string = json.dumps(place_data, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data_string.encode('utf-8')).hexdigest()
+
+
+def generate_outage_identity(outage_data) -> str:
+    """
+    Генерирует стабильный ключ отключения: место отключения и время начала.
+    
+    В отличие от хэша содержимого ключ не меняется, когда на странице
+    правят время окончания, причину или телефон, поэтому правка
+    распознаётся как изменение уже известного отключения.
+    """
+    starts_at = parse_outage_time(outage_data.get('start', ''))
+    identity_data = {
+        'place': generate_outage_place_key(outage_data),
+        'start': starts_at.isoformat() if starts_at else _normalize_text(outage_data.get('start', ''))
+    }
+    data_string = json.dumps(identity_data, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data_string.encode('utf-8')).hexdigest()
@@ -0,0 +1,142 @@
+# Модуль снимка текущих отключений для команды /outages
+import asyncio
+import json
+import logging
+import time
+from typing import List, Optional
+from databases.manager import db_manager
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Сколько отключений показывает команда /outages
+SNAPSHOT_OUTAGES_LIMIT = 5
+
+# Как часто сверять снимок с версией отключений в базе (в секундах): отключения могут
+# добавляться другим процессом (лидером), а в этом процессе версия повышается только при добавлении
+SNAPSHOT_VERSION_CHECK_SECONDS = 30
+
+
+class OutageSnapshot:
+    """
+    Снимок текущих отключений в памяти с готовым текстом ответа.
+
+    Текст отдаётся только из памяти, без обращения к базе. Сверка версии
+    и сборка снимка выполняются в пуле потоков (refresh): периодически и
+    в фоне после запроса к устаревшему снимку. Добавление отключений
+    повышает версию снимка (bump), и при следующей сверке снимок
+    собирается заново: читаются число действующих отключений и первые
+    SNAPSHOT_OUTAGES_LIMIT из них, а их фрагменты форматируются один раз.
+    Версия отключений в базе сверяется не чаще раза в
+    SNAPSHOT_VERSION_CHECK_SECONDS.
+    """
+
+    def __init__(self, limit: int = SNAPSHOT_OUTAGES_LIMIT,
+                 check_seconds: float = SNAPSHOT_VERSION_CHECK_SECONDS):
+        self.limit = limit
+        self.check_seconds = check_seconds
+        # Версия снимка в этом процессе и версия, по которой собран текст
+        self.version = 0
+        self._built_version = None
+        # Версия отключений в базе на момент сборки и время её последней сверки
+        self._db_version = None
+        self._checked_at = 0.0
+        self.total = 0
+        self.fragments: List[str] = []
+        self._text: Optional[str] = None
+        # Выполняющаяся сверка (одновременно выполняется не больше одной)
+        self._refresh_task: Optional[asyncio.Future] = None
+
+    def bump(self):
+        """Повышение версии после добавления отключений: снимок соберётся при следующей сверке"""
+        self.version += 1
+
+    @staticmethod
+    def _render_fragment(outage) -> str:
+        """Markdown-фрагмент одного отключения"""
+        try:
+            addresses = json.loads(outage.addresses) if outage.addresses else []
+            addresses_parts = []
+            for addr in addresses:
+                street = addr.get('street', '')
+                houses = addr.get('houses', [])
+                if houses:
+                    addresses_parts.append(f"{street} ({', '.join(houses)})")
+                else:
+                    addresses_parts.append(street)
+            addresses_text = "; ".join(addresses_parts)
+        except Exception:
+            addresses_text = outage.addresses or ""
+
+        parts = [f"🏢 *Район:* {outage.district}\n", f"💡 *Ресурс:* {outage.resource}\n"]
+        if outage.organization:
+            parts.append(f"🏢 *Организация:* {outage.organization}\n")
+        if outage.phone:
+            parts.append(f"📞 *Телефон:* {outage.phone}\n")
+        if addresses_text:
+            parts.append(f"📍 *Адреса:* {addresses_text}\n")
+        if outage.reason:
+            parts.append(f"📝 *Причина:* {outage.reason}\n")
+        if outage.start_time and outage.end_time:
+            parts.append(f"⏰ *Время:* {outage.start_time} - {outage.end_time}\n")
+        parts.append("\n")
+        return "".join(parts)
+
+    def _render_text(self) -> str:
+        """Текст ответа команды по собранным фрагментам"""
+        if not self.total:
+            return "На данный момент нет текущих отключений."
+        parts = [f"⚠️ *Текущие отключения* ({self.total} шт.):\n\n"]
+        parts.extend(self.fragments)
+        if self.total > len(self.fragments):
+            parts.append(f"... и ещё {self.total - len(self.fragments)} отключений\n\n")
+        return "".join(parts)
+
+    def _rebuild(self, version: int, db_version: tuple):
+        total, outages = db_manager.get_current_outages(self.limit)
+        self.total = total
+        self.fragments = [self._render_fragment(outage) for outage in outages]
+        self._text = self._render_text()
+        self._built_version = version
+        self._db_version = db_version
+        logger.info(f"Снимок отключений собран: {total} текущих отключений, версия {version}")
+
+    def _refresh(self):
+        """Сверка версии отключений в базе и сборка снимка, если он устарел"""
+        # Версия читается до сборки: повышение во время сборки вызовет ещё одну сборку
+        version = self.version
+        db_version = db_manager.get_outages_version()
+        self._checked_at = time.monotonic()
+        if self._text is None or self._built_version != version or self._db_version != db_version:
+            self._rebuild(version, db_version)
+
+    def is_stale(self) -> bool:
+        """Нужна ли сверка: снимок не собран, версия повышена или пора сверить версию в базе"""
+        return (self._text is None or self._built_version != self.version
+                or time.monotonic() - self._checked_at >= self.check_seconds)
+
+    async def refresh(self):
+        """Сверка и сборка снимка в пуле потоков; одновременные вызовы ждут одну сверку"""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.get_running_loop().run_in_executor(None, self._refresh)
+        await asyncio.shield(self._refresh_task)
+
+    def request_refresh(self):
+        """Фоновая сверка устаревшего снимка без ожидания её завершения"""
+        if not self.is_stale() or (self._refresh_task is not None and not self._refresh_task.done()):
+            return
+        self._refresh_task = asyncio.get_running_loop().run_in_executor(None, self._refresh)
+        self._refresh_task.add_done_callback(self._log_refresh_error)
+
+    @staticmethod
+    def _log_refresh_error(future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"Ошибка при сборке снимка отключений: {future.exception()}")
+
+    def get_text(self) -> Optional[str]:
+        """Текст ответа команды /outages (Markdown) из памяти или None, если снимок ещё не собран"""
+        return self._text
+
+
+# Глобальный снимок отключений
+outage_snapshot = OutageSnapshot()
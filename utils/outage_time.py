@@ -0,0 +1,33 @@
+# Модуль для разбора времени отключений
+import re
+from datetime import datetime
+from typing import Optional
+
+# Дата вида 01.02.2026 (или 01.02.26) и время вида 10:00 в любом порядке
+_DATE_RE = re.compile(r'\b(\d{1,2})\.(\d{1,2})\.(\d{4}|\d{2})\b')
+_TIME_RE = re.compile(r'\b(\d{1,2})[:.](\d{2})\b(?!\.)')
+
+
+def parse_outage_time(text: Optional[str]) -> Optional[datetime]:
+    """
+    Время начала или окончания отключения из текста страницы.
+
+    Возвращает местное время без часового пояса; без даты (пустая ячейка,
+    «отмена», «до устранения») возвращает None, без времени - начало дня.
+    """
+    if not text:
+        return None
+    date_match = _DATE_RE.search(text)
+    if not date_match:
+        return None
+    day, month, year = (int(value) for value in date_match.groups())
+    if year < 100:
+        year += 2000
+    # Время ищется вне даты, чтобы «01.02» из даты не приняли за время
+    rest = text[:date_match.start()] + ' ' + text[date_match.end():]
+    time_match = _TIME_RE.search(rest)
+    hour, minute = (int(value) for value in time_match.groups()) if time_match else (0, 0)
+    try:
+        return datetime(year, month, day, hour, minute)
+    except ValueError:
+        return None
@@ -1,10 +1,12 @@
 # Модуль для парсинга отключений
 import re
+import time
 import requests
 import logging
-from typing import Dict, Optional, Any, List
+from typing import Dict, Optional, Any, List, Tuple
 from bs4 import BeautifulSoup
 from data.config import OUTAGES_URL
+from utils.gazetteer import street_gazetteer
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
@@ -99,7 +101,7 @@ def parse_resource_organization(cell_tag: BeautifulSoup) -> Dict[str, str]:
         return {"resource": "", "organization": "", "phone": ""}
 
 
-def _parse_address_block(block: str) -> Dict[str, Any]:
+def _parse_address_block(block: str, resolve_streets: bool = True) -> Dict[str, Any]:
     """Парсит один блок адреса (улица и дома)."""
     try:
         block = block.strip()
@@ -138,13 +140,15 @@ def _parse_address_block(block: str) -> Dict[str, Any]:
                 h.strip() for h in STREET_HOUSE_SPLIT_PATTERN.split(houses_text) if h.strip()
             ]
 
-        return {"street": street, "houses": houses}
+        # Стабильный ID улицы из справочника для сравнения адресов по числу
+        street_id = street_gazetteer.resolve(street) if street and resolve_streets else None
+        return {"street": street, "houses": houses, "street_id": street_id}
     except Exception as e:
         logger.error(f"Ошибка при парсинге адресного блока: {e}")
         return {"street": "", "houses": []}
 
 
-def parse_addresses_and_reason(cell_tag: BeautifulSoup) -> Dict[str, Any]:
+def parse_addresses_and_reason(cell_tag: BeautifulSoup, resolve_streets: bool = True) -> Dict[str, Any]:
     """
     Парсит ячейку с адресами и причиной отключения.
     Упрощенная и более надежная логика.
@@ -169,7 +173,7 @@ def parse_addresses_and_reason(cell_tag: BeautifulSoup) -> Dict[str, Any]:
         
         addresses = []
         for block in re.split(r';\s*', address_text):
-            parsed_block = _parse_address_block(block)
+            parsed_block = _parse_address_block(block, resolve_streets)
             if parsed_block["street"]:
                 addresses.append(parsed_block)
         
@@ -230,7 +234,42 @@ def parse_outages() -> List[Dict[str, Any]]:
     except Exception as e:
         logger.error(f"Ошибка при получении HTML: {e}")
         raise e
+    return parse_outages_html(content)
 
+
+def fetch_and_parse_outages() -> Tuple[List[Dict[str, Any]], Dict[str, float]]:
+    """
+    Получение и разбор страницы без обращения к справочнику улиц.
+
+    Выполняется в отдельном процессе, где справочник не подключён к базе:
+    ID улиц проставляются потом в основном процессе (resolve_street_ids).
+    Возвращает записи и статистику: длительности получения и разбора
+    страницы и её размер в байтах.
+    """
+    started = time.perf_counter()
+    content = fetch_outages_html()
+    fetched = time.perf_counter()
+    outages_data = parse_outages_html(content, resolve_streets=False)
+    stats = {
+        'fetch': fetched - started,
+        'parse': time.perf_counter() - fetched,
+        # Страница приходит в windows-1251, размер считается в исходной кодировке
+        'bytes_fetched': len(content.encode('windows-1251', errors='replace'))
+    }
+    return outages_data, stats
+
+
+def resolve_street_ids(outages_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Проставление ID улиц из справочника в адреса отключений"""
+    for outage in outages_data:
+        for address in outage.get('addresses', []):
+            if isinstance(address, dict) and address.get('street') and address.get('street_id') is None:
+                address['street_id'] = street_gazetteer.resolve(address['street'])
+    return outages_data
+
+
+def parse_outages_html(content: str, resolve_streets: bool = True) -> List[Dict[str, Any]]:
+    """Разбор HTML страницы отключений (resolve_streets - проставлять ID улиц из справочника)."""
     # Проверяем наличие lxml для ускорения парсинга
     try:
         import lxml  # noqa: F401
@@ -288,7 +327,7 @@ def parse_outages() -> List[Dict[str, Any]]:
                 if data_cell_bg in DATA_ROW_BG_COLORS and first_cell_bg in DATA_ROW_BG_COLORS:
                     logger.debug(f"Парсинг строки {i} как данных об отключении")
                     parsed_resource = parse_resource_organization(cells[0])
-                    parsed_address = parse_addresses_and_reason(cells[1])
+                    parsed_address = parse_addresses_and_reason(cells[1], resolve_streets)
                     parsed_time = parse_time(cells[2])
                     
                     outage_entry = {
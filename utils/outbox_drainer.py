@@ -0,0 +1,127 @@
+# Модуль для отправки сообщений из очереди отправки (outbox)
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from databases.manager import db_manager
+from databases.lease_manager import LeaseLostError
+from data.config import OUTBOX_MAX_ATTEMPTS
+from utils.telegram_sender import MessageEdit
+from utils.delivery_priority import DEFAULT_PRIORITY
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Пауза перед повторной отправкой (в секундах), удваивается с каждой попыткой
+OUTBOX_RETRY_DELAY = 30
+
+# Максимальная пауза перед повторной отправкой (в секундах)
+OUTBOX_MAX_RETRY_DELAY = 3600
+
+
+class OutboxDrainer:
+    """
+    Отправка сообщений из очереди outbox.
+
+    Сообщения читаются из базы, отправляются через TelegramSender и
+    подтверждаются по одному сразу после ответа Telegram, до отправки
+    следующего сообщения группы; срочные сообщения всех групп
+    отправляются раньше плановых. Сообщение об изменении отключения
+    правит ранее отправленное сообщение. Неудачное сообщение получает
+    время следующей попытки, а после исчерпания попыток его совпадения
+    возвращаются в подготовку сообщений. При выборе лидера чтение и
+    подтверждение очереди ограждаются токеном лидера, а перед каждой
+    отправкой проверяется, что процесс всё ещё лидер с тем же токеном.
+    """
+
+    def __init__(self, sender, max_attempts: int = OUTBOX_MAX_ATTEMPTS):
+        self.sender = sender
+        self.max_attempts = max_attempts
+        # Выбор лидера (None - бот работает без него): очередь отправляет только лидер
+        self.leader = None
+
+    def _retry_at(self, attempts: int):
+        """Время следующей попытки (None - попытки исчерпаны)"""
+        if attempts >= self.max_attempts:
+            return None
+        delay = min(OUTBOX_RETRY_DELAY * 2 ** (attempts - 1), OUTBOX_MAX_RETRY_DELAY)
+        return datetime.utcnow() + timedelta(seconds=delay)
+
+    @staticmethod
+    async def _run_sync(func, *args):
+        """Обращение к базе в пуле потоков, чтобы не блокировать цикл событий"""
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+    
+    @staticmethod
+    def _outgoing(message):
+        """Текст нового сообщения или правка отправленного сообщения"""
+        if message.edit_message_id:
+            return MessageEdit(message.edit_message_id, message.body, message.fallback_body or message.body)
+        return message.body
+
+    async def drain(self) -> int:
+        """Отправка всех готовых сообщений очереди; возвращает число доставленных"""
+        fencing_token = None
+        if self.leader is not None:
+            fencing_token = self.leader.fencing_token
+            if fencing_token is None:
+                logger.info("Процесс не лидер, очередь отправки не отправляется")
+                return 0
+        try:
+            messages = await self._run_sync(db_manager.get_due_outbox_messages, 100, fencing_token)
+        except LeaseLostError as e:
+            logger.warning(f"Очередь отправки не отправлена: {e}")
+            return 0
+        except Exception as e:
+            logger.error(f"Ошибка при чтении очереди отправки: {e}")
+            return 0
+        if not messages:
+            return 0
+        # Аренда могла истечь за время чтения очереди (например, после паузы процесса)
+        if self.leader is not None and self.leader.fencing_token != fencing_token:
+            logger.warning("Аренда лидера истекла, очередь отправки не отправлена")
+            return 0
+
+        # Сообщения одного чата идут по приоритету, при равном - в порядке постановки в очередь
+        messages_by_chat = {}
+        for message in messages:
+            messages_by_chat.setdefault(message.chat_id, []).append(message)
+        logger.info(f"Отправка {len(messages)} сообщений из очереди в {len(messages_by_chat)} групп")
+
+        acknowledged = 0
+        
+        def should_continue():
+            # Перед каждой отправкой: приостановленный и потерявший аренду лидер не досылает пакет
+            return self.leader is None or self.leader.fencing_token == fencing_token
+        
+        async def acknowledge(chat_id, index, telegram_message_id):
+            # Подтверждение записывается сразу после ответа Telegram: сбой или остановка процесса
+            # посреди прогона не приведут к повторной отправке уже доставленных сообщений
+            nonlocal acknowledged
+            message = messages_by_chat[chat_id][index]
+            await self._run_sync(db_manager.acknowledge_outbox_message, message.id, telegram_message_id, fencing_token)
+            acknowledged += 1
+        
+        results = await self.sender.send_all({
+            chat_id: [self._outgoing(message) for message in chat_messages]
+            for chat_id, chat_messages in messages_by_chat.items()
+        }, priorities={
+            chat_id: [message.priority if message.priority is not None else DEFAULT_PRIORITY for message in chat_messages]
+            for chat_id, chat_messages in messages_by_chat.items()
+        }, on_delivered=acknowledge, should_continue=should_continue)
+
+        for chat_id, chat_messages in messages_by_chat.items():
+            result = results[chat_id]
+            if result.ok or result.stopped:
+                # Остановленная отправка не пыталась отправить следующее сообщение
+                continue
+            failed_message = chat_messages[result.delivered]
+            attempts = (failed_message.attempts or 0) + 1
+            try:
+                await self._run_sync(
+                    db_manager.fail_outbox_message, failed_message.id, str(result.error), self._retry_at(attempts), fencing_token
+                )
+            except Exception as e:
+                logger.error(f"Ошибка при учёте неудачной отправки сообщения {failed_message.id}: {e}")
+
+        logger.info(f"Из очереди доставлено {acknowledged} из {len(messages)} сообщений")
+        return acknowledged
@@ -0,0 +1,59 @@
+# Модуль замера длительности этапов выполнения задачи
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# Этапы выполнения задачи в порядке конвейера
+PIPELINE_STAGES = ('fetch', 'parse', 'dedupe', 'ingest', 'match', 'render', 'send', 'mark')
+
+# Счётчики объёма работы запуска
+RUN_COUNTERS = ('bytes_fetched', 'rows_parsed', 'rows_new', 'matches_count', 'messages_count', 'sent_count')
+
+
+class StageTimer:
+    """
+    Длительности этапов и счётчики одного запуска задачи.
+
+    Повторные замеры одного этапа складываются. Таймер передаётся в этапы
+    явно, потому что часть из них выполняется в потоке планировщика, а
+    часть - в другом процессе (оттуда длительности приходят готовыми).
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+        # Ошибки этапов, которые не прервали запуск (например, недоступна страница)
+        self.errors: List[str] = []
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - started)
+
+    def add_time(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def count(self, name: str, value: int):
+        self.counters[name] = self.counters.get(name, 0) + int(value or 0)
+
+    def add_error(self, message: str):
+        self.errors.append(message)
+
+
+@contextmanager
+def stage(timer: Optional[StageTimer], name: str):
+    """Замер этапа, если таймер передан"""
+    if timer is None:
+        yield
+        return
+    with timer.stage(name):
+        yield
+
+
+def count(timer: Optional[StageTimer], name: str, value: int):
+    """Увеличение счётчика, если таймер передан"""
+    if timer is not None:
+        timer.count(name, value)
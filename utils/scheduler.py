@@ -1,12 +1,46 @@
 import asyncio
 import logging
-from datetime import datetime
-from utils.outages_parser import parse_outages
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from utils.outages_parser import resolve_street_ids
 from databases.manager import db_manager
 from aiogram import Bot
-from data.config import TELEGRAM_TOKEN
+from data.config import TELEGRAM_TOKEN, CHECK_INTERVAL_HOURS, REMINDER_OFFSETS_MINUTES, REMINDER_CHECK_INTERVAL_SECONDS
+from utils.address_matcher import MatchExplanation
+from utils.outage_formatter import OUTAGES_HEADER, OutageFormatter
+from utils.message_chunker import chunk_fragments, TELEGRAM_MESSAGE_LIMIT
+from utils.telegram_sender import TelegramSender
+from utils.outbox_drainer import OutboxDrainer
+from utils.task_registry import task_registry, RESULT_OUTAGES
+from utils.run_timer import StageTimer, stage, count
+from databases.lease_manager import LeaseLostError
+from databases.outage_manager import EVENT_UPDATED, EVENT_CANCELLED, EVENT_RESOLVED, OUTAGE_CANCELLED, OUTAGE_RESOLVED
+from utils.adaptive_polling import OUTAGES_SOURCE, content_digest, has_emergency
+from utils.timer_wheel import TimerWheel
+from utils.outage_snapshot import outage_snapshot
+from utils.delivery_priority import (
+    DEFAULT_PRIORITY, DELIVERY_HOURLY, DELIVERY_DAILY, delivery_priority, holds_for_digest, is_digest_due
+)
 import json
-import re
+
+# Исходы запуска задачи в истории запусков
+RUN_OK = 'ok'
+RUN_ERROR = 'error'
+RUN_CANCELLED = 'cancelled'
+
+# Заголовки сводок плановых отключений по режимам доставки
+DIGEST_HEADERS = {
+    DELIVERY_HOURLY: "<b>📋 Сводка плановых отключений за час:</b>\n\n",
+    DELIVERY_DAILY: "<b>📋 Сводка плановых отключений за день:</b>\n\n",
+}
+
+# Заголовки сообщений об изменениях отключений и подписи изменённых полей
+UPDATE_TITLES = {
+    EVENT_UPDATED: '✏️ Изменено отключение',
+    EVENT_CANCELLED: '🚫 Отменено отключение',
+    EVENT_RESOLVED: '✅ Отключение завершено',
+}
+CHANGE_LABELS = {'start_time': 'Начало', 'end_time': 'Окончание', 'reason': 'Причина', 'phone': 'Телефон'}
 
 # Настройка логирования
 logging.basicConfig(
@@ -19,269 +53,175 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-class Scheduler:
+class Scheduler(OutageFormatter):
     """Планировщик задач"""
     
-    def __init__(self):
-        self.bot = Bot(token=TELEGRAM_TOKEN)
+    def __init__(self, bot=None):
+        super().__init__()
+        self.bot = bot or Bot(token=TELEGRAM_TOKEN)
+        # Параллельная отправка с ограничением частоты
+        self.sender = TelegramSender(self.bot)
+        # Отправка сообщений из очереди outbox
+        self.drainer = OutboxDrainer(self.sender)
+        # Синхронные этапы задач (парсинг, база данных) выполняются по очереди в одном потоке,
+        # чтобы не блокировать цикл событий бота
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='scheduler')
+        # Очередь отправляется одним обработчиком за раз, иначе сообщения могли бы уйти дважды
+        self._drain_lock = None
+        # Запущенные отправки очереди: они не отменяются вместе с запустившим их заданием
+        self._drain_tasks = set()
+        # Последние состояния опрашиваемых источников (интервал адаптивного опроса)
+        self.poll_states = {}
+        # Выбор лидера (None - бот работает без него)
+        self.leader = None
+        # Сроки напоминаний о скорых отключениях: ключ (ID отключения, смещение в минутах).
+        # Колесо меняется только в потоке планировщика и строится заново при получении лидерства
+        self.reminder_wheel = TimerWheel(max(1, REMINDER_CHECK_INTERVAL_SECONDS))
+        self._reminders_built = False
+    
+    def set_bot(self, bot):
+        """Использование общего экземпляра бота (одна сессия aiohttp на все отправки)"""
+        self.bot = bot
+        self.sender.bot = bot
+    
+    def set_leader(self, leader):
+        """Подключение выбора лидера: записи очереди отправки ограждаются токеном лидера"""
+        self.leader = leader
+        self.drainer.leader = leader
+    
+    @property
+    def fencing_token(self):
+        """Токен ограждения для записей очереди (None без выбора лидера)"""
+        return self.leader.fencing_token if self.leader is not None else None
+    
+    async def close(self):
+        """Остановка планировщика: завершение отправок очереди и потока задач, закрытие сессии бота"""
+        if self._drain_tasks:
+            logger.info("Ожидание завершения отправки очереди")
+            await asyncio.gather(*self._drain_tasks, return_exceptions=True)
+        self._executor.shutdown(wait=True)
+        task_registry.shutdown()
+        await self.bot.close()
+        logger.info("Планировщик остановлен, сессия бота закрыта")
+    
+    async def _run_sync(self, func, *args):
+        """Выполнение синхронного этапа задачи в потоке планировщика"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
     
     async def execute_task(self, task):
-        """Выполнение задачи"""
+        """Выполнение задачи; длительности этапов и исход запуска записываются в историю запусков"""
+        timer = StageTimer()
+        started_at = datetime.utcnow()
+        outcome = RUN_OK
         try:
             logger.info(f"=== НАЧАЛО ВЫПОЛНЕНИЯ ЗАДАЧИ: {task['name']} (ID: {task['id']}) ===")
             
             # Получаем типы задач для этой задачи
-            task_type_objects = self._get_task_types(task)
+            task_type_objects = await self._run_sync(self._get_task_types, task)
             
             if not task_type_objects:
                 logger.warning(f"Для задачи {task['name']} не найдены типы задач")
+                timer.add_error("Не найдены типы задач")
                 return
             
             # Получаем группы для этой задачи
-            groups = self._get_task_groups(task)
+            groups = await self._run_sync(self._get_task_groups, task)
             
             # Сбор данных для всех типов задач
-            outages_data = self._collect_task_outages(task_type_objects)
+            outages_data = await self._collect_task_outages(task_type_objects, timer)
             
-            # Подготовка сообщений
-            messages = self._prepare_messages(groups, outages_data)
+            # Подготовка сообщений о новых отключениях и об изменениях уже отправленных
+            with timer.stage('render'):
+                messages = await self._run_sync(self._prepare_messages, groups, outages_data)
+                updates = await self._run_sync(self._prepare_update_messages) if outages_data else None
             
             # Отправка уведомлений
-            await self._send_notifications(groups, messages, outages_data)
+            await self._send_notifications(groups, messages, outages_data, timer, updates)
             
             # Обновляем время последнего запуска задачи
-            self._update_task_last_run_time(task)
+            with timer.stage('mark'):
+                await self._run_sync(self._update_task_last_run_time, task)
                 
             logger.info(f"=== ЗАВЕРШЕНИЕ ВЫПОЛНЕНИЯ ЗАДАЧИ: {task['name']} ===")
             
+        except asyncio.CancelledError:
+            # Запуск прерван по предельному времени или при остановке бота
+            outcome = RUN_CANCELLED
+            raise
         except Exception as e:
+            timer.add_error(str(e))
             logger.error(f"Критическая ошибка при выполнении задачи {task['name']}: {e}", exc_info=True)
+        finally:
+            if outcome == RUN_OK and timer.errors:
+                outcome = RUN_ERROR
+            self._record_task_run(task, started_at, outcome, timer)
     
-    
-    def _format_outages_message(self, outages, group=None):
-        """Форматирование сообщения об отключениях"""
-        if not outages:
-            return "Нет данных об отключениях."
+    def _record_task_run(self, task, started_at, outcome, timer):
+        """
+        Запись запуска задачи в историю в потоке планировщика.
         
-        message = "<b>⚠️ Обнаружены отключения коммунальных услуг:</b>\n\n"
-        
-        for outage in outages:
-            # Форматируем адреса - если передана группа, показываем только отфильтрованный адрес
-            addresses_text = ""
-            try:
-                addresses = json.loads(outage.addresses) if outage.addresses else []
-                if addresses:
-                    if group and group.addresses:
-                        # Получаем адреса группы для фильтрации
-                        group_addresses = json.loads(group.addresses) if group.addresses else []
-                        # Находим совпавший адрес
-                        matched_address = self._find_matched_address(group_addresses, addresses)
-                        if matched_address:
-                            # Показываем только совпавший адрес
-                            street = matched_address.get('street', '')
-                            houses = matched_address.get('houses', [])
-                            if houses:
-                                addresses_text = f"{street} ({', '.join(houses)})"
-                            else:
-                                addresses_text = street
-                        else:
-                            # Если не удалось определить совпавший адрес, показываем все адреса
-                            addresses_parts = []
-                            for addr in addresses:
-                                street = addr.get('street', '')
-                                houses = addr.get('houses', [])
-                                if houses:
-                                    addresses_parts.append(f"{street} ({', '.join(houses)})")
-                                else:
-                                    addresses_parts.append(street)
-                            addresses_text = "; ".join(addresses_parts)
-                    else:
-                        # Если группа не передана, показываем все адреса
-                        addresses_parts = []
-                        for addr in addresses:
-                            street = addr.get('street', '')
-                            houses = addr.get('houses', [])
-                            if houses:
-                                addresses_parts.append(f"{street} ({', '.join(houses)})")
-                            else:
-                                addresses_parts.append(street)
-                        addresses_text = "; ".join(addresses_parts)
-            except Exception as e:
-                logger.warning(f"Ошибка при парсинге адресов: {e}")
-                addresses_text = outage.addresses or ""
-            
-            # Формируем текст для одного отключения
-            outage_text = f"<b>🏢 Район:</b> {outage.district}\n"
-            outage_text += f"<b>💡 Ресурс:</b> {outage.resource}\n"
-            if outage.organization:
-                outage_text += f"<b>🏢 Организация:</b> {outage.organization}\n"
-            if outage.phone:
-                outage_text += f"<b>📞 Телефон:</b> {outage.phone}\n"
-            if addresses_text:
-                outage_text += f"<b>📍 Адреса:</b> {addresses_text}\n"
-            if outage.reason:
-                outage_text += f"<b>📝 Причина:</b> {outage.reason}\n"
-            if outage.start_time and outage.end_time:
-                outage_text += f"<b>⏰ Время:</b> {outage.start_time} - {outage.end_time}\n"
-            outage_text += "\n"
-            
-            # Проверяем, не превысит ли добавление этого отключения лимит
-            if len(message + outage_text) > 3500:  # Оставляем запас для безопасности
-                # Добавляем информацию о том, что есть еще отключения
-                remaining_count = len(outages) - outages.index(outage)
-                if remaining_count > 0:
-                    message += f"...и еще {remaining_count} отключений\n\n"
-                break
-            else:
-                message += outage_text
-        
-        return message
-    
-    def _normalize_street_name(self, street_name):
-        """Очистка названия улицы от типов улиц и лишних символов"""
-        return re.sub(
-            r'\s*(улица|ул\.?|проспект|пр-т|переулок|пер\.?|площадь|пл\.?|проезд|бульвар|б-р|набережная|наб\.?)\s*$',
-            '',
-            street_name
-        ).strip()
-    
-    def _address_match_utility(self, group_addr, outage_addr):
-        """Утилита для сравнения адресов (вспомогательный метод)"""
-        try:
-            outage_street = outage_addr.get('street', '').lower().strip()
-            outage_houses = [h.lower().strip() for h in outage_addr.get('houses', [])]
-            
-            group_addr_clean = group_addr.lower().strip()
-            
-            # Проверяем точное совпадение улицы
-            if group_addr_clean == outage_street:
-                return True, outage_addr
-            
-            # Проверяем совпадение с очищенными названиями улиц
-            cleaned_outage_street = self._normalize_street_name(outage_street)
-            cleaned_group_addr = self._normalize_street_name(group_addr_clean)
-            
-            # Проверяем совпадение очищенных названий улиц
-            if cleaned_outage_street in cleaned_group_addr or cleaned_group_addr in cleaned_outage_street:
-                # Если для улицы указаны дома, проверяем совпадение домов
-                if outage_houses:
-                    # Извлекаем номер дома из адреса группы (если есть)
-                    house_match = re.search(r'(\d+[а-я]?)$', group_addr_clean)
-                    if house_match:
-                        group_house = house_match.group(1)
-                        if group_house in outage_houses:
-                            return True, outage_addr
-                    # Если дом не указан в адресе группы, отправляем уведомление по улице
-                    elif not re.search(r'\d', group_addr_clean):
-                        return True, outage_addr
-                else:
-                    # Если дома не указаны в отключении, отправляем уведомление по улице
-                    return True, outage_addr
-        
-            return False, None
-        except Exception as e:
-            logger.error(f"Ошибка при сравнении адресов: {e}")
-            return False, None
-    
-    def _find_matched_address(self, group_addresses, outage_addresses):
-        """Находит совпавший адрес между группой и отключением"""
-        try:
-            # Проходим по всем адресам отключения
-            for outage_addr in outage_addresses:
-                # Проходим по всем адресам группы
-                for group_addr in group_addresses:
-                    is_match, matched_address = self._address_match_utility(group_addr, outage_addr)
-                    if is_match:
-                        return matched_address
-            
-            # Если не нашли совпадение, возвращаем первый адрес
-            return outage_addresses[0] if outage_addresses else None
-        except Exception as e:
-            logger.error(f"Ошибка при поиске совпавшего адреса: {e}")
-            return outage_addresses[0] if outage_addresses else None
-
-    
+        Запись не ожидается: она вызывается и из finally отменённого
+        запуска, а остановка планировщика дождётся её вместе с потоком.
+        """
+        finished_at = datetime.utcnow()
+        stages_text = ", ".join(f"{name} {seconds:.2f} с" for name, seconds in timer.stages.items())
+        logger.info(f"Задача {task['name']}: {outcome} за {(finished_at - started_at).total_seconds():.2f} с ({stages_text})")
+        asyncio.get_running_loop().run_in_executor(
+            self._executor, self._write_task_run, task, started_at, finished_at, outcome, timer
+        )
     
-    def _filter_outages_by_group_addresses(self, outages, group):
-        """Фильтрация отключений по адресам группы"""
+    def _write_task_run(self, task, started_at, finished_at, outcome, timer):
+        """Запись запуска задачи в историю (ошибка записи не влияет на выполнение задачи)"""
         try:
-            # Получаем адреса группы
-            group_addresses = json.loads(group.addresses) if group.addresses else []
-            
-            # Если у группы нет адресов, отправляем все отключения
-            if not group_addresses:
-                logger.info(f"Группа {group.name} не имеет указанных адресов, отправляем все отключения")
-                return outages
-            
-            logger.info(f"Фильтрация отключений для группы {group.name} по адресам: {group_addresses}")
-            
-            filtered_outages = []
-            for outage in outages:
-                # Парсим адреса отключения
-                outage_addresses = []
-                try:
-                    outage_addresses = json.loads(outage.addresses) if outage.addresses else []
-                except Exception as e:
-                    logger.warning(f"Ошибка при парсинге адресов отключения {outage.id}: {e}")
-                    continue
-                
-                # Проверяем, есть ли совпадение по адресам
-                if self._addresses_match(group_addresses, outage_addresses):
-                    filtered_outages.append(outage)
-            
-            logger.info(f"Отобрано {len(filtered_outages)} отключений для группы {group.name}")
-            return filtered_outages
+            db_manager.add_task_run(
+                task['id'], task['name'], started_at, finished_at, outcome,
+                timer.stages, timer.counters, "; ".join(timer.errors) or None
+            )
         except Exception as e:
-            logger.error(f"Ошибка при фильтрации отключений для группы {group.name}: {e}")
-            return outages  # Возвращаем все отключения в случае ошибки
+            logger.error(f"Ошибка при записи запуска задачи {task['name']}: {e}")
     
-    def _addresses_match(self, group_addresses, outage_addresses):
-        """Проверка совпадения адресов группы и отключения"""
+    def _ingest_outages_data(self, outages_data, timer=None):
+        """Сохранение разобранных отключений (ID улиц проставляются по справочнику в этом процессе)"""
         try:
-            # Для каждого адреса отключения проверяем совпадение с любым адресом группы
-            for outage_addr in outage_addresses:
-                # Для каждого адреса группы проверяем совпадение
-                for group_addr in group_addresses:
-                    is_match, _ = self._address_match_utility(group_addr, outage_addr)
-                    if is_match:
-                        return True
-            
-            return False
-        except Exception as e:
-            logger.error(f"Ошибка при проверке совпадения адресов: {e}")
-            return False
-    def _collect_outages_data(self):
-        """Сбор данных об отключениях"""
-        try:
-            outages_data = parse_outages()
             logger.info(f"Получено {len(outages_data)} записей об отключениях")
+            with stage(timer, 'ingest'):
+                resolve_street_ids(outages_data)
             # Сохраняем данные в базу
-            outages = db_manager.add_outages(outages_data)
+            outages = db_manager.add_outages(outages_data, timer)
             logger.info(f"Сохранено {len(outages)} записей в базу данных")
+            # Снимок для команды /outages соберётся заново при следующей сверке
+            outage_snapshot.bump()
+            if self._reminders_built:
+                self._schedule_reminders((outage.id, outage.starts_at) for outage in outages)
+            self._record_outages_check(outages_data)
             return outages_data
         except Exception as e:
-            logger.error(f"Ошибка при проверке отключений: {e}")
+            logger.error(f"Ошибка при сохранении отключений: {e}")
+            if timer is not None:
+                timer.add_error(f"Ошибка при сохранении отключений: {e}")
             return None
     
+    def _record_outages_check(self, outages_data):
+        """Учёт проверки страницы отключений для адаптивного интервала опроса"""
+        try:
+            self.poll_states[OUTAGES_SOURCE] = db_manager.record_source_check(
+                OUTAGES_SOURCE,
+                content_digest(outages_data),
+                has_emergency(outages_data),
+                CHECK_INTERVAL_HOURS * 3600
+            )
+        except Exception as e:
+            logger.error(f"Ошибка при учёте проверки страницы отключений: {e}")
     
-    
-    def _mark_outages_as_notified(self, outages_data):
-        """Пометить отключения как нотифицированные"""
-        if outages_data:
-            unnotified_outages = db_manager.get_unnotified_outages()
-            if unnotified_outages:
-                outage_ids = [outage.id for outage in unnotified_outages]
-                db_manager.mark_outages_as_notified(outage_ids)
-                logger.info(f"Помечено {len(outage_ids)} отключений как нотифицированные")
-    
-    def _add_notification_to_history(self, event_type, event_id, group_id, message):
-        """Добавить уведомление в историю"""
-        db_manager.add_notification(
-            event_type=event_type,
-            event_id=event_id,
-            group_id=group_id,
-            message=message
-        )
+    def get_poll_interval(self, source: str = OUTAGES_SOURCE):
+        """Текущий интервал опроса источника в секундах (None, если источник не проверялся)"""
+        state = self.poll_states.get(source)
+        if state is None:
+            state = db_manager.get_source_state(source)
+            if state is not None:
+                self.poll_states[source] = state
+        return state['interval_seconds'] if state else None
     
     def _get_task_groups(self, task):
         """Получить группы для задачи"""
@@ -323,48 +263,321 @@ class Scheduler:
                 # Исключение будет перехвачено и записано в вызывающем коде
                 raise
 
-    def _collect_task_outages(self, task_type_objects):
-        """Сбор данных об отключениях для задачи"""
+    async def _collect_task_outages(self, task_type_objects, timer=None):
+        """
+        Сбор данных об отключениях для задачи.
+        
+        Обработчик каждого типа задачи выполняется в пуле, указанном в
+        реестре типов, а его результат сохраняется в потоке планировщика.
+        """
         outages_data = None
         for task_type_obj in task_type_objects:
             task_type_name = task_type_obj.name
-            logger.info(f"Выполнение типа задачи: {task_type_name}")
+            handler = task_registry.get(task_type_name)
+            if handler is None:
+                logger.warning(f"Для типа задачи {task_type_name} не зарегистрирован обработчик")
+                continue
+            logger.info(f"Выполнение типа задачи: {task_type_name} ({handler.execution})")
             
-            if task_type_name == 'outages_check':
-                outages_data = self._collect_outages_data()
+            try:
+                result = await task_registry.run(task_type_name)
+            except Exception as e:
+                logger.error(f"Ошибка при выполнении типа задачи {task_type_name}: {e}")
+                if timer is not None:
+                    timer.add_error(f"{task_type_name}: {e}")
+                continue
+            if handler.result == RESULT_OUTAGES and result is not None:
+                rows, stats = result
+                if timer is not None:
+                    timer.add_time('fetch', stats.get('fetch', 0.0))
+                    timer.add_time('parse', stats.get('parse', 0.0))
+                    timer.count('bytes_fetched', stats.get('bytes_fetched', 0))
+                    timer.count('rows_parsed', len(rows))
+                outages_data = await self._run_sync(self._ingest_outages_data, rows, timer)
         
         return outages_data
 
     def _prepare_messages(self, groups, outages_data):
-        """Подготовка сообщений для уведомлений"""
+        """
+        Подготовка сообщений для уведомлений.
+        
+        Плановые отключения групп со сводками не отправляются сразу: их
+        совпадения остаются неотправленными до сводки группы.
+        """
         messages = []
         if outages_data:
-            unnotified_outages = db_manager.get_unnotified_outages()
-            if unnotified_outages:
-                logger.info(f"Найдено {len(unnotified_outages)} новых отключений для уведомления")
-                # Фильтруем отключения по группам и формируем сообщения
-                for group in groups:
-                    group_outages = self._filter_outages_by_group_addresses(unnotified_outages, group)
-                    if group_outages:
-                        message = self._format_outages_message(group_outages, group)
-                        messages.append({
-                            'type': 'outage',
-                            'content': message,
-                            'group_id': group.group_id,
-                            'outages': group_outages
-                        })
+            # Совпадения сохраняются при добавлении отключений и изменении групп,
+            # здесь только читаются неотправленные совпадения нужных групп
+            pending_matches = db_manager.get_pending_matches([group.id for group in groups])
+            now = datetime.now()
+            held = 0
+            ready_matches = []
+            for match, outage, group in pending_matches:
+                priority = delivery_priority(outage.reason, outage.starts_at, match.score, now)
+                if holds_for_digest(group.delivery_mode, priority, outage.starts_at, now):
+                    held += 1
+                else:
+                    ready_matches.append((match, outage, group))
+            if held:
+                logger.info(f"Отложено до сводки {held} совпадений плановых отключений")
+            if ready_matches:
+                logger.info(f"Найдено {len(ready_matches)} неотправленных совпадений отключений с группами")
+                messages = self._build_match_messages(groups, ready_matches, now)
             else:
                 logger.info("Нет новых отключений для уведомления")
         return messages
+    
+    def _build_match_messages(self, groups, pending_matches, now, headers=None):
+        """
+        Сообщения групп по неотправленным совпадениям.
+        
+        headers - заголовки сообщений по ID групп (по умолчанию OUTAGES_HEADER).
+        """
+        messages = []
+        matches_by_group = {}
+        for match, outage, group in pending_matches:
+            matches_by_group.setdefault(group.id, []).append((match, outage))
+        # Группы с одинаковым набором совпадений получают один общий текст
+        self._fragment_cache.clear()
+        bodies = {}
+        
+        for group in groups:
+            group_matches = matches_by_group.get(group.id)
+            if not group_matches:
+                continue
+            # Срочные отключения идут первыми, чтобы попасть в первую часть сообщения
+            priorities = {
+                match.id: delivery_priority(outage.reason, outage.starts_at, match.score, now)
+                for match, outage in group_matches
+            }
+            group_matches.sort(key=lambda item: (priorities[item[0].id], item[1].id))
+            header = (headers or {}).get(group.id, OUTAGES_HEADER)
+            group_outages = []
+            matched_addresses = {}
+            match_details = []
+            for match, outage in group_matches:
+                group_outages.append(outage)
+                matched_address = self._get_outage_address(outage, match.address_index)
+                if matched_address is not None:
+                    matched_addresses[outage.id] = matched_address
+                # Объяснения совпадений сохраняются в историю для настройки порога
+                explanation = MatchExplanation(match.method, match.score, match.group_address)
+                match_details.append(explanation.to_dict(
+                    outage_id=outage.id,
+                    outage_street=matched_address.get('street') if matched_address else None
+                ))
+            logger.info(f"Отобрано {len(group_outages)} отключений для группы {group.name}")
+            body_key = (header,) + tuple((outage.id, match.address_index) for match, outage in group_matches)
+            if any(match.address_index is None for match, _ in group_matches):
+                # Без совпавшего адреса текст зависит от адресов самой группы
+                body_key += (group.addresses,)
+            fragments = bodies.get(body_key)
+            if fragments is None:
+                fragments = self._build_outage_fragments(group_outages, group, matched_addresses, header)
+                bodies[body_key] = fragments
+            messages.append({
+                'type': 'outage',
+                'content': "".join(fragments),
+                'group_id': group.group_id,
+                'outages': group_outages,
+                'match_details': match_details,
+                'match_ids': [match.id for match, _ in group_matches],
+                'priorities': priorities,
+                # Фрагменты с ключами (ID совпадения, ID отключения) для разбиения на части
+                'fragments': [
+                    (fragment, (match.id, outage.id))
+                    for fragment, (match, outage) in zip(fragments, group_matches)
+                ]
+            })
+        return messages
+    
+    def _get_outage_address(self, outage, address_index):
+        """Адрес отключения по номеру (None для совпадений без конкретного адреса)"""
+        if address_index is None:
+            return None
+        try:
+            addresses = json.loads(outage.addresses) if outage.addresses else []
+            return addresses[address_index] if address_index < len(addresses) else None
+        except Exception as e:
+            logger.warning(f"Ошибка при парсинге адресов отключения {outage.id}: {e}")
+            return None
 
-    async def _send_notifications(self, groups, messages, outages_data):
-        """Отправка уведомлений"""
-        if messages:
-            # Отправляем обычные уведомления
-            logger.info(f"Отправка уведомлений")
-            sent_count = 0
-            error_count = 0
+    async def _send_notifications(self, groups, messages, outages_data, timer=None, updates=None):
+        """Постановка уведомлений и сообщений об изменениях (сообщения, ID событий) в очередь отправки и отправка очереди"""
+        with stage(timer, 'render'):
+            outbox_messages = self._build_outbox_messages(messages)
+        update_messages, event_ids = updates or ([], [])
+        
+        with stage(timer, 'send'):
+            if outbox_messages or event_ids:
+                # Процесс, переставший быть лидером, получит LeaseLostError и ничего не запишет
+                if self.leader is not None and self.fencing_token is None:
+                    raise LeaseLostError("Процесс не лидер, сообщения не поставлены в очередь")
+            if outbox_messages:
+                # Все части ставятся в очередь одной транзакцией: после сбоя они будут отправлены заново
+                db_manager.enqueue_outbox_messages(outbox_messages, self.fencing_token)
+                logger.info(f"Поставлено в очередь {len(outbox_messages)} сообщений для {len({message['chat_id'] for message in outbox_messages})} групп")
+            else:
+                logger.info("Нет данных для отправки уведомлений")
+            if event_ids:
+                db_manager.enqueue_outage_updates(update_messages, event_ids, self.fencing_token)
             
+            # Отправляем очередь сразу, не дожидаясь периодической отправки
+            sent_count = await self._drain_shielded()
+        count(timer, 'messages_count', len(outbox_messages) + len(update_messages))
+        count(timer, 'sent_count', sent_count)
+    
+    def _render_update_fragment(self, event, outage, addresses_text):
+        """Краткий текст изменения отключения: что изменилось, без повторения всего уведомления"""
+        parts = [f"<b>{UPDATE_TITLES[event.event_type]}:</b> {outage.resource}, {outage.district}\n"]
+        if addresses_text:
+            parts.append(f"<b>📍 Адреса:</b> {addresses_text}\n")
+        if event.event_type == EVENT_UPDATED:
+            changes = json.loads(event.changes) if event.changes else {}
+            for field, (old_value, new_value) in changes.items():
+                parts.append(f"<b>{CHANGE_LABELS.get(field, field)}:</b> <s>{old_value or '—'}</s> → {new_value or '—'}\n")
+        elif outage.start_time and outage.end_time:
+            parts.append(f"<b>⏰ Время:</b> {outage.start_time} - {outage.end_time}\n")
+        parts.append("\n")
+        return "".join(parts)
+    
+    def _update_address_text(self, outage, match, group):
+        """Адрес отключения в сообщении об изменении - тот же, что в уведомлении группы"""
+        address = self._get_outage_address(outage, match.address_index)
+        if address is None:
+            try:
+                addresses = json.loads(outage.addresses) if outage.addresses else []
+                address = self._get_outage_address_variant(outage, addresses, group) if addresses else None
+            except Exception as e:
+                logger.warning(f"Ошибка при парсинге адресов: {e}")
+        return self._format_address(address) if address else ""
+    
+    def _mark_outage_fragment(self, fragment, outage, event=None):
+        """Пометка фрагмента отключения в изменённом уведомлении: отменено, завершено или что изменилось"""
+        if outage.status == OUTAGE_CANCELLED:
+            return f"<b>🚫 Отменено</b>\n<s>{fragment.rstrip()}</s>\n\n"
+        if outage.status == OUTAGE_RESOLVED:
+            return f"<b>✅ Завершено</b>\n{fragment}"
+        if event is not None and event.event_type == EVENT_UPDATED and event.changes:
+            labels = ", ".join(CHANGE_LABELS.get(field, field) for field in json.loads(event.changes))
+            return f"<b>✏️ Изменено: {labels}</b>\n{fragment}"
+        return fragment
+    
+    def _render_edited_message(self, body, matches, group, events):
+        """
+        Новый текст отправленного уведомления с текущими полями его отключений.
+        
+        Фрагменты собираются в прежнем порядке, заголовок сохраняется, если
+        он был в сообщении; None, если сообщение собрать не удалось.
+        """
+        fragments = []
+        for match, outage in matches:
+            matched_address = self._get_outage_address(outage, match.address_index)
+            fragment = self._get_outage_fragment(
+                outage, group, {outage.id: matched_address} if matched_address is not None else None
+            )
+            fragments.append(self._mark_outage_fragment(fragment, outage, events.get(outage.id)))
+        if not fragments:
+            return None
+        text = "".join(fragments)
+        for header in (OUTAGES_HEADER, *DIGEST_HEADERS.values()):
+            if body and body.startswith(header):
+                return header + text
+        return text
+    
+    def _prepare_update_messages(self):
+        """
+        Сообщения об изменениях отключений: (сообщения, ID обработанных событий).
+        
+        Изменение, отмена или завершение отключения сообщается только
+        группам, которым уже доставлено уведомление о нём. Если ID
+        отправленного уведомления известен, уведомление правится заново
+        собранным текстом, а краткий текст изменений отправляется новым
+        сообщением, только если правка невозможна (истёк срок правки или
+        сообщение удалено). Остальные группы получают одно сообщение со
+        всеми изменениями.
+        """
+        events = db_manager.get_pending_outage_events()
+        if not events:
+            return [], []
+        # Поля изменённых отключений уже обновлены, прежние фрагменты устарели
+        self._fragment_cache.clear()
+        edits = {}
+        fragments_by_group = {}
+        priorities = {}
+        now = datetime.now()
+        for event, outage, targets in events:
+            for match, group, message_id, outbox_id in targets:
+                fragment = self._render_update_fragment(event, outage, self._update_address_text(outage, match, group))
+                key = (event.id, outage.id)
+                priorities[(key, group.group_id)] = delivery_priority(outage.reason, outage.starts_at, match.score, now)
+                if not (message_id and outbox_id):
+                    fragments_by_group.setdefault(group.group_id, []).append((fragment, key))
+                    continue
+                edit = edits.setdefault(outbox_id, {
+                    'chat_id': group.group_id, 'group': group, 'message_id': message_id, 'fragments': [], 'events': {}
+                })
+                edit['fragments'].append((fragment, key))
+                edit['events'][outage.id] = event
+        
+        messages = []
+        sent_messages = db_manager.get_sent_outage_messages(list(edits)) if edits else {}
+        for outbox_id, edit in edits.items():
+            body, matches = sent_messages.get(outbox_id, (None, []))
+            text = self._render_edited_message(body, matches, edit['group'], edit['events'])
+            fallback = "".join(fragment for fragment, _ in edit['fragments'])
+            if text is None or len(text) > TELEGRAM_MESSAGE_LIMIT or len(fallback) > TELEGRAM_MESSAGE_LIMIT:
+                # Уведомление не собирается в одно сообщение - изменения отправляются новым сообщением
+                fragments_by_group.setdefault(edit['chat_id'], []).extend(edit['fragments'])
+                continue
+            keys = [key for _, key in edit['fragments']]
+            messages.append({
+                'chat_id': edit['chat_id'],
+                'priority': min(priorities[(key, edit['chat_id'])] for key in keys),
+                'body': text,
+                'edit_message_id': edit['message_id'],
+                'fallback_body': fallback,
+                # Совпадения уведомления: если правка заменится новым сообщением, править будут уже его
+                'match_ids': [match.id for match, _ in matches],
+                'outage_ids': list(dict.fromkeys(outage_id for _, outage_id in keys)),
+                'event_ids': [event_id for event_id, _ in keys]
+            })
+        
+        for chat_id, fragments in fragments_by_group.items():
+            group_priorities = {key: priority for (key, group_chat_id), priority in priorities.items() if group_chat_id == chat_id}
+            fragments.sort(key=lambda item: group_priorities[item[1]])
+            chunks = chunk_fragments(fragments)
+            for chunk, priority in zip(chunks, self._chunk_priorities(chunks, group_priorities.get)):
+                messages.append({
+                    'chat_id': chat_id,
+                    'priority': priority,
+                    'body': chunk.text,
+                    'outage_ids': list(dict.fromkeys(outage_id for _, outage_id in chunk.keys)),
+                    'event_ids': [event_id for event_id, _ in chunk.keys]
+                })
+        logger.info(f"Найдено {len(events)} изменений отключений, подготовлено {len(messages)} сообщений ({sum(1 for message in messages if 'edit_message_id' in message)} правок)")
+        return messages, [event.id for event, _, _ in events]
+    
+    @staticmethod
+    def _chunk_priorities(chunks, key_priority):
+        """
+        Приоритеты частей сообщения: самый срочный из приоритетов ключей части.
+        
+        Часть без ключей (начало длинного фрагмента) получает приоритет
+        следующей части, чтобы не отстать от продолжения в очереди.
+        """
+        priorities = []
+        next_priority = DEFAULT_PRIORITY
+        for chunk in reversed(chunks):
+            if chunk.keys:
+                next_priority = min(key_priority(key) for key in chunk.keys)
+            priorities.append(next_priority)
+        return priorities[::-1]
+    
+    def _build_outbox_messages(self, messages):
+        """Нарезка сообщений групп на части для очереди отправки"""
+        outbox_messages = []
+        if messages:
             # Группируем сообщения по группам
             grouped_messages = {}
             for msg in messages:
@@ -373,39 +586,221 @@ class Scheduler:
                     grouped_messages[group_id] = []
                 grouped_messages[group_id].append(msg)
             
-            # Отправляем сообщение для каждой группы
+            # Сообщения группы режутся по границам фрагментов на части не длиннее лимита Telegram,
+            # каждая часть становится строкой очереди со своими совпадениями и отключениями
             for group_id, group_messages in grouped_messages.items():
-                try:
-                    # Объединяем все сообщения для группы в одно
-                    combined_message = ""
-                    for msg in group_messages:
-                        combined_message += msg['content'] + "\n\n"
-                    
-                    # Проверяем длину сообщения
-                    if len(combined_message) > 4000:
-                        combined_message = combined_message[:3900] + "\n\n... (сообщение сокращено)"
-                    
-                    await self.bot.send_message(chat_id=group_id, text=combined_message, parse_mode="HTML")
-                    logger.info(f"Отправлено уведомление в группу {group_id}")
-                    
-                    # Записываем в историю уведомлений (одна запись на группу)
-                    self._add_notification_to_history(
-                        event_type="outage",
-                        event_id=1,
-                        group_id=group_id,
-                        message=combined_message
-                    )
-                    sent_count += 1
-                except Exception as e:
-                    logger.error(f"Ошибка при отправке уведомления в группу {group_id}: {e}")
-                    error_count += 1
-            
-            logger.info(f"Уведомления отправлены. Успешно: {sent_count}, Ошибок: {error_count}")
-            
-            # Помечаем отключения как нотифицированные (если были отключения)
-            self._mark_outages_as_notified(outages_data)
-        else:
-            logger.info("Нет данных для отправки уведомлений")
+                fragments = []
+                match_details = []
+                priorities = {}
+                for msg in group_messages:
+                    fragments.extend(msg.get('fragments') or [(msg['content'] + "\n\n", None)])
+                    match_details.extend(msg.get('match_details', []))
+                    priorities.update(msg.get('priorities', {}))
+                
+                chunks = chunk_fragments(fragments)
+                chunk_priorities = self._chunk_priorities(
+                    chunks, lambda key: priorities.get(key[0], DEFAULT_PRIORITY)
+                )
+                for chunk, priority in zip(chunks, chunk_priorities):
+                    outage_ids = [outage_id for _, outage_id in chunk.keys]
+                    chunk_outage_ids = set(outage_ids)
+                    outbox_messages.append({
+                        'chat_id': group_id,
+                        'event_type': 'outage',
+                        'priority': priority,
+                        'body': chunk.text,
+                        'match_ids': [match_id for match_id, _ in chunk.keys],
+                        'outage_ids': outage_ids,
+                        'match_details': [
+                            detail for detail in match_details
+                            if detail.get('outage_id') in chunk_outage_ids
+                        ]
+                    })
+        return outbox_messages
+    
+    def reset_reminders(self):
+        """Сброс колеса напоминаний: оно будет построено заново при следующей проверке"""
+        self._reminders_built = False
+    
+    def _schedule_reminders(self, outages):
+        """
+        Постановка сроков напоминаний в колесо по парам (ID отключения, время начала).
+        
+        Из уже наступивших сроков отключения ставится только последний
+        (с наименьшим смещением), чтобы после простоя группа не получила
+        несколько напоминаний подряд. Повторная постановка заменяет срок.
+        """
+        now = datetime.now()
+        for outage_id, starts_at in outages:
+            if starts_at is None or starts_at <= now:
+                continue
+            overdue = None
+            for offset_minutes in REMINDER_OFFSETS_MINUTES:
+                fire_at = starts_at - timedelta(minutes=offset_minutes)
+                if fire_at <= now:
+                    overdue = (offset_minutes, fire_at)
+                else:
+                    self.reminder_wheel.add((outage_id, offset_minutes), fire_at, fire_at)
+            if overdue is not None:
+                offset_minutes, fire_at = overdue
+                self.reminder_wheel.add((outage_id, offset_minutes), fire_at, fire_at)
+    
+    def _rebuild_reminders(self):
+        """Построение колеса напоминаний по индексированному времени начала отключений"""
+        self.reminder_wheel.clear()
+        outages = db_manager.get_upcoming_outages(datetime.now())
+        self._schedule_reminders(outages)
+        self._reminders_built = True
+        logger.info(f"Колесо напоминаний построено: {len(self.reminder_wheel)} напоминаний для {len(outages)} отключений")
+    
+    @staticmethod
+    def _format_time_left(starts_at, now):
+        """Время до начала отключения словами (с точностью до минуты)"""
+        minutes = max(1, int((starts_at - now).total_seconds() + 59) // 60)
+        hours, minutes = divmod(minutes, 60)
+        if hours and minutes:
+            return f"{hours} ч {minutes} мин"
+        return f"{hours} ч" if hours else f"{minutes} мин"
+    
+    def _prepare_reminders(self):
+        """
+        Напоминания, срок которых наступил, в виде сообщений очереди отправки.
+        
+        Получатели определяются в момент срабатывания: группа получает
+        напоминание, если ей уже доставлено уведомление об отключении до
+        срока напоминания и напоминания с этим смещением ещё нет в журнале.
+        """
+        if not self._reminders_built:
+            self._rebuild_reminders()
+        now = datetime.now()
+        due = self.reminder_wheel.advance(now)
+        if not due:
+            return []
+        # Время доставки хранится в UTC, а сроки напоминаний - в местном времени
+        utc_offset = now - datetime.utcnow()
+        
+        outage_ids_by_offset = {}
+        fire_times = {}
+        for (outage_id, offset_minutes), fire_at in due:
+            outage_ids_by_offset.setdefault(offset_minutes, []).append(outage_id)
+            fire_times[(outage_id, offset_minutes)] = fire_at
+        
+        self._fragment_cache.clear()
+        fragments_by_group = {}
+        priorities = {}
+        for offset_minutes, outage_ids in outage_ids_by_offset.items():
+            for match, outage, group, delivered_at in db_manager.get_reminder_targets(outage_ids, offset_minutes):
+                if outage.starts_at is None or outage.starts_at <= now:
+                    continue
+                # Уведомление, доставленное позже срока напоминания, само сообщило о скором начале
+                if delivered_at is not None and delivered_at + utc_offset > fire_times[(outage.id, offset_minutes)]:
+                    continue
+                matched_address = self._get_outage_address(outage, match.address_index)
+                matched_addresses = {outage.id: matched_address} if matched_address is not None else None
+                header = f"<b>⏰ Напоминание: через {self._format_time_left(outage.starts_at, now)} начнётся отключение</b>\n\n"
+                fragment = header + self._get_outage_fragment(outage, group, matched_addresses)
+                key = (outage.id, group.id, offset_minutes)
+                priorities[key] = delivery_priority(outage.reason, outage.starts_at, match.score, now)
+                fragments_by_group.setdefault((group.group_id, group.id), []).append((fragment, key))
+        
+        messages = []
+        for (chat_id, _), fragments in fragments_by_group.items():
+            fragments.sort(key=lambda item: priorities[item[1]])
+            chunks = chunk_fragments(fragments)
+            for chunk, priority in zip(chunks, self._chunk_priorities(chunks, priorities.get)):
+                messages.append({
+                    'chat_id': chat_id,
+                    'priority': priority,
+                    'body': chunk.text,
+                    'outage_ids': list(dict.fromkeys(outage_id for outage_id, _, _ in chunk.keys)),
+                    'reminders': chunk.keys
+                })
+        logger.info(f"Сработало {len(due)} напоминаний, подготовлено {len(messages)} сообщений")
+        return messages
+    
+    async def fire_reminders(self):
+        """Постановка наступивших напоминаний в очередь отправки и отправка очереди"""
+        if not REMINDER_OFFSETS_MINUTES:
+            return 0
+        if self.leader is not None and self.fencing_token is None:
+            self.reset_reminders()
+            return 0
+        try:
+            messages = await self._run_sync(self._prepare_reminders)
+            if not messages:
+                return 0
+            await self._run_sync(db_manager.enqueue_reminders, messages, self.fencing_token)
+        except Exception as e:
+            # Сработавшие сроки уже сняты с колеса: оно строится заново, а журнал напоминаний не даст повторов
+            self.reset_reminders()
+            logger.error(f"Ошибка при постановке напоминаний в очередь: {e}")
+            return 0
+        return await self._drain_shielded()
+    
+    def _prepare_digests(self):
+        """
+        Сводки групп, для которых наступило время сводки: (сообщения очереди, ID групп).
+        
+        Сводка собирается из всех неотправленных совпадений группы на
+        момент её отправки и режется на части как обычное уведомление.
+        Группа без неотправленных совпадений тоже попадает в список, чтобы
+        время её сводки сдвинулось на следующий период.
+        """
+        now = datetime.now()
+        # Время сводки хранится в UTC, а периоды сводок - в местном времени
+        utc_offset = now - datetime.utcnow()
+        due_groups = [
+            group for group in db_manager.get_digest_groups()
+            if is_digest_due(
+                group.delivery_mode, group.digest_sent_at + utc_offset if group.digest_sent_at else None, now
+            )
+        ]
+        if not due_groups:
+            return [], []
+        pending_matches = db_manager.get_pending_matches([group.id for group in due_groups])
+        headers = {group.id: DIGEST_HEADERS[group.delivery_mode] for group in due_groups}
+        messages = self._build_match_messages(due_groups, pending_matches, now, headers) if pending_matches else []
+        outbox_messages = self._build_outbox_messages(messages)
+        logger.info(f"Время сводки {len(due_groups)} групп: {len(pending_matches)} совпадений, {len(outbox_messages)} сообщений")
+        return outbox_messages, [group.id for group in due_groups]
+    
+    async def send_digests(self):
+        """Постановка сводок плановых отключений в очередь отправки и отправка очереди"""
+        if self.leader is not None and self.fencing_token is None:
+            return 0
+        try:
+            outbox_messages, group_ids = await self._run_sync(self._prepare_digests)
+            if outbox_messages:
+                await self._run_sync(db_manager.enqueue_outbox_messages, outbox_messages, self.fencing_token)
+            if group_ids:
+                # Совпадения сводки уже в журнале доставок: сбой записи времени даст лишь пустую сводку
+                await self._run_sync(db_manager.mark_digests_sent, group_ids)
+        except Exception as e:
+            logger.error(f"Ошибка при постановке сводок в очередь: {e}")
+            return 0
+        if not outbox_messages:
+            return 0
+        return await self._drain_shielded()
+    
+    async def drain_outbox(self):
+        """Отправка готовых сообщений из очереди"""
+        if self._drain_lock is None:
+            self._drain_lock = asyncio.Lock()
+        async with self._drain_lock:
+            return await self.drainer.drain()
+
+    async def _drain_shielded(self):
+        """
+        Отправка очереди из задания, защищённая от его отмены.
+
+        Отмена задания по предельному времени или при остановке бота не
+        прерывает отправку: она доработает отдельно, а остановка
+        планировщика дождётся её завершения.
+        """
+        task = asyncio.ensure_future(self.drain_outbox())
+        self._drain_tasks.add(task)
+        task.add_done_callback(self._drain_tasks.discard)
+        return await asyncio.shield(task)
 
 # Глобальный экземпляр планировщика
 scheduler = Scheduler()
\ No newline at end of file
@@ -0,0 +1,158 @@
+# Модуль для нечёткого поиска улиц по триграммам
+import re
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+# Регулярные выражения, скомпилированные для производительности
+NON_WORD_PATTERN = re.compile(r'[^0-9a-zа-я]+')
+TRAILING_HOUSE_PATTERN = re.compile(r'(?:\s+(?:д\.?|дом)?\s*\d+(?:/\d+)?[а-я]?)+$')
+STREET_TYPE_WORDS = frozenset({
+    'улица', 'ул', 'проспект', 'пр', 'пр-т', 'просп', 'переулок', 'пер', 'площадь', 'пл',
+    'проезд', 'пр-д', 'бульвар', 'б-р', 'бул', 'набережная', 'наб', 'шоссе', 'ш', 'тупик', 'туп',
+})
+
+
+# Канонические типы улиц для сравнения сокращённых и полных написаний
+STREET_TYPE_CANONICAL = {
+    'улица': 'улица', 'ул': 'улица',
+    'проспект': 'проспект', 'пр': 'проспект', 'пр-т': 'проспект', 'просп': 'проспект',
+    'переулок': 'переулок', 'пер': 'переулок',
+    'площадь': 'площадь', 'пл': 'площадь',
+    'проезд': 'проезд', 'пр-д': 'проезд',
+    'бульвар': 'бульвар', 'б-р': 'бульвар', 'бул': 'бульвар',
+    'набережная': 'набережная', 'наб': 'набережная',
+    'шоссе': 'шоссе', 'ш': 'шоссе',
+    'тупик': 'тупик', 'туп': 'тупик',
+}
+STREET_TYPE_WORD_PATTERN = re.compile(r'(?<![0-9a-zа-я-])(пр-т|пр-д|б-р|[а-я]+)(?![0-9a-zа-я-])')
+
+# Окончания прилагательных по роду и числу: "Садовая" и "Садовый" - разные улицы,
+# как и "Пушкина" и "Пушкинская" (притяжательное название и прилагательное)
+ADJECTIVE_ENDINGS = {
+    'ая': 'f', 'яя': 'f',
+    'ый': 'm', 'ий': 'm', 'ой': 'm',
+    'ое': 'n', 'ее': 'n',
+    'ые': 'p', 'ие': 'p',
+}
+
+
+@lru_cache(maxsize=65536)
+def street_form(street: str) -> Tuple[Optional[str], str]:
+    """
+    Форма названия улицы: (тип улицы или None, род окончания).
+
+    Род окончания определяется по последнему слову ключа: окончание
+    прилагательного ('f', 'm', 'n', 'p') или 'noun' для остальных слов.
+    """
+    text = street.lower().replace('ё', 'е')
+    street_type = None
+    for word in STREET_TYPE_WORD_PATTERN.findall(text):
+        if word in STREET_TYPE_CANONICAL:
+            street_type = STREET_TYPE_CANONICAL[word]
+            break
+    words = street_fuzzy_key(street).split()
+    last_word = next((word for word in reversed(words) if not word.isdigit()), '')
+    return street_type, ADJECTIVE_ENDINGS.get(last_word[-2:], 'noun')
+
+
+def forms_compatible(first: str, second: str) -> bool:
+    """
+    Могут ли две похожие улицы быть одной улицей.
+
+    Улицы с разным типом (если он указан в обоих написаниях) или разным
+    родом окончания считаются разными, как бы ни были похожи триграммы.
+    """
+    first_type, first_ending = street_form(first)
+    second_type, second_ending = street_form(second)
+    if first_type and second_type and first_type != second_type:
+        return False
+    return first_ending == second_ending
+
+
+@lru_cache(maxsize=65536)
+def street_fuzzy_key(street: str) -> str:
+    """
+    Ключ улицы для нечёткого сравнения.
+
+    Убирает номер дома в конце, знаки препинания и слова-типы улиц в любой
+    позиции, поэтому "ул.Ленина", "Ленина ул" и "Ленина 5" дают один ключ.
+    """
+    text = street.lower().replace('ё', 'е').strip()
+    text = TRAILING_HOUSE_PATTERN.sub('', text)
+    text = text.replace('пр-т', ' пр ').replace('пр-д', ' пр ').replace('б-р', ' бул ')
+    words = [word for word in NON_WORD_PATTERN.split(text) if word and word not in STREET_TYPE_WORDS]
+    return ' '.join(words)
+
+
+@lru_cache(maxsize=65536)
+def trigrams(key: str) -> FrozenSet[str]:
+    """Множество триграмм ключа (каждое слово дополняется пробелами, как в pg_trgm)"""
+    result = set()
+    for word in key.split():
+        padded = f'  {word} '
+        for i in range(len(padded) - 2):
+            result.add(padded[i:i + 3])
+    return frozenset(result)
+
+
+def similarity(first: str, second: str) -> float:
+    """Коэффициент Жаккара по триграммам двух ключей"""
+    first_trigrams = trigrams(first)
+    second_trigrams = trigrams(second)
+    if not first_trigrams or not second_trigrams:
+        return 0.0
+    common = len(first_trigrams & second_trigrams)
+    return common / (len(first_trigrams) + len(second_trigrams) - common)
+
+
+class TrigramIndex:
+    """
+    Триграммный индекс по ключам улиц.
+
+    Строится один раз: каждая триграмма указывает на ключи, в которых она
+    встречается. Поиск считает общие триграммы только у ключей из списков
+    триграмм запроса, поэтому стоимость зависит от числа похожих улиц,
+    а не от общего числа подписок.
+    """
+
+    def __init__(self, keys: Iterable[str], threshold: float):
+        self.threshold = threshold
+        self._keys: List[str] = []
+        self._sizes: List[int] = []
+        self._postings: Dict[str, List[int]] = {}
+        for key in dict.fromkeys(keys):
+            key_trigrams = trigrams(key)
+            if not key_trigrams:
+                continue
+            key_id = len(self._keys)
+            self._keys.append(key)
+            self._sizes.append(len(key_trigrams))
+            for trigram in key_trigrams:
+                self._postings.setdefault(trigram, []).append(key_id)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def search(self, key: str) -> List[Tuple[str, float]]:
+        """Ключи с похожестью не ниже порога, по убыванию похожести"""
+        query_trigrams = trigrams(key)
+        if not query_trigrams:
+            return []
+
+        query_size = len(query_trigrams)
+        # Ключ не может достичь порога, если триграмм меньше минимально необходимого
+        min_common = self.threshold * query_size
+        counts: Dict[int, int] = {}
+        for trigram in query_trigrams:
+            for key_id in self._postings.get(trigram, ()):
+                counts[key_id] = counts.get(key_id, 0) + 1
+
+        result = []
+        for key_id, common in counts.items():
+            if common < min_common:
+                continue
+            score = common / (query_size + self._sizes[key_id] - common)
+            if score >= self.threshold:
+                result.append((self._keys[key_id], score))
+        result.sort(key=lambda item: (-item[1], item[0]))
+        return result
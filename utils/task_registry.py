@@ -0,0 +1,160 @@
+# Модуль реестра типов задач и пулов их выполнения
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+from data.config import TASK_THREAD_WORKERS, TASK_PROCESS_WORKERS, TASK_PROCESS_MEMORY_MB
+from utils.outages_parser import fetch_and_parse_outages
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Классы выполнения обработчиков
+EXECUTION_ASYNC = 'async'      # Корутина в цикле событий (ввод-вывод без блокировок)
+EXECUTION_THREAD = 'thread'    # Пул потоков (блокирующий ввод-вывод)
+EXECUTION_PROCESS = 'process'  # Пул процессов (вычисления, например разбор HTML)
+EXECUTIONS = (EXECUTION_ASYNC, EXECUTION_THREAD, EXECUTION_PROCESS)
+
+# Результаты обработчиков, которые планировщик сохраняет как отключения:
+# пара (записи отключений, статистика этапов получения и разбора)
+RESULT_OUTAGES = 'outages'
+
+
+def _limit_process_memory(memory_mb: int):
+    """Ограничение памяти процесса пула (только Unix; 0 - без ограничения)"""
+    if not memory_mb:
+        return
+    try:
+        import resource
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ImportError, ValueError, OSError) as e:
+        logger.warning(f"Не удалось ограничить память процесса пула: {e}")
+
+
+class TaskTypeHandler:
+    """
+    Обработчик типа задачи.
+
+    func вызывается без аргументов в пуле, заданном классом выполнения,
+    не дольше timeout секунд и не больше concurrency вызовов одновременно.
+    result - вид результата, который планировщик обрабатывает после вызова.
+    Функция обработчика процессов должна быть функцией уровня модуля,
+    чтобы её можно было передать в другой процесс.
+    """
+
+    def __init__(self, name: str, func: Callable, execution: str, display_name: str,
+                 description: str = '', timeout: Optional[float] = None, concurrency: int = 1,
+                 result: Optional[str] = None):
+        if execution not in EXECUTIONS:
+            raise ValueError(f"Неизвестный класс выполнения обработчика {name}: {execution}")
+        self.name = name
+        self.func = func
+        self.execution = execution
+        self.display_name = display_name
+        self.description = description
+        self.timeout = timeout
+        self.concurrency = max(1, concurrency)
+        self.result = result
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def semaphore(self) -> asyncio.Semaphore:
+        # Семафор создаётся в цикле событий, в котором выполняются задачи
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+
+class TaskTypeRegistry:
+    """
+    Реестр типов задач: имя TaskTypeDefinition -> обработчик.
+
+    Обработчик выполняется в цикле событий, в пуле потоков или в пуле
+    процессов, поэтому разбор страниц занимает другие ядра, а цикл событий
+    продолжает обрабатывать обновления Telegram. Пулы создаются при первом
+    обращении.
+    """
+
+    def __init__(self, thread_workers: int = TASK_THREAD_WORKERS, process_workers: int = TASK_PROCESS_WORKERS,
+                 process_memory_mb: int = TASK_PROCESS_MEMORY_MB):
+        self._handlers: Dict[str, TaskTypeHandler] = {}
+        self.thread_workers = thread_workers
+        self.process_workers = process_workers
+        self.process_memory_mb = process_memory_mb
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+
+    def register(self, name: str, func: Callable, execution: str, display_name: str, **options) -> TaskTypeHandler:
+        """Регистрация (или замена) обработчика типа задачи"""
+        handler = TaskTypeHandler(name, func, execution, display_name, **options)
+        self._handlers[name] = handler
+        return handler
+
+    def get(self, name: str) -> Optional[TaskTypeHandler]:
+        return self._handlers.get(name)
+
+    def definitions(self) -> List[dict]:
+        """Определения зарегистрированных типов для таблицы task_type_definitions"""
+        return [
+            {'name': handler.name, 'display_name': handler.display_name, 'description': handler.description}
+            for handler in self._handlers.values()
+        ]
+
+    def _get_thread_pool(self) -> ThreadPoolExecutor:
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(max_workers=self.thread_workers, thread_name_prefix='task-type')
+        return self._thread_pool
+
+    def _get_process_pool(self) -> ProcessPoolExecutor:
+        if self._process_pool is None:
+            # spawn: дочерние процессы не наследуют соединения с базой и потоки основного процесса
+            self._process_pool = ProcessPoolExecutor(
+                max_workers=self.process_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_limit_process_memory,
+                initargs=(self.process_memory_mb,)
+            )
+        return self._process_pool
+
+    async def run(self, name: str):
+        """Выполнение обработчика типа задачи в его пуле с его ограничениями"""
+        handler = self._handlers.get(name)
+        if handler is None:
+            raise KeyError(f"Для типа задачи {name} не зарегистрирован обработчик")
+        async with handler.semaphore():
+            if handler.execution == EXECUTION_ASYNC:
+                call = handler.func()
+            else:
+                pool = self._get_thread_pool() if handler.execution == EXECUTION_THREAD else self._get_process_pool()
+                call = asyncio.get_running_loop().run_in_executor(pool, handler.func)
+            try:
+                if handler.timeout:
+                    return await asyncio.wait_for(call, timeout=handler.timeout)
+                return await call
+            except asyncio.TimeoutError:
+                # Вызов в пуле не прерывается, но его результат больше не ждут
+                raise TimeoutError(f"Обработчик типа задачи {name} выполнялся дольше {handler.timeout} с")
+
+    def shutdown(self):
+        """Остановка пулов без ожидания выполняющихся вызовов"""
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown(wait=False)
+            self._thread_pool = None
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False)
+            self._process_pool = None
+
+
+# Глобальный реестр типов задач
+task_registry = TaskTypeRegistry()
+
+task_registry.register(
+    'outages_check',
+    fetch_and_parse_outages,
+    EXECUTION_PROCESS,
+    'Проверка отключений',
+    description='Проверка текущих отключений коммунальных услуг',
+    timeout=120,
+    result=RESULT_OUTAGES
+)
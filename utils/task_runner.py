@@ -0,0 +1,128 @@
+# Модуль для запуска заданий с защитой от наложения запусков
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional
+from data.config import TASK_OVERLAP_POLICY, TASK_RUN_TIMEOUT_SECONDS
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Политики запуска задания, предыдущий запуск которого ещё выполняется
+OVERLAP_SKIP = 'skip'          # Запуск пропускается
+OVERLAP_COALESCE = 'coalesce'  # Все такие запуски объединяются в один запуск после текущего (с последними параметрами)
+OVERLAP_QUEUE = 'queue'        # В очередь ставится один запуск, остальные пропускаются
+OVERLAP_POLICIES = (OVERLAP_SKIP, OVERLAP_COALESCE, OVERLAP_QUEUE)
+
+# События, передаваемые в обработчик учёта запусков
+RUN_SKIPPED = 'skipped'
+RUN_COALESCED = 'coalesced'
+RUN_TIMED_OUT = 'timed_out'
+
+
+class _RunState:
+    """Состояние запусков одного задания"""
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.pending = None  # Отложенный запуск: (функция, предельное время, обработчик событий)
+
+
+class TaskRunner:
+    """
+    Запуск заданий в цикле событий с блокировкой на задание.
+
+    Одновременно выполняется не больше одного запуска каждого задания.
+    Запуск во время выполнения предыдущего обрабатывается по политике
+    задания: skip пропускает его, coalesce объединяет все такие запуски
+    в один отложенный запуск с параметрами последнего (учитываются как
+    объединённые), queue откладывает первый такой запуск, а следующие
+    пропускает (учитываются как пропущенные). Запуск дольше предельного
+    времени отменяется. Пропущенные, объединённые и прерванные запуски
+    передаются в обработчик событий, чтобы нехватка времени на выполнение
+    была видна.
+
+    Отмена прерывает только корутину задания: синхронный этап, уже
+    выполняющийся в потоке (например, в потоке планировщика), не
+    прерывается и доработает до конца, а следующие этапы, поставленные
+    в тот же поток, будут ждать его завершения.
+    """
+
+    def __init__(self):
+        self._states: Dict[str, _RunState] = {}
+
+    def is_running(self, name: str) -> bool:
+        state = self._states.get(name)
+        return state is not None and state.task is not None and not state.task.done()
+
+    def start(self, name: str, coro_func: Callable[[], Awaitable], policy: Optional[str] = None,
+              timeout: Optional[float] = None, on_event: Optional[Callable[[str], None]] = None):
+        """Запуск задания по имени с учётом выполняющегося запуска"""
+        policy = policy or TASK_OVERLAP_POLICY
+        if policy not in OVERLAP_POLICIES:
+            logger.warning(f"Неизвестная политика наложения запусков {policy!r} для задания {name}, используется skip")
+            policy = OVERLAP_SKIP
+        if timeout is None:
+            timeout = TASK_RUN_TIMEOUT_SECONDS
+
+        state = self._states.setdefault(name, _RunState())
+        if state.task is None or state.task.done():
+            state.task = asyncio.ensure_future(self._run(name, state, coro_func, timeout, on_event))
+            return
+
+        if policy == OVERLAP_SKIP or (policy == OVERLAP_QUEUE and state.pending is not None):
+            logger.warning(f"Задание {name} ещё выполняется, запуск пропущен")
+            self._emit(name, on_event, RUN_SKIPPED)
+            return
+        if state.pending is not None:
+            logger.warning(f"Задание {name} ещё выполняется, запуск объединён с отложенным запуском")
+            self._emit(name, on_event, RUN_COALESCED)
+        else:
+            logger.info(f"Задание {name} ещё выполняется, запуск отложен до его завершения")
+        state.pending = (coro_func, timeout, on_event)
+
+    async def _run(self, name: str, state: _RunState, coro_func, timeout, on_event):
+        """Выполнение задания и отложенных запусков по очереди"""
+        while True:
+            try:
+                if timeout and timeout > 0:
+                    await asyncio.wait_for(coro_func(), timeout=timeout)
+                else:
+                    await coro_func()
+            except asyncio.TimeoutError:
+                logger.error(f"Задание {name} прервано: выполнялось дольше {timeout} с")
+                self._emit(name, on_event, RUN_TIMED_OUT)
+            except asyncio.CancelledError:
+                state.pending = None
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка при выполнении задания {name}: {e}", exc_info=True)
+
+            if state.pending is None:
+                return
+            coro_func, timeout, on_event = state.pending
+            state.pending = None
+            logger.info(f"Выполнение отложенного запуска задания {name}")
+
+    @staticmethod
+    def _emit(name: str, on_event, event: str):
+        if on_event is None:
+            return
+        try:
+            on_event(event)
+        except Exception as e:
+            logger.error(f"Ошибка при учёте события {event} задания {name}: {e}")
+
+    async def shutdown(self, timeout: float):
+        """Ожидание выполняющихся заданий; не завершившиеся за timeout секунд отменяются"""
+        tasks: List[asyncio.Task] = []
+        for state in self._states.values():
+            state.pending = None
+            if state.task is not None and not state.task.done():
+                tasks.append(state.task)
+        if not tasks:
+            return
+        logger.info(f"Ожидание завершения {len(tasks)} выполняющихся заданий")
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
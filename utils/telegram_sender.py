@@ -0,0 +1,390 @@
+# Модуль для параллельной отправки сообщений в Telegram с учётом лимитов
+import asyncio
+import itertools
+import time
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Union
+from aiogram.utils.exceptions import (
+    RetryAfter, NetworkError, MessageNotModified,
+    MessageToEditNotFound, MessageCantBeEdited, MessageIdInvalid
+)
+from data.config import (
+    TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE_PER_MINUTE,
+    TELEGRAM_SEND_CONCURRENCY, TELEGRAM_SEND_RETRIES
+)
+from utils.delivery_priority import DEFAULT_PRIORITY, PRIORITY_CLASSES, priority_class
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Сколько сообщений подряд можно отправить в один чат без ожидания
+CHAT_BURST = 3
+
+# Сколько раз задание группы возвращается в очередь после RetryAfter
+MAX_RETRY_AFTER_REQUEUES = 5
+
+# Начальная пауза перед повтором при сетевой ошибке (удваивается с каждой попыткой)
+NETWORK_RETRY_DELAY = 1.0
+
+
+class SendAborted(Exception):
+    """Отправка прервана: процесс больше не вправе отправлять сообщения (например, потерял лидерство)"""
+
+
+class TokenBucket:
+    """
+    Ведро токенов для ограничения частоты отправки.
+
+    Токены резервируются заранее (баланс может уйти в минус), поэтому
+    ожидающие отправки получают токены в порядке обращения без блокировок.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        """Пополнение токенов за прошедшее время"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """Резервирование токена; возвращает, сколько секунд ждать до его появления"""
+        self._refill()
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def pause(self, seconds: float):
+        """Запрет отправки на заданное время (например, по RetryAfter от Telegram)"""
+        self._refill()
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+    async def acquire(self):
+        """Ожидание токена"""
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class MessageEdit:
+    """
+    Правка ранее отправленного сообщения.
+
+    Если сообщение уже нельзя изменить (истёк срок правки или сообщение
+    удалено), вместо правки отправляется новое сообщение fallback_text.
+    """
+
+    def __init__(self, message_id: int, text: str, fallback_text: str):
+        self.message_id = message_id
+        self.text = text
+        self.fallback_text = fallback_text
+
+
+class SendResult:
+    """Результат отправки сообщений одной группе"""
+
+    def __init__(self, chat_id, total: int):
+        self.chat_id = chat_id
+        self.total = total
+        self.delivered = 0  # Сколько сообщений доставлено по порядку
+        self.message_ids: List[Optional[int]] = []  # ID доставленных (или изменённых) сообщений в Telegram
+        self.error: Optional[Exception] = None
+        # Отправка остановлена до попытки отправить следующее сообщение
+        # (не записано подтверждение или процесс больше не вправе отправлять)
+        self.stopped = False
+
+    @property
+    def ok(self) -> bool:
+        return self.delivered == self.total
+
+
+class SenderStats:
+    """Метрики одного прогона отправки"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.finished = None
+        self.sent = 0
+        self.failed = 0
+        self.retry_after = 0
+        self.network_retries = 0
+        self.edited = 0
+        self.edit_fallbacks = 0
+        self.max_queue_depth = 0
+        self.latencies: List[float] = []
+        # Время от начала прогона до доставки сообщения по классам приоритета
+        self.delivery_delays: Dict[str, List[float]] = {}
+
+    @staticmethod
+    def _percentile(values: List[float], percent: float) -> float:
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+    def percentile(self, percent: float) -> float:
+        """Перцентиль времени отправки одного сообщения (в секундах)"""
+        return self._percentile(self.latencies, percent)
+
+    def delivery_percentile(self, class_name: str, percent: float) -> float:
+        """Перцентиль времени до доставки сообщений класса приоритета (в секундах)"""
+        return self._percentile(self.delivery_delays.get(class_name, []), percent)
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def throughput(self) -> float:
+        """Сообщений в секунду"""
+        return self.sent / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"отправлено {self.sent} сообщений за {self.elapsed:.1f} с ({self.throughput:.1f} сообщ/с), "
+            f"ошибок {self.failed}, RetryAfter {self.retry_after}, повторов {self.network_retries}, "
+            f"изменено {self.edited} (новым сообщением {self.edit_fallbacks}), "
+            f"макс. очередь {self.max_queue_depth}, задержка p50 {self.percentile(50) * 1000:.0f} мс, "
+            f"p95 {self.percentile(95) * 1000:.0f} мс{self.delivery_summary()}"
+        )
+
+    def delivery_summary(self) -> str:
+        """Время до доставки по классам приоритета"""
+        parts = [
+            f"{class_name} {len(self.delivery_delays[class_name])} сообщ. p50 {self.delivery_percentile(class_name, 50):.1f} с, "
+            f"p95 {self.delivery_percentile(class_name, 95):.1f} с"
+            for class_name in PRIORITY_CLASSES if self.delivery_delays.get(class_name)
+        ]
+        return f", доставка: {'; '.join(parts)}" if parts else ""
+
+
+class _SendJob:
+    """Задание на отправку сообщений одной группе по порядку"""
+
+    def __init__(self, chat_id, texts: List[Union[str, MessageEdit]], parse_mode: str,
+                 priorities: Optional[List[int]] = None):
+        self.chat_id = chat_id
+        self.texts = texts
+        self.parse_mode = parse_mode
+        self.priorities = priorities or [DEFAULT_PRIORITY] * len(texts)
+        self.result = SendResult(chat_id, len(texts))
+        self.requeues = 0
+
+    @property
+    def priority(self) -> int:
+        """Приоритет следующего неотправленного сообщения"""
+        return self.priorities[min(self.result.delivered, len(self.priorities) - 1)]
+
+
+class TelegramSender:
+    """
+    Параллельная отправка сообщений в Telegram.
+
+    Группы обрабатываются несколькими обработчиками одновременно, а
+    сообщения одной группы - строго по порядку. Задания групп выбираются
+    из очереди с приоритетом по следующему сообщению группы: аварийные
+    уведомления всех групп уходят раньше плановых, а группа, у которой
+    срочные сообщения закончились, возвращается в очередь с приоритетом
+    оставшихся. Частота ограничена общим
+    ведром токенов и ведром для каждого чата. При RetryAfter задание группы
+    возвращается в очередь после указанной паузы, сетевые ошибки
+    повторяются с нарастающей паузой.
+    """
+
+    def __init__(self, bot, concurrency: int = TELEGRAM_SEND_CONCURRENCY,
+                 global_rate: float = TELEGRAM_GLOBAL_RATE,
+                 chat_rate_per_minute: float = TELEGRAM_CHAT_RATE_PER_MINUTE,
+                 retries: int = TELEGRAM_SEND_RETRIES):
+        self.bot = bot
+        self.concurrency = max(1, concurrency)
+        self.retries = retries
+        self.chat_rate = chat_rate_per_minute / 60
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        # Ведра чатов живут между прогонами, чтобы лимит группы соблюдался и между задачами
+        self.chat_buckets: Dict[object, TokenBucket] = {}
+        self.last_stats: Optional[SenderStats] = None
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_rate, CHAT_BURST)
+            self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    async def send_all(self, messages: Dict[object, List[Union[str, MessageEdit]]], parse_mode: str = "HTML",
+                       priorities: Optional[Dict[object, List[int]]] = None,
+                       on_delivered: Optional[Callable[[object, int, Optional[int]], Awaitable[None]]] = None,
+                       should_continue: Optional[Callable[[], bool]] = None) -> Dict[object, SendResult]:
+        """
+        Отправка сообщений группам: {ID чата: [текст или MessageEdit, ...]} -> {ID чата: SendResult}.
+
+        priorities - приоритеты сообщений тех же групп (меньше - раньше);
+        сообщения группы должны идти с неубывающим приоритетом.
+        on_delivered(ID чата, номер сообщения, ID сообщения Telegram) -
+        сохранение подтверждения; вызывается после каждого ответа Telegram
+        до отправки следующего сообщения группы. Если оно не удалось,
+        остальные сообщения группы не отправляются.
+        should_continue() проверяется перед каждой отправкой и правкой;
+        когда оно возвращает False, оставшиеся сообщения всех групп не
+        отправляются (результат с ошибкой SendAborted).
+        """
+        stats = SenderStats()
+        self.last_stats = stats
+        priorities = priorities or {}
+        jobs = [_SendJob(chat_id, texts, parse_mode, priorities.get(chat_id)) for chat_id, texts in messages.items() if texts]
+        results = {job.chat_id: job.result for job in jobs}
+        if not jobs:
+            return results
+
+        # Задания с одинаковым приоритетом выбираются в порядке постановки
+        queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        order = itertools.count()
+        for job in jobs:
+            queue.put_nowait((job.priority, next(order), job))
+        stats.max_queue_depth = queue.qsize()
+        remaining = len(jobs)
+        finished = asyncio.Event()
+
+        def complete():
+            nonlocal remaining
+            remaining -= 1
+            if remaining == 0:
+                finished.set()
+
+        def requeue(job):
+            queue.put_nowait((job.priority, next(order), job))
+            stats.max_queue_depth = max(stats.max_queue_depth, queue.qsize())
+
+        async def worker():
+            loop = asyncio.get_running_loop()
+            while True:
+                _, _, job = await queue.get()
+                retry_after = await self._send_job(job, stats, on_delivered, should_continue)
+                if retry_after is None:
+                    complete()
+                elif retry_after > 0:
+                    # Группа продолжит получать сообщения после паузы, остальные группы не ждут
+                    loop.call_later(retry_after, requeue, job)
+                else:
+                    # Следующее сообщение группы менее срочное: сначала срочные сообщения других групп
+                    requeue(job)
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(min(self.concurrency, len(jobs)))]
+        try:
+            await finished.wait()
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            stats.finished = time.monotonic()
+
+        logger.info(f"Отправка в Telegram завершена: {stats.summary()}")
+        return results
+
+    async def _send_job(self, job: _SendJob, stats: SenderStats, on_delivered=None,
+                        should_continue=None) -> Optional[float]:
+        """
+        Отправка оставшихся сообщений группы.
+
+        Возвращает паузу, если задание нужно вернуть в очередь (0 - сразу,
+        когда следующее сообщение группы менее срочное), или None, если
+        задание завершено.
+        """
+        chat_bucket = self._chat_bucket(job.chat_id)
+        attempts = 0
+        while job.result.delivered < len(job.texts):
+            await chat_bucket.acquire()
+            await self.global_bucket.acquire()
+            # Проверка после ожидания лимитов: за это время процесс мог потерять право отправки
+            if should_continue is not None and not should_continue():
+                job.result.error = SendAborted("отправка прервана до доставки всех сообщений")
+                job.result.stopped = True
+                logger.warning(f"Отправка в группу {job.chat_id} прервана: процесс больше не вправе отправлять")
+                return None
+            started = time.monotonic()
+            try:
+                sent_message = await self._deliver(job, job.texts[job.result.delivered], stats)
+            except RetryAfter as e:
+                stats.retry_after += 1
+                chat_bucket.pause(e.timeout)
+                job.requeues += 1
+                if job.requeues <= MAX_RETRY_AFTER_REQUEUES:
+                    logger.warning(f"Telegram просит подождать {e.timeout} с перед отправкой в группу {job.chat_id}")
+                    return e.timeout
+                job.result.error = e
+            except (NetworkError, asyncio.TimeoutError) as e:
+                attempts += 1
+                if attempts <= self.retries:
+                    stats.network_retries += 1
+                    delay = NETWORK_RETRY_DELAY * 2 ** (attempts - 1)
+                    logger.warning(f"Сетевая ошибка при отправке в группу {job.chat_id}, повтор через {delay} с: {e}")
+                    await asyncio.sleep(delay)
+                    continue
+                job.result.error = e
+            except Exception as e:
+                job.result.error = e
+            else:
+                delivered_at = time.monotonic()
+                stats.latencies.append(delivered_at - started)
+                sent_priority = job.priority
+                stats.delivery_delays.setdefault(priority_class(sent_priority), []).append(delivered_at - stats.started)
+                stats.sent += 1
+                index = job.result.delivered
+                telegram_message_id = getattr(sent_message, 'message_id', None)
+                job.result.delivered += 1
+                job.result.message_ids.append(telegram_message_id)
+                attempts = 0
+                if on_delivered is not None:
+                    try:
+                        await on_delivered(job.chat_id, index, telegram_message_id)
+                    except Exception as e:
+                        # Без записанного подтверждения следующее сообщение не отправляется
+                        job.result.error = e
+                        job.result.stopped = True
+                        logger.error(f"Отправка в группу {job.chat_id} остановлена: не записано подтверждение: {e}")
+                        return None
+                if job.result.delivered < len(job.texts) and job.priority > sent_priority:
+                    return 0.0
+                continue
+
+            # Ошибка без повтора: остальные сообщения группы не отправляются, чтобы не нарушить порядок
+            stats.failed += 1
+            logger.error(f"Ошибка при отправке сообщения в группу {job.chat_id}: {job.result.error}")
+            return None
+        return None
+
+    async def _deliver(self, job: _SendJob, item: Union[str, MessageEdit], stats: SenderStats):
+        """
+        Отправка одного сообщения или правка отправленного.
+
+        Правка, не изменившая текст, считается выполненной. Если сообщение
+        уже нельзя изменить, в чат отправляется новое сообщение; правка и
+        отправка расходуют один токен лимита.
+        """
+        if not isinstance(item, MessageEdit):
+            return await self.bot.send_message(chat_id=job.chat_id, text=item, parse_mode=job.parse_mode)
+        try:
+            await self.bot.edit_message_text(
+                text=item.text,
+                chat_id=job.chat_id,
+                message_id=item.message_id,
+                parse_mode=job.parse_mode
+            )
+        except MessageNotModified:
+            pass
+        except (MessageToEditNotFound, MessageCantBeEdited, MessageIdInvalid) as e:
+            logger.info(f"Сообщение {item.message_id} в группе {job.chat_id} нельзя изменить ({e}), отправляется новое")
+            stats.edit_fallbacks += 1
+            return await self.bot.send_message(chat_id=job.chat_id, text=item.fallback_text, parse_mode=job.parse_mode)
+        stats.edited += 1
+        return _EditedMessage(item.message_id)
+
+
+class _EditedMessage:
+    """Изменённое сообщение (ID сообщения для подтверждения отправки)"""
+
+    def __init__(self, message_id: int):
+        self.message_id = message_id
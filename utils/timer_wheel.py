@@ -0,0 +1,128 @@
+# Модуль иерархического колеса таймеров
+from datetime import datetime
+from typing import Dict, Hashable, List, Optional, Tuple
+
+# Число слотов на уровне (степень двойки) и число уровней: 64^4 тиков покрывают
+# больше 30 лет при тике в минуту
+WHEEL_BITS = 6
+WHEEL_SIZE = 1 << WHEEL_BITS
+WHEEL_MASK = WHEEL_SIZE - 1
+WHEEL_LEVELS = 4
+
+
+class _Timer:
+    """Таймер колеса"""
+
+    __slots__ = ('key', 'tick', 'payload', 'cancelled')
+
+    def __init__(self, key: Hashable, tick: int, payload):
+        self.key = key
+        self.tick = tick
+        self.payload = payload
+        self.cancelled = False
+
+
+class TimerWheel:
+    """
+    Иерархическое колесо таймеров с шагом tick_seconds.
+
+    Таймер кладётся в слот уровня, соответствующего расстоянию до его
+    тика: на нулевом уровне слот - один тик, на каждом следующем - в
+    WHEEL_SIZE раз больше. Когда нулевой уровень проходит полный круг,
+    слот следующего уровня раскладывается по нижним уровням. Добавление и
+    отмена стоят O(1), а продвижение - O(число тиков + число
+    сработавших таймеров) независимо от числа ожидающих таймеров.
+    Таймер с тем же ключом заменяет прежний.
+    """
+
+    def __init__(self, tick_seconds: int = 60, now: Optional[datetime] = None):
+        self.tick_seconds = tick_seconds
+        self._levels: List[List[List[_Timer]]] = [[[] for _ in range(WHEEL_SIZE)] for _ in range(WHEEL_LEVELS)]
+        self._timers: Dict[Hashable, _Timer] = {}
+        self._overflow: List[_Timer] = []
+        self._ready: List[_Timer] = []
+        self._tick = self._to_tick(now or datetime.now())
+
+    def _to_tick(self, moment: datetime) -> int:
+        return int(moment.timestamp()) // self.tick_seconds
+
+    def __len__(self) -> int:
+        return len(self._timers)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._timers
+
+    def add(self, key: Hashable, fire_at: datetime, payload=None):
+        """Добавление (или замена) таймера; таймер в прошлом срабатывает при ближайшем продвижении"""
+        self.cancel(key)
+        timer = _Timer(key, self._to_tick(fire_at), payload)
+        self._timers[key] = timer
+        self._place(timer)
+
+    def cancel(self, key: Hashable) -> bool:
+        """Отмена таймера (запись в слоте отбрасывается при его обработке)"""
+        timer = self._timers.pop(key, None)
+        if timer is None:
+            return False
+        timer.cancelled = True
+        return True
+
+    def clear(self):
+        for level in self._levels:
+            for slot in level:
+                slot.clear()
+        self._timers.clear()
+        self._overflow.clear()
+        self._ready.clear()
+
+    def _place(self, timer: _Timer):
+        delta = timer.tick - self._tick
+        if delta <= 0:
+            self._ready.append(timer)
+            return
+        for level in range(WHEEL_LEVELS):
+            if delta < 1 << (WHEEL_BITS * (level + 1)):
+                self._levels[level][(timer.tick >> (WHEEL_BITS * level)) & WHEEL_MASK].append(timer)
+                return
+        self._overflow.append(timer)
+
+    def _cascade(self, level: int):
+        """Раскладка слота уровня level по нижним уровням (при проходе нулевого слота уровня ниже)"""
+        index = (self._tick >> (WHEEL_BITS * level)) & WHEEL_MASK
+        if level + 1 < WHEEL_LEVELS and index == 0:
+            self._cascade(level + 1)
+        elif level + 1 == WHEEL_LEVELS and index == 0 and self._overflow:
+            overflow, self._overflow = self._overflow, []
+            for timer in overflow:
+                if not timer.cancelled:
+                    self._place(timer)
+        slot = self._levels[level][index]
+        if slot:
+            timers = slot[:]
+            slot.clear()
+            for timer in timers:
+                if not timer.cancelled:
+                    self._place(timer)
+
+    def advance(self, now: Optional[datetime] = None) -> List[Tuple[Hashable, object]]:
+        """Продвижение колеса до now; возвращает сработавшие таймеры (ключ, данные) по порядку"""
+        target = self._to_tick(now or datetime.now())
+        due = [timer for timer in self._ready if not timer.cancelled]
+        self._ready = []
+        while self._tick < target:
+            self._tick += 1
+            if self._tick & WHEEL_MASK == 0:
+                self._cascade(1)
+            slot = self._levels[0][self._tick & WHEEL_MASK]
+            if slot:
+                due.extend(timer for timer in slot if not timer.cancelled)
+                slot.clear()
+        # Таймеры, разложенные на текущий тик при каскаде, уже наступили
+        due.extend(timer for timer in self._ready if not timer.cancelled)
+        self._ready = []
+        fired = []
+        for timer in due:
+            if self._timers.get(timer.key) is timer:
+                del self._timers[timer.key]
+                fired.append((timer.key, timer.payload))
+        return fired